@@ -1,53 +1,102 @@
 """
 This module provides access to the implementations of the Firing Unit of the air defense system.
+
+A Firing Unit implementation should have a fire method, which returns True in
+case of a hit. To be used in a group of firing units (see the assignment
+module), it should also have a Pk property with the kill probability of a shot.
 """
 
 import numpy as np
 import unittest
+from airdefense import registry
 import logging
 logger=logging.getLogger(__name__)
 
 class PkFiringUnit:
     """
     This implementation is for coding assessment test only.
+    Each firing unit has its own random number generator, which can be seeded
+    for reproducible results.
     """
     short_name="PK"
-    def __init__(self,Pk:float=0.8):
+    def __init__(self,Pk:float=0.8,seed=None):
+        """
+        Initializes a PkFiringUnit object.
+
+        Parameters:
+            Pk(float): kill probability of a single shot.
+            seed: seed for the random number generator of this unit (int or numpy SeedSequence, None=unpredictable).
+        """
         self._pk = Pk
+        self._rng = np.random.default_rng(seed)
+    @property
+    def Pk(self):
+        ' ' 'Kill probability of a single shot.' ' '
+        return self._pk
     def fire(self):
         """
-        This method performs the firing operation by issuing a log message.
+        This method performs the firing operation by issuing a (debug) log message.
         The success is determined randomly, with an average success rate 
         of Pk (configured via the corresponding constructor parameter).
 
         Returns:
             True in case of a hit, False in case of a miss.
         """
-        logger.info("FIRE!")
-        p=np.random.uniform()
+        logger.debug("FIRE!")
+        p=self._rng.random()
         success = p<self._pk
         return success
+    def fire_batch(self,n:int):
+        """
+        This method performs n firing operations at once, e.g. for Monte Carlo
+        estimates. It is equivalent to n consecutive calls of fire, but with
+        only one log message.
+
+        Returns:
+            boolean numpy array with n values, True for a hit, False for a miss.
+        """
+        logger.debug(f"FIRE! x{n}")
+        return self._rng.random(n)<self._pk
 
 class FailingFiringUnit:
     """
     This implementation is for coding assessment test only.
     """
     short_name="FAIL"
-    def __init__(self):
+    def __init__(self,seed=None):
+        """
+        Initializes a FailingFiringUnit object.
+
+        Parameters:
+            seed: ignored, accepted for compatibility with the other firing units.
+        """
         pass
+    @property
+    def Pk(self):
+        ' ' 'Kill probability of a single shot: zero.' ' '
+        return 0.
     def fire(self):
         """
-        This method performs the firing operation by issuing a log message.
+        This method performs the firing operation by issuing a (debug) log message.
 
         Returns:
             False. This unit is guaranteed to fail.
         """
-        logger.info("FIRE!")
+        logger.debug("FIRE!")
         return False
+    def fire_batch(self,n:int):
+        """
+        This method performs n firing operations at once.
+
+        Returns:
+            boolean numpy array with n False values.
+        """
+        logger.debug(f"FIRE! x{n}")
+        return np.zeros(n,dtype=bool)
 
 def get_names():
-    ' ' 'Returns list of short names of Firing Unit implementations.' ' '
-    return [impl.short_name for impl in [PkFiringUnit,FailingFiringUnit]]
+    ' ' 'Returns list of short names of Firing Unit implementations (see the registry module).' ' '
+    return registry.get_names("FiringUnit")
 
 def get_element(name:str=PkFiringUnit.short_name,options:dict={}):
     """
@@ -60,11 +109,7 @@ def get_element(name:str=PkFiringUnit.short_name,options:dict={}):
     Returns:
         Firing Unit element of the specified kind
     """
-    implementations = [PkFiringUnit,FailingFiringUnit]
-    for impl in implementations:
-        if name==impl.short_name:
-            return impl(**options)
-    raise RuntimeError(f"Unknown IFF implementation '{name}'")
+    return registry.get_implementation("FiringUnit",name)(**options)
 
 #######################################################################
 
@@ -95,6 +140,23 @@ class TestPkFiringUnit(unittest.TestCase):
             if fu.fire():
                 nsuccess += 1
         self.assertEqual(nsuccess,0)
+    def test_batch(self):
+        ntest=1000000
+        for Pk in [0.0,0.4,0.8,1.0]:
+            hits = PkFiringUnit(Pk=Pk).fire_batch(ntest)
+            self.assertEqual(hits.shape,(ntest,))
+            self.assertEqual(hits.dtype,bool)
+            self.assertAlmostEqual(np.mean(hits),Pk,delta=0.01)
+        self.assertEqual(len(PkFiringUnit().fire_batch(0)),0)
+    def test_seed(self):
+        fu1 = PkFiringUnit(Pk=0.5,seed=42)
+        fu2 = PkFiringUnit(Pk=0.5,seed=42)
+        fu3 = PkFiringUnit(Pk=0.5,seed=43)
+        hits1 = fu1.fire_batch(1000)
+        self.assertTrue(np.array_equal(hits1,fu2.fire_batch(1000)))
+        self.assertFalse(np.array_equal(hits1,fu3.fire_batch(1000)))
+        fu4 = PkFiringUnit(Pk=0.5,seed=42)
+        self.assertEqual([fu4.fire() for _ in range(100)],list(hits1[:100]))
 
 class TestFailingFiringUnit(unittest.TestCase):
     def test_normal(self):
@@ -105,3 +167,7 @@ class TestFailingFiringUnit(unittest.TestCase):
             if fu.fire():
                 nsuccess += 1
         self.assertEqual(nsuccess,0)
+    def test_batch(self):
+        hits = FailingFiringUnit(seed=42).fire_batch(1000)
+        self.assertEqual(hits.shape,(1000,))
+        self.assertFalse(np.any(hits))
@@ -4,9 +4,42 @@ Foe' (IFF) algorithm for our air defense systems. Currently one IFF algorithm
 are provided.  namely the one that is specified in the MSG code assignment.
 That algorithm is purely fictional and should be replaced as soon as possible,
 using the same interface, with something that has a basis in reality.
+
+Any IFF element can be wrapped in a CachedIff, which memoizes the verdicts of
+the radar lines it has seen, so that identical sweeps (e.g. an empty sky) are
+not evaluated again. In a config file the cache is configured per element:
+
+    "IFF": {"name": "EvenOdd", "options": {}, "cache": {"capacity": 4096, "policy": "lru"}}
+
+Both IFF methods can also evaluate wide radar lines per sector, with the
+"window" and "stride" options: sector i covers window consecutive values,
+starting at value i*stride, and gets its own verdict (see SectorVerdicts). If
+the sectors do not end at the last value of the line, a final sector covers the
+last window values, so that every value is evaluated. Overlapping FOE sectors
+count as one contact (see SectorVerdicts.contacts). The sliding window counts
+are computed from cumulative sums, so the cost per radar line does not depend
+on the window size.
+
+For very wide radar lines, both IFF methods can split the lines into column
+chunks, which are counted on a pool of nthreads threads (numpy releases the
+GIL in the counting kernels), after which the partial counts are added up.
+Lines (or blocks of lines) with fewer than parallel_threshold values are
+evaluated serially, because then the thread handoffs cost more than they gain.
+The windowed mode always counts serially. The thread pool is created when it is
+first needed, and shut down with the close method (the simulation closes its
+IFF element at the end of a run).
+
+In a config file:
+
+    "IFF": {"name": "EvenOdd", "options": {"nthreads": 4, "parallel_threshold": 262144}}
 """
 
 import numpy as np
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from airdefense import registry
+from collections import OrderedDict
 import unittest
 from enum import Enum
 import logging
@@ -22,15 +55,212 @@ class IFFVerdict(Enum):
     FRIEND = 0
     FOE = 1
 
-class EvenOddIffMethod:
+# dtype of the verdict code arrays returned by the evaluate_batch methods
+verdict_dtype = np.uint8
+
+# number of set bits of every byte value
+_popcount = np.array([bin(value).count("1") for value in range(256)],dtype=np.uint8)
+
+def _check_line(line):
+    if len(line.shape)!=1:
+        raise ValueError("input line is not 1d")
+    if line.shape[0]==0:
+        raise ValueError("input line is empty")
+
+def _check_block(block):
+    if len(block.shape)!=2:
+        raise ValueError("input block is not 2d")
+    if block.shape[1]==0:
+        raise ValueError("input block has empty lines")
+
+# counting kernels for a line (1-dimensional) or per row of a block (2-dimensional);
+# for integers the odd values are counted with their lowest bit, which is much
+# faster than comparing the remainders
+
+def _odd_count(line):
+    return np.count_nonzero(line&1) if line.dtype.kind in "iub" else np.count_nonzero(line%2==1)
+
+def _odd_counts(block):
+    if block.dtype.kind in "iub":
+        return np.bitwise_and(block,1).sum(axis=1,dtype=np.int64)
+    return np.count_nonzero(block%2==1,axis=1)
+
+def _packed_odd_counts(packed):
+    return _popcount[packed].sum(axis=1,dtype=np.int64)
+
+def _count42(line):
+    return np.count_nonzero(line==42)
+
+def _has42(block):
+    return np.any(block==42,axis=1)
+
+def sector_starts(ncols:int,window:int,stride:int):
+    """
+    Returns the first value index of every sector of a radar line with ncols
+    values. A window of zero, or at least ncols, gives one sector with the whole
+    line. If the values after the last complete window are not covered, a final
+    sector starts at ncols-window.
+    """
+    if window<=0 or window>=ncols:
+        return np.zeros(1,dtype=np.int64)
+    starts=np.arange(0,ncols-window+1,stride)
+    if starts[-1]+window<ncols:
+        starts=np.append(starts,ncols-window)
+    return starts
+
+def _window_counts(indicator,window:int,stride:int):
+    # number of true values per sector, for every row of a 2-dimensional
+    # boolean array: differences of the cumulative sums at the sector boundaries
+    ncols=indicator.shape[1]
+    width=ncols if window<=0 else min(window,ncols)
+    starts=sector_starts(ncols,window,stride)
+    cumulative=np.zeros((indicator.shape[0],ncols+1),dtype=np.int64)
+    np.cumsum(indicator,axis=1,out=cumulative[:,1:])
+    return cumulative[:,starts+width]-cumulative[:,starts], width
+
+class SectorVerdicts:
+    """
+    The per sector verdicts of a windowed IFF method for one radar line.
+    Indexing gives the IFFVerdict of a sector, the verdict property gives
+    the verdict for the line as a whole: FOE if any sector is a FOE.
+    """
+    def __init__(self,codes,window:int,stride:int,ncols:int):
+        """
+        Initializes a SectorVerdicts object.
+
+        Parameters:
+            codes(numpy array): IFFVerdict value code per sector.
+            window(int): number of values per sector.
+            stride(int): distance between the first values of consecutive sectors.
+            ncols(int): number of values of the radar line.
+        """
+        self._codes = np.asarray(codes,dtype=verdict_dtype)
+        self._window = window
+        self._stride = stride
+        self._ncols = ncols
+    def __len__(self):
+        return len(self._codes)
+    def __getitem__(self,sector:int):
+        return IFFVerdict(self._codes[sector])
+    def __eq__(self,other):
+        return (isinstance(other,SectorVerdicts) and (self._window,self._stride,self._ncols)==(other._window,other._stride,other._ncols)
+                and np.array_equal(self._codes,other._codes))
+    def __repr__(self):
+        return f"SectorVerdicts({self._codes.tolist()},window={self._window},stride={self._stride},ncols={self._ncols})"
+    @property
+    def codes(self):
+        ' ' 'Array with the IFFVerdict value code of every sector.' ' '
+        return self._codes
+    @property
+    def foes(self):
+        ' ' 'Array with the indices of the FOE sectors.' ' '
+        return np.flatnonzero(self._codes==IFFVerdict.FOE.value)
+    @property
+    def contacts(self):
+        """
+        Array with the first sector of every contact: a run of FOE sectors that
+        overlap (stride smaller than window, or the final sector) is one contact,
+        because the sectors see the same values.
+        """
+        foes = self.foes
+        starts = np.minimum(foes*self._stride,self._ncols-self._window)
+        return foes[np.concatenate(([True],starts[1:]>=starts[:-1]+self._window))] if len(foes)>0 else foes
+    @property
+    def verdict(self):
+        ' ' 'IFFVerdict for the whole line: FOE if any sector is a FOE, FRIEND otherwise.' ' '
+        return IFFVerdict.FOE if np.any(self._codes==IFFVerdict.FOE.value) else IFFVerdict.FRIEND
+    def sector_range(self,sector:int):
+        ' ' 'Returns the range of value indices (start,stop) of a sector.' ' '
+        start = min(sector*self._stride,self._ncols-self._window)
+        return start, start+self._window
+
+class _IffMethod:
+    # constructor options of the IFF methods, per line evaluation of the
+    # windowed mode (the derived class implements evaluate_sectors_batch) and
+    # column parallel counting for wide radar lines
+    default_parallel_threshold = 1<<18
+    def __init__(self,window:int=0,stride:int=0,nthreads:int=1,parallel_threshold:int=default_parallel_threshold):
+        if window<0 or stride<0:
+            raise ValueError(f"window and stride should be nonnegative, got {window} and {stride}")
+        if nthreads<0 or parallel_threshold<0:
+            raise ValueError(f"nthreads and parallel_threshold should be nonnegative, got {nthreads} and {parallel_threshold}")
+        self._window = window
+        self._stride = stride if stride>0 else window
+        self._nthreads = nthreads if nthreads>0 else (os.cpu_count() or 1)
+        self._parallel_threshold = parallel_threshold
+        self._pool = None
+    @property
+    def nthreads(self):
+        ' ' 'Number of threads that count the column chunks of wide radar lines.' ' '
+        return self._nthreads
+    @property
+    def parallel_threshold(self):
+        ' ' 'Minimum number of values of a line (or block) for counting column chunks in parallel.' ' '
+        return self._parallel_threshold
+    @property
+    def window(self):
+        ' ' 'Number of values per sector (0=no windowed mode).' ' '
+        return self._window
+    @property
+    def stride(self):
+        ' ' 'Distance between the first values of consecutive sectors.' ' '
+        return self._stride
+    def close(self):
+        ' ' 'Shuts down the thread pool for counting column chunks, if any (a later evaluation creates a new one).' ' '
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+    def evaluate_sectors(self,line):
+        """
+        Evaluates a radar line per sector.
+
+        Parameter:
+            line(numpy array): a non-empty 1-dimensional numpy array with an integer dtype.
+
+        Returns:
+            SectorVerdicts
+        """
+        _check_line(line)
+        return self.sector_verdicts(self.evaluate_sectors_batch(line[np.newaxis,:])[0],len(line))
+    def sector_verdicts(self,codes,ncols:int):
+        ' ' 'Returns SectorVerdicts for one row of verdict codes from evaluate_sectors_batch, for lines of ncols values.' ' '
+        window=min(self._window,ncols) if self._window>0 else ncols
+        return SectorVerdicts(codes,window,self._stride or window,ncols)
+    def _column_counts(self,values,kernel):
+        # kernel(values) returns the count of a line, or the counts per row of a
+        # block; wide lines are split into column chunks, which are counted on
+        # the thread pool, and the partial counts are added up
+        if not self._parallel(values):
+            return kernel(values)
+        if self._pool is None:
+            self._pool=ThreadPoolExecutor(max_workers=self._nthreads,thread_name_prefix="IFF")
+        nchunks=min(self._nthreads,values.shape[-1])
+        bounds=np.linspace(0,values.shape[-1],nchunks+1).astype(np.int64)
+        return sum(self._pool.map(lambda start,stop: kernel(values[...,start:stop]),bounds[:-1],bounds[1:]))
+    def _parallel(self,values):
+        return self._nthreads>1 and values.size>=self._parallel_threshold
+
+class EvenOddIffMethod(_IffMethod):
     """
     This class implements the IFF method specified in the Coding Assignment
     MSG: when the number of odd values in a radar line is strictly greater than
     the number of even values, then the verdict is 'FOE', otherwise 'FRIEND'.
+
+    Since only the parity of the values matters, this method can also evaluate
+    packed parity bits (see radar.pack_parity) with evaluate_packed_batch.
     """
     short_name="EvenOdd"
-    def __init__(self):
-        pass
+    def __init__(self,window:int=0,stride:int=0,nthreads:int=1,parallel_threshold:int=_IffMethod.default_parallel_threshold):
+        """
+        Initializes an EvenOddIffMethod object.
+
+        Parameters:
+            window(int): number of values per sector for evaluate_sectors (0=whole line).
+            stride(int): distance between the first values of consecutive sectors (0=window).
+            nthreads(int): number of threads that count the column chunks of wide lines (0=number of CPUs).
+            parallel_threshold(int): minimum number of values of a line (or block) for counting in parallel.
+        """
+        super().__init__(window,stride,nthreads,parallel_threshold)
     def evaluate(self,line):
         """
         Counts the number of odd and even values in an array of integer values.
@@ -41,27 +271,77 @@ class EvenOddIffMethod:
         Returns:
             An IFFVerdict value ('FRIEND' or 'FOE').
         """
-        if len(line.shape)!=1:
-            raise ValueError("input line is not 1d")
-        if line.shape[0]==0:
-            raise ValueError("input line is empty")
-        n_even = np.sum(line%2==0)
-        n_odd = np.sum(line%2==1)
-        logger.debug(f"n_even={n_even} n_odd={n_odd}")
+        _check_line(line)
+        n_odd = int(self._column_counts(line,_odd_count))
+        n_even = line.shape[0]-n_odd
+        logger.debug("n_even=%d n_odd=%d",n_even,n_odd)
         if n_odd>n_even:
             return IFFVerdict.FOE
         else:
             return IFFVerdict.FRIEND
+    def evaluate_batch(self,block):
+        """
+        Vectorized version of evaluate, for a block of radar lines.
+
+        Parameter:
+            block(numpy array): a 2-dimensional numpy array with an integer dtype, one radar line per row.
+
+        Returns:
+            A numpy array with one IFFVerdict value code per row.
+        """
+        _check_block(block)
+        n_odd = self._column_counts(block,_odd_counts)
+        return np.where(2*n_odd>block.shape[1],IFFVerdict.FOE.value,IFFVerdict.FRIEND.value).astype(verdict_dtype)
+    def evaluate_packed_batch(self,packed,ncols:int):
+        """
+        Version of evaluate_batch for a block of radar lines of which only the
+        packed parity bits are given: the odd values are counted with a bit
+        count lookup table.
+
+        Parameter:
+            packed(numpy array): a 2-dimensional uint8 array with shape (n,ceil(ncols/8)), as produced by radar.pack_parity.
+            ncols(int): number of values per radar line.
+
+        Returns:
+            A numpy array with one IFFVerdict value code per row.
+        """
+        _check_block(packed)
+        if packed.dtype!=np.uint8 or packed.shape[1]!=(ncols+7)//8:
+            raise ValueError(f"packed block with dtype {packed.dtype} and shape {packed.shape} does not match {ncols} values per line")
+        n_odd = self._column_counts(packed,_packed_odd_counts)
+        return np.where(2*n_odd>ncols,IFFVerdict.FOE.value,IFFVerdict.FRIEND.value).astype(verdict_dtype)
+    def evaluate_sectors_batch(self,block):
+        """
+        Windowed version of evaluate_batch: a sector is a FOE when it has more odd than even values.
+
+        Parameter:
+            block(numpy array): a 2-dimensional numpy array with an integer dtype, one radar line per row.
+
+        Returns:
+            A 2-dimensional numpy array with one IFFVerdict value code per row and sector.
+        """
+        _check_block(block)
+        n_odd, width = _window_counts(block%2==1,self._window,self._stride)
+        return np.where(2*n_odd>width,IFFVerdict.FOE.value,IFFVerdict.FRIEND.value).astype(verdict_dtype)
 
-class FortyTwoIffMethod:
+class FortyTwoIffMethod(_IffMethod):
     """
     This class implements an alternative to the IFF method specified in the
     Coding Assignment MSG: if the line contains the value 42, then a verdict is
     FRIEND, otherwise FOE.
     """
     short_name="FortyTwo"
-    def __init__(self):
-        pass
+    def __init__(self,window:int=0,stride:int=0,nthreads:int=1,parallel_threshold:int=_IffMethod.default_parallel_threshold):
+        """
+        Initializes a FortyTwoIffMethod object.
+
+        Parameters:
+            window(int): number of values per sector for evaluate_sectors (0=whole line).
+            stride(int): distance between the first values of consecutive sectors (0=window).
+            nthreads(int): number of threads that count the column chunks of wide lines (0=number of CPUs).
+            parallel_threshold(int): minimum number of values of a line (or block) for counting in parallel.
+        """
+        super().__init__(window,stride,nthreads,parallel_threshold)
     def evaluate(self,line):
         """
         Checks if the input array contains the value 42.
@@ -72,35 +352,231 @@ class FortyTwoIffMethod:
         Returns:
             An IFFVerdict value ('FRIEND' or 'FOE').
         """
-        if len(line.shape)!=1:
-            raise ValueError("input line is not 1d")
-        if line.shape[0]==0:
-            raise ValueError("input line is empty")
-        if 42 in line:
+        _check_line(line)
+        if (self._column_counts(line,_count42) if self._parallel(line) else _count42(line))>0:
             return IFFVerdict.FRIEND
         else:
             return IFFVerdict.FOE
+    def evaluate_batch(self,block):
+        """
+        Vectorized version of evaluate, for a block of radar lines.
+
+        Parameter:
+            block(numpy array): a 2-dimensional numpy array with an integer dtype, one radar line per row.
+
+        Returns:
+            A numpy array with one IFFVerdict value code per row.
+        """
+        _check_block(block)
+        has42 = self._column_counts(block,_has42)>0 if self._parallel(block) else _has42(block)
+        return np.where(has42,IFFVerdict.FRIEND.value,IFFVerdict.FOE.value).astype(verdict_dtype)
+    def evaluate_sectors_batch(self,block):
+        """
+        Windowed version of evaluate_batch: a sector is a FRIEND when it contains the value 42.
+
+        Parameter:
+            block(numpy array): a 2-dimensional numpy array with an integer dtype, one radar line per row.
+
+        Returns:
+            A 2-dimensional numpy array with one IFFVerdict value code per row and sector.
+        """
+        _check_block(block)
+        n42, _ = _window_counts(block==42,self._window,self._stride)
+        return np.where(n42>0,IFFVerdict.FRIEND.value,IFFVerdict.FOE.value).astype(verdict_dtype)
+
+class _LruCache:
+    # evicts the least recently used entry
+    def __init__(self,capacity:int):
+        self._capacity = capacity
+        self._entries = OrderedDict()
+    def __len__(self):
+        return len(self._entries)
+    def get(self,key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+    def put(self,key,value):
+        self._entries[key] = value
+        if len(self._entries)>self._capacity:
+            self._entries.popitem(last=False)
+            return 1
+        return 0
+
+class _LfuCache:
+    # evicts the least frequently used entry (the least recently used one of
+    # those, if there are several), in constant time per operation
+    def __init__(self,capacity:int):
+        self._capacity = capacity
+        self._entries = {}
+        self._by_frequency = {}
+        self._min_frequency = 0
+    def __len__(self):
+        return len(self._entries)
+    def get(self,key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value,frequency = entry
+        keys = self._by_frequency[frequency]
+        del keys[key]
+        if not keys:
+            del self._by_frequency[frequency]
+            if self._min_frequency==frequency:
+                self._min_frequency = frequency+1
+        self._by_frequency.setdefault(frequency+1,OrderedDict())[key] = None
+        self._entries[key] = (value,frequency+1)
+        return value
+    def put(self,key,value):
+        nevicted = 0
+        if len(self._entries)>=self._capacity:
+            keys = self._by_frequency[self._min_frequency]
+            evicted,_ = keys.popitem(last=False)
+            if not keys:
+                del self._by_frequency[self._min_frequency]
+            del self._entries[evicted]
+            nevicted = 1
+        self._entries[key] = (value,1)
+        self._by_frequency.setdefault(1,OrderedDict())[key] = None
+        self._min_frequency = 1
+        return nevicted
+
+class CachedIff:
+    """
+    This class wraps an IFF element with a bounded cache of verdicts, keyed by
+    a hash (blake2b) of the raw bytes and the dtype of the radar line. Lines
+    that are in the cache are not evaluated again. Hashing a line costs about
+    as much as evaluating a short line with a vectorized method, so the cache
+    pays off for wide lines, for expensive IFF methods and for recordings with
+    many repeated sweeps; the counters (see cache_stats) tell whether it does.
+
+    Packed radar data (see the radar module) are not supported.
+    """
+    policies = ("lru","lfu")
+    default_capacity = 4096
+    def __init__(self,element,capacity:int=default_capacity,policy:str="lru"):
+        """
+        Initializes a CachedIff object.
+
+        Parameters:
+            element: the IFF element to wrap.
+            capacity(int): maximum number of cached verdicts.
+            policy(str): eviction policy, "lru" (least recently used) or "lfu" (least frequently used).
+        """
+        if policy not in CachedIff.policies:
+            raise ValueError(f"unknown cache policy '{policy}', should be one of {CachedIff.policies}")
+        if capacity<1:
+            raise ValueError(f"cache capacity should be positive, got {capacity}")
+        if getattr(element,"window",0)>0:
+            raise ValueError("the verdicts of a windowed IFF element cannot be cached")
+        self._element = element
+        self._capacity = capacity
+        self._cache = _LruCache(capacity) if policy=="lru" else _LfuCache(capacity)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+    @property
+    def element(self):
+        ' ' 'The wrapped IFF element.' ' '
+        return self._element
+    def close(self):
+        ' ' 'Closes the wrapped IFF element, if it has a close method.' ' '
+        if hasattr(self._element,"close"):
+            self._element.close()
+    def evaluate(self,line):
+        """
+        Returns the cached verdict for the line, or evaluates it with the wrapped element.
+
+        Parameter:
+            line(numpy array): a non-empty 1-dimensional numpy array with an integer dtype.
+
+        Returns:
+            An IFFVerdict value.
+        """
+        _check_line(line)
+        key = self._key(line)
+        code = self._cache.get(key)
+        if code is None:
+            self._misses += 1
+            code = self._element.evaluate(line).value
+            self._evictions += self._cache.put(key,code)
+        else:
+            self._hits += 1
+        return IFFVerdict(code)
+    def evaluate_batch(self,block):
+        """
+        Version of evaluate for a block of radar lines. The lines that are not
+        in the cache are evaluated together (once per distinct line), with the
+        evaluate_batch method of the wrapped element if it has one. A line that
+        occurs several times in the block counts as one cache lookup.
+
+        Parameter:
+            block(numpy array): a 2-dimensional numpy array with an integer dtype, one radar line per row.
+
+        Returns:
+            A numpy array with one IFFVerdict value code per row.
+        """
+        _check_block(block)
+        codes = np.empty(len(block),dtype=verdict_dtype)
+        found = {}
+        missing = {}
+        for row,line in enumerate(block):
+            key = self._key(line)
+            if key in missing:
+                missing[key].append(row)
+                continue
+            code = found.get(key)
+            if code is None:
+                code = found[key] = self._cache.get(key)
+                if code is None:
+                    del found[key]
+                    missing[key] = [row]
+                    continue
+            codes[row] = code
+        self._hits += len(found)
+        self._misses += len(missing)
+        if missing:
+            first_rows = [rows[0] for rows in missing.values()]
+            if hasattr(self._element,"evaluate_batch"):
+                new_codes = self._element.evaluate_batch(block[first_rows])
+            else:
+                new_codes = [self._element.evaluate(block[row]).value for row in first_rows]
+            for (key,rows),code in zip(missing.items(),new_codes):
+                codes[rows] = code
+                self._evictions += self._cache.put(key,int(code))
+        return codes
+    def cache_stats(self):
+        """
+        Returns a dict with the cache statistics: number of hits, misses and
+        evictions, the current size and the capacity of the cache, and the hit
+        rate (fraction of the lookups that found the line in the cache; one lookup
+        per line for evaluate, per distinct line of a block for evaluate_batch).
+        """
+        nlookups = self._hits+self._misses
+        return dict(hits=self._hits,misses=self._misses,evictions=self._evictions,size=len(self._cache),
+                    capacity=self._capacity,hit_rate=self._hits/nlookups if nlookups>0 else 0.)
+    # implementation details
+    def _key(self,line):
+        return hashlib.blake2b(np.ascontiguousarray(line),digest_size=16,person=line.dtype.str.encode()).digest()
 
 def get_names():
-    ' ' 'Returns list of short names of IFF implementations.' ' '
-    return [impl.short_name for impl in [EvenOddIffMethod,FortyTwoIffMethod]]
+    ' ' 'Returns list of short names of IFF implementations (see the registry module).' ' '
+    return registry.get_names("IFF")
 
-def get_element(name:str=EvenOddIffMethod.short_name,options:dict={}):
+def get_element(name:str=EvenOddIffMethod.short_name,options:dict={},cache:dict=None):
     """
     Factory function to create an IFF element.
 
     Parameters:
         name(str): should be the short name of a IFF element implementation.
         options(dict): keyword arguments to be forwarded to the IFF element constructor
+        cache(dict): if not None, the element is wrapped in a CachedIff, with these keyword arguments (e.g. capacity and policy)
 
     Returns:
         IFF element of the specified kind
     """
-    implementations = [EvenOddIffMethod,FortyTwoIffMethod]
-    for impl in implementations:
-        if name==impl.short_name:
-            return impl(**options)
-    raise RuntimeError(f"Unknown IFF implementation '{name}'")
+    element = registry.get_implementation("IFF",name)(**options)
+    return element if cache is None else CachedIff(element,**cache)
 
 #######################################################################
 
@@ -124,6 +600,30 @@ class TestEvenOddIffMethod(unittest.TestCase):
             iff = EvenOddIffMethod()
             #logger.error("The following error message about a nonexistent csv file is intentional.")
             iff.evaluate(np.ones((11,20),dtype=int))
+    def test_batch(self):
+        iff = EvenOddIffMethod()
+        block = np.random.randint(0,1024,size=(50,11))
+        block[0,:] = 1
+        block[1,:] = 0
+        verdicts = iff.evaluate_batch(block)
+        self.assertEqual(verdicts.shape,(50,))
+        self.assertEqual(verdicts[0],IFFVerdict.FOE.value)
+        self.assertEqual(verdicts[1],IFFVerdict.FRIEND.value)
+        for line,code in zip(block,verdicts):
+            self.assertEqual(IFFVerdict(code),iff.evaluate(line))
+        self.assertEqual(len(iff.evaluate_batch(np.ones((0,11),dtype=int))),0)
+        with self.assertRaises(ValueError, msg="this is supposed to crash: non-2D input"):
+            iff.evaluate_batch(np.ones(11,dtype=int))
+    def test_packed(self):
+        iff = EvenOddIffMethod()
+        for ncols in [1,8,11,360]:
+            block = np.random.randint(0,1024,size=(50,ncols)).astype(np.uint16)
+            block[0,:] = 1
+            packed = np.packbits(block&1,axis=1)
+            self.assertTrue(np.array_equal(iff.evaluate_packed_batch(packed,ncols),iff.evaluate_batch(block)))
+            self.assertEqual(iff.evaluate_packed_batch(packed,ncols)[0],IFFVerdict.FOE.value)
+        with self.assertRaises(ValueError, msg="this is supposed to crash: wrong number of bytes per line"):
+            iff.evaluate_packed_batch(packed,8)
 
 class TestFortyTwoIffMethod(unittest.TestCase):
     """
@@ -146,3 +646,204 @@ class TestFortyTwoIffMethod(unittest.TestCase):
             iff = FortyTwoIffMethod()
             #logger.error("The following error message about a nonexistent csv file is intentional.")
             iff.evaluate(np.ones((11,20),dtype=int))
+    def test_batch(self):
+        iff = FortyTwoIffMethod()
+        block = np.random.randint(0,50,size=(50,21))
+        block[0,:] = 42
+        block[1,:] = 0
+        verdicts = iff.evaluate_batch(block)
+        self.assertEqual(verdicts.shape,(50,))
+        self.assertEqual(verdicts[0],IFFVerdict.FRIEND.value)
+        self.assertEqual(verdicts[1],IFFVerdict.FOE.value)
+        for line,code in zip(block,verdicts):
+            self.assertEqual(IFFVerdict(code),iff.evaluate(line))
+        with self.assertRaises(ValueError, msg="this is supposed to crash: non-2D input"):
+            iff.evaluate_batch(np.ones(11,dtype=int))
+
+class TestCachedIff(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the IFF verdict cache.
+    """
+    def test_verdicts(self):
+        block = np.random.randint(0,4,size=(500,3)).astype(np.uint8)
+        for name in get_names():
+            iff = get_element(name)
+            for policy in CachedIff.policies:
+                cached = get_element(name,cache=dict(capacity=16,policy=policy))
+                self.assertTrue(np.array_equal(cached.evaluate_batch(block),iff.evaluate_batch(block)))
+                for line in block[:100]:
+                    self.assertEqual(cached.evaluate(line),iff.evaluate(line))
+                stats = cached.cache_stats()
+                self.assertEqual(stats["hits"]+stats["misses"],len(set(line.tobytes() for line in block))+100)
+                self.assertGreater(stats["hits"],0)
+                self.assertGreater(stats["evictions"],0)
+                self.assertLessEqual(stats["size"],16)
+    def test_counters(self):
+        cached = CachedIff(EvenOddIffMethod(),capacity=2)
+        lines = [np.full(5,value,dtype=np.uint8) for value in range(3)]
+        self.assertEqual(cached.evaluate_batch(np.stack([lines[0],lines[1],lines[0]])).tolist(),[0,1,0])
+        self.assertEqual((cached.cache_stats()["hits"],cached.cache_stats()["misses"]),(0,2),msg="a repeated miss is not a hit")
+        self.assertEqual(cached.evaluate(lines[0]),IFFVerdict.FRIEND)
+        cached.evaluate(lines[2])
+        stats = cached.cache_stats()
+        self.assertEqual((stats["hits"],stats["misses"],stats["evictions"],stats["size"]),(1,3,1,2))
+        cached.evaluate(lines[0])
+        self.assertEqual(cached.cache_stats()["hits"],2)
+        self.assertEqual(cached.evaluate_batch(np.stack([lines[0],lines[2],lines[0],lines[0]])).tolist(),[0,0,0,0])
+        self.assertEqual(cached.cache_stats()["hits"],4)
+        cached.evaluate(lines[1].astype(np.uint16))
+        self.assertEqual(cached.cache_stats()["misses"],4)
+    def test_lfu(self):
+        cached = CachedIff(EvenOddIffMethod(),capacity=2,policy="lfu")
+        lines = [np.full(5,value,dtype=np.uint8) for value in range(3)]
+        for line in [lines[0],lines[0],lines[1],lines[2],lines[0]]:
+            cached.evaluate(line)
+        stats = cached.cache_stats()
+        self.assertEqual((stats["hits"],stats["misses"],stats["evictions"]),(2,3,1))
+        cached.evaluate(lines[1])
+        self.assertEqual(cached.cache_stats()["misses"],4)
+    def test_bad_config(self):
+        with self.assertRaises(ValueError):
+            CachedIff(EvenOddIffMethod(),policy="fifo")
+        with self.assertRaises(ValueError):
+            CachedIff(EvenOddIffMethod(),capacity=0)
+
+class TestWindowedIff(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the windowed (per sector) IFF mode.
+    """
+    def naive(self,iff,line,window,stride):
+        verdicts = []
+        starts = list(range(0,len(line)-window+1,stride))
+        if starts[-1]+window<len(line):
+            starts.append(len(line)-window)
+        for start in starts:
+            verdicts.append(get_element(iff.short_name).evaluate(line[start:start+window]).value)
+        return verdicts
+    def test_sectors(self):
+        rng = np.random.default_rng(42)
+        block = rng.integers(40,44,size=(20,37)).astype(np.uint8)
+        for name in get_names():
+            for window,stride in [(1,1),(5,5),(8,3),(36,1),(37,4)]:
+                iff = get_element(name,dict(window=window,stride=stride))
+                codes = iff.evaluate_sectors_batch(block)
+                self.assertEqual(codes.shape,(20,len(sector_starts(37,window,stride))))
+                for line,row in zip(block,codes):
+                    self.assertEqual(row.tolist(),self.naive(iff,line,window,stride))
+                    self.assertEqual(iff.evaluate_sectors(line),iff.sector_verdicts(row,37))
+    def test_whole_line(self):
+        block = np.random.randint(0,100,size=(30,11))
+        for name in get_names():
+            for window in [0,11,100]:
+                iff = get_element(name,dict(window=window))
+                self.assertTrue(np.array_equal(iff.evaluate_sectors_batch(block)[:,0],iff.evaluate_batch(block)))
+                sectors = iff.evaluate_sectors(block[0])
+                self.assertEqual(len(sectors),1)
+                self.assertEqual(sectors.sector_range(0),(0,11))
+                self.assertEqual(sectors.verdict,iff.evaluate(block[0]))
+    def test_sector_verdicts(self):
+        iff = EvenOddIffMethod(window=4)
+        line = np.array([1,1,1,0, 0,0,0,0, 1,1,1,1, 7])
+        sectors = iff.evaluate_sectors(line)
+        self.assertEqual(len(sectors),4)
+        self.assertEqual([sectors[i] for i in range(4)],[IFFVerdict.FOE,IFFVerdict.FRIEND,IFFVerdict.FOE,IFFVerdict.FOE])
+        self.assertEqual(sectors.foes.tolist(),[0,2,3])
+        self.assertEqual(sectors.sector_range(2),(8,12))
+        self.assertEqual(sectors.sector_range(3),(9,13))
+        self.assertEqual(sectors.verdict,IFFVerdict.FOE)
+        self.assertEqual(sectors.contacts.tolist(),[0,2])
+        with self.assertRaises(ValueError):
+            EvenOddIffMethod(window=-1)
+        with self.assertRaises(ValueError):
+            CachedIff(iff)
+
+    def test_tail(self):
+        # a FOE in the values after the last complete window is found by the final sector
+        self.assertEqual(sector_starts(360,64,64).tolist(),[0,64,128,192,256,296])
+        self.assertEqual(sector_starts(384,64,64).tolist(),[0,64,128,192,256,320])
+        line = np.zeros(360,dtype=np.int64)
+        line[310:360] = 1
+        sectors = EvenOddIffMethod(window=64).evaluate_sectors(line)
+        self.assertEqual(sectors.verdict,IFFVerdict.FOE)
+        self.assertEqual(sectors.foes.tolist(),[5])
+        self.assertEqual(sectors.sector_range(5),(296,360))
+        sectors = EvenOddIffMethod(window=64,stride=16).evaluate_sectors(line)
+        self.assertEqual(len(sectors),20)
+        self.assertEqual(sectors.foes.tolist(),[18,19])
+        self.assertEqual(sectors.contacts.tolist(),[18])
+        line = np.full(360,42)
+        line[296:] = 0
+        sectors = FortyTwoIffMethod(window=64).evaluate_sectors(line)
+        self.assertEqual(sectors.foes.tolist(),[5])
+    def test_contacts(self):
+        # overlapping FOE sectors are one contact, separate runs of them are separate contacts
+        line = np.array([0,0,0,0, 1,1,1,1, 0,0,0,0, 0,0,0,0, 1,1,1,1, 0,0])
+        sectors = EvenOddIffMethod(window=4,stride=2).evaluate_sectors(line)
+        self.assertEqual(sectors.foes.tolist(),[2,8])
+        self.assertEqual(sectors.contacts.tolist(),[2,8])
+        line[6:11] = 1
+        sectors = EvenOddIffMethod(window=4,stride=2).evaluate_sectors(line)
+        self.assertEqual(sectors.foes.tolist(),[2,3,4,8])
+        self.assertEqual(sectors.contacts.tolist(),[2,8])
+        line = np.array([1,1,1,1, 1,1,1,1, 0,0,1,1,1])
+        sectors = EvenOddIffMethod(window=4).evaluate_sectors(line)
+        self.assertEqual(sectors.foes.tolist(),[0,1,3])
+        self.assertEqual(sectors.contacts.tolist(),[0,1,3])
+        sectors = EvenOddIffMethod(window=4).evaluate_sectors(np.zeros(13,dtype=int))
+        self.assertEqual(sectors.contacts.tolist(),[])
+
+class TestParallelIff(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the column parallel counting of the IFF methods.
+    """
+    def test_equivalence(self):
+        rng = np.random.default_rng(11)
+        block = rng.integers(-100,100,size=(3,100003))
+        block[1,::2] = 42
+        for name in get_names():
+            serial = get_element(name)
+            parallel = get_element(name,dict(nthreads=4,parallel_threshold=0))
+            self.assertEqual(parallel.nthreads,4)
+            self.assertTrue(np.array_equal(parallel.evaluate_batch(block),serial.evaluate_batch(block)))
+            for line in block:
+                self.assertEqual(parallel.evaluate(line),serial.evaluate(line))
+            self.assertIsNotNone(parallel._pool)
+            self.assertTrue(np.array_equal(parallel.evaluate_batch(block[:,:3]),serial.evaluate_batch(block[:,:3])))
+        packed = np.packbits((block&1).astype(np.uint8),axis=1)
+        parallel = EvenOddIffMethod(nthreads=3,parallel_threshold=0)
+        self.assertTrue(np.array_equal(parallel.evaluate_packed_batch(packed,block.shape[1]),EvenOddIffMethod().evaluate_batch(block)))
+    def test_threshold(self):
+        iff = EvenOddIffMethod(nthreads=4,parallel_threshold=1000)
+        self.assertEqual(iff.parallel_threshold,1000)
+        iff.evaluate_batch(np.ones((10,99),dtype=np.uint8))
+        self.assertIsNone(iff._pool,msg="small blocks should be evaluated serially")
+        self.assertEqual(iff.evaluate(np.arange(2001)),IFFVerdict.FRIEND)
+        self.assertIsNotNone(iff._pool)
+        self.assertEqual(EvenOddIffMethod(nthreads=0).nthreads,os.cpu_count() or 1)
+        self.assertEqual(iff.evaluate(np.array([1.,3.,2.5])),IFFVerdict.FOE)
+        with self.assertRaises(ValueError):
+            FortyTwoIffMethod(nthreads=-1)
+    def test_close(self):
+        iff = FortyTwoIffMethod(nthreads=2,parallel_threshold=0)
+        line = np.full(1000,42)
+        self.assertEqual(iff.evaluate(line),IFFVerdict.FRIEND)
+        pool = iff._pool
+        iff.close()
+        self.assertIsNone(iff._pool)
+        with self.assertRaises(RuntimeError):
+            pool.submit(int)
+        self.assertEqual(iff.evaluate(line),IFFVerdict.FRIEND,msg="a closed element should create a new pool when needed")
+        cached = CachedIff(iff)
+        cached.close()
+        self.assertIsNone(iff._pool)
+        CachedIff(EvenOddIffMethod()).close()
+        # the simulation shuts down the pool at the end of a run
+        from airdefense import pads
+        config = dict(pads.read_config("default.json"),IFF=dict(name="EvenOdd",options=dict(nthreads=2,parallel_threshold=0)))
+        logging.disable(logging.INFO)
+        try:
+            sim = pads.simulation(config=config,clock_name="virtual",seed=1)
+            sim.run()
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertIsNone(sim._IFF._pool)
@@ -0,0 +1,441 @@
+"""
+This module implements a columnar archive of engagement results: one record
+per radar sweep, with the battery id, sweep number, simulated time, verdict,
+whether the firing unit fired, whether it hit (at least once), and the numbers
+of shots and hits (which can be larger than one with a windowed IFF).
+
+An archive is a directory with a manifest ("archive.json") and chunk files.
+Every chunk of records is stored as one '.npy' file per column, so that a
+query only reads the columns it needs, and the columns are opened with memory
+mapping instead of being read into memory. Records are appended in chunks of
+a fixed number of rows; the manifest is rewritten after every chunk, so that
+an interrupted run leaves a readable archive with all complete chunks.
+
+The summaries of an Archive (hit rate over time windows, FOE counts per
+battery) are computed per chunk with vectorized numpy operations, so that
+archives larger than the memory can be summarized.
+"""
+
+import numpy as np
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from airdefense import pads, events
+import logging
+logger=logging.getLogger(__name__)
+
+archive_dtype = np.dtype([("battery",np.int32),("sweep",np.int64),("sim_time",np.float64),("verdict",np.uint8),
+                          ("fired",np.bool_),("hit",np.bool_),("shots",np.uint16),("hits",np.uint16)])
+
+window_dtype = np.dtype([("start",np.float64),("shots",np.int64),("hits",np.int64),("hit_rate",np.float64)])
+
+manifest_name = "archive.json"
+archive_format = "airdefense-archive"
+archive_version = 1
+
+def chunk_path(path,index:int,column:str):
+    ' ' 'Returns the path of the file of a column of a chunk of an archive.' ' '
+    return Path(path) / f"{index:06d}.{column}.npy"
+
+def _write_json(path,data):
+    tmp_path=path.with_name(path.name+".tmp")
+    with open(tmp_path,"w") as fp:
+        json.dump(data,fp,indent=1)
+    os.replace(tmp_path,path)
+
+class ArchiveWriter:
+    """
+    Appends engagement records to an archive, in chunks of a fixed number of rows.
+    """
+    default_chunk_rows = 65536
+    def __init__(self,path,chunk_rows:int=default_chunk_rows,names:list=None,metadata:dict=None,append:bool=False):
+        """
+        Initializes an ArchiveWriter object.
+
+        Parameters:
+            path: archive directory (created if necessary). An existing archive is
+                  overwritten, unless append is True.
+            chunk_rows(int): number of records per chunk.
+            names(list): battery names; the battery field of the records is an index in this list.
+            metadata(dict): json serializable data to store in the manifest, e.g. the config.
+            append(bool): append to an existing archive (the names and metadata are kept
+                          if they are not given).
+        """
+        if chunk_rows<1:
+            raise ValueError(f"chunk_rows should be positive, not {chunk_rows}")
+        self._path = Path(path)
+        self._chunk_rows = chunk_rows
+        self._buffer = np.zeros(chunk_rows,dtype=archive_dtype)
+        self._nbuffered = 0
+        self._path.mkdir(parents=True,exist_ok=True)
+        manifest_path = self._path / manifest_name
+        self._manifest = dict(format=archive_format,version=archive_version,
+                              fields=[[name,archive_dtype[name].str] for name in archive_dtype.names],
+                              chunks=[],names=[],metadata={})
+        if manifest_path.exists():
+            existing = Archive(self._path)
+            if append:
+                if existing.dtype!=archive_dtype:
+                    raise ValueError(f"cannot append to archive {self._path} with fields {existing.dtype}")
+                self._manifest.update(chunks=existing.chunk_rows,names=existing.names,metadata=existing.metadata)
+            else:
+                existing.remove_chunks()
+        if names is not None:
+            self._manifest["names"] = list(names)
+        if metadata is not None:
+            self._manifest["metadata"] = metadata
+        self._write_manifest()
+    @property
+    def path(self):
+        ' ' 'Archive directory.' ' '
+        return self._path
+    @property
+    def nrows(self):
+        ' ' 'Number of appended records, including those that are not written yet.' ' '
+        return sum(self._manifest["chunks"])+self._nbuffered
+    def append(self,records):
+        """
+        Appends records to the archive.
+
+        Parameters:
+            records: structured numpy array with (some of) the fields of archive_dtype, e.g. a
+                     multibattery timeline; missing fields are zero.
+        """
+        records=np.asarray(records)
+        fields=[name for name in archive_dtype.names if name in records.dtype.names]
+        start=0
+        while start<len(records):
+            if self._nbuffered==self._chunk_rows:
+                self._write_chunk()
+            n=min(len(records)-start,self._chunk_rows-self._nbuffered)
+            target=self._buffer[self._nbuffered:self._nbuffered+n]
+            target[...]=0
+            for name in fields:
+                target[name]=records[name][start:start+n]
+            self._nbuffered+=n
+            start+=n
+    def append_row(self,battery:int,sweep:int,sim_time:float,verdict:int,shots:int=0,hits:int=0):
+        ' ' 'Appends a single record to the archive.' ' '
+        if self._nbuffered==self._chunk_rows:
+            self._write_chunk()
+        self._buffer[self._nbuffered]=(battery,sweep,sim_time,verdict,shots>0,hits>0,shots,hits)
+        self._nbuffered+=1
+    def add_shot(self,hit:bool):
+        ' ' 'Counts a shot (and hit) in the last appended record.' ' '
+        if self._nbuffered==0:
+            raise RuntimeError("a shot can only be added to a record that has not been written yet")
+        row=self._buffer[self._nbuffered-1:self._nbuffered]
+        row["shots"]+=1
+        row["fired"]=True
+        if hit:
+            row["hits"]+=1
+            row["hit"]=True
+    def flush(self):
+        ' ' 'Writes the buffered records as a (possibly short) chunk.' ' '
+        if self._nbuffered>0:
+            self._write_chunk()
+    def close(self):
+        ' ' 'Writes the buffered records.' ' '
+        self.flush()
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        self.close()
+    # implementation details
+    def _write_chunk(self):
+        index=len(self._manifest["chunks"])
+        for name in archive_dtype.names:
+            np.save(chunk_path(self._path,index,name),self._buffer[name][:self._nbuffered])
+        self._manifest["chunks"].append(self._nbuffered)
+        self._nbuffered=0
+        self._write_manifest()
+    def _write_manifest(self):
+        _write_json(self._path / manifest_name,self._manifest)
+
+class ArchiveSink:
+    """
+    Event sink (see the events module) that archives the outcome of every radar
+    sweep: a FRIEND or FOE event starts a new record, the HIT and MISS events
+    that follow it are counted as the shots of that record. The events of a
+    sweep should be emitted consecutively, as a simulation does.
+    """
+    def __init__(self,path,chunk_rows:int=ArchiveWriter.default_chunk_rows,names:list=None,metadata:dict=None,append:bool=False):
+        """
+        Initializes an ArchiveSink object.
+
+        Parameters:
+            path: archive directory, see ArchiveWriter.
+            chunk_rows(int): number of records per chunk.
+            names(list): battery names; the battery field of the records is an index in this list.
+            metadata(dict): json serializable data to store in the manifest, e.g. the config.
+            append(bool): append to an existing archive.
+        """
+        self._writer = ArchiveWriter(path,chunk_rows,names,metadata,append)
+    @property
+    def writer(self):
+        ' ' 'The ArchiveWriter of this sink.' ' '
+        return self._writer
+    def emit(self,event):
+        kind=event.kind
+        if kind==events.EventKind.HIT or kind==events.EventKind.MISS:
+            self._writer.add_shot(kind==events.EventKind.HIT)
+        else:
+            self._writer.append_row(event.battery,event.sweep,event.sim_time,kind)
+    def flush(self):
+        self._writer.flush()
+    def close(self):
+        self._writer.close()
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        self.close()
+
+class Archive:
+    """
+    Read access to an archive, with memory mapped columns and vectorized summaries.
+    """
+    def __init__(self,path):
+        """
+        Opens an archive.
+
+        Parameters:
+            path: archive directory.
+        """
+        self._path = Path(path)
+        manifest_path = self._path / manifest_name
+        if not manifest_path.exists():
+            raise ValueError(f"{self._path} is not an archive (no {manifest_name})")
+        with open(manifest_path) as fp:
+            manifest = json.load(fp)
+        if manifest.get("format")!=archive_format or manifest.get("version")!=archive_version:
+            raise ValueError(f"{self._path} is not a version {archive_version} archive")
+        self._dtype = np.dtype([(name,dtype) for name,dtype in manifest["fields"]])
+        self._chunk_rows = list(manifest["chunks"])
+        self._names = list(manifest["names"])
+        self._metadata = manifest["metadata"]
+    @property
+    def path(self):
+        ' ' 'Archive directory.' ' '
+        return self._path
+    @property
+    def dtype(self):
+        ' ' 'Structured dtype of the records.' ' '
+        return self._dtype
+    @property
+    def names(self):
+        ' ' 'List of battery names; the battery field of the records is an index in this list.' ' '
+        return self._names
+    @property
+    def metadata(self):
+        ' ' 'Data stored with the archive, e.g. the config.' ' '
+        return self._metadata
+    @property
+    def chunk_rows(self):
+        ' ' 'List with the number of records of every chunk.' ' '
+        return self._chunk_rows
+    @property
+    def nrows(self):
+        ' ' 'Total number of records.' ' '
+        return sum(self._chunk_rows)
+    def __len__(self):
+        return self.nrows
+    def chunks(self,columns:list=None):
+        """
+        Generates the chunks of the archive.
+
+        Parameters:
+            columns(list): names of the columns to open (default: all).
+
+        Returns:
+            generator of dicts with a read-only memory mapped array per column.
+        """
+        columns=list(self._dtype.names) if columns is None else columns
+        for index in range(len(self._chunk_rows)):
+            yield {name:np.load(chunk_path(self._path,index,name),mmap_mode="r") for name in columns}
+    def column(self,name:str):
+        ' ' 'Returns a column of all records (memory mapped if the archive has a single chunk).' ' '
+        parts=[chunk[name] for chunk in self.chunks([name])]
+        if len(parts)==1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros(0,dtype=self._dtype[name])
+    def records(self,columns:list=None):
+        ' ' 'Returns (some columns of) all records, as a structured numpy array.' ' '
+        columns=list(self._dtype.names) if columns is None else columns
+        records=np.zeros(self.nrows,dtype=[(name,self._dtype[name]) for name in columns])
+        start=0
+        for chunk,n in zip(self.chunks(columns),self._chunk_rows):
+            for name in columns:
+                records[name][start:start+n]=chunk[name]
+            start+=n
+        return records
+    def summary(self,battery:int=None):
+        ' ' 'Returns a RunSummary of all records, or of the records of one battery (id).' ' '
+        totals=np.zeros(4,dtype=np.int64)
+        for chunk in self.chunks(["battery","verdict","shots","hits"]):
+            if battery is not None:
+                mask=chunk["battery"]==battery
+                chunk={name:column[mask] for name,column in chunk.items()}
+            nfoes=np.count_nonzero(chunk["verdict"]==events.EventKind.FOE)
+            nshots=int(chunk["shots"].sum(dtype=np.int64))
+            nhits=int(chunk["hits"].sum(dtype=np.int64))
+            totals+=(len(chunk["verdict"]),nfoes,nhits,nshots-nhits)
+        sweeps,foes,hits,misses=(int(total) for total in totals)
+        return pads.RunSummary(sweeps=sweeps,friends=sweeps-foes,foes=foes,hits=hits,misses=misses)
+    def foe_counts(self):
+        """
+        Counts the FOE verdicts per battery.
+
+        Returns:
+            integer array with the number of FOE sweeps of every battery id
+            (with at least an entry for every battery name).
+        """
+        counts=np.zeros(len(self._names),dtype=np.int64)
+        for chunk in self.chunks(["battery","verdict"]):
+            chunk_counts=np.bincount(chunk["battery"][chunk["verdict"]==events.EventKind.FOE],minlength=len(counts))
+            if len(chunk_counts)>len(counts):
+                counts=np.concatenate([counts,np.zeros(len(chunk_counts)-len(counts),dtype=np.int64)])
+            counts[:len(chunk_counts)]+=chunk_counts
+        return counts
+    def hit_rate(self,window_seconds:float,battery:int=None):
+        """
+        Computes the hit rate over consecutive windows of simulated time, starting at time zero.
+
+        Parameters:
+            window_seconds(float): width of the windows [seconds].
+            battery(int): only count the shots of this battery id (default: all batteries).
+
+        Returns:
+            structured numpy array (window_dtype) with the start time, the numbers of shots
+            and hits, and the hit rate (nan if there were no shots) of every window up to the
+            last one with a record.
+        """
+        if not window_seconds>0:
+            raise ValueError(f"window_seconds should be positive, not {window_seconds}")
+        shots=np.zeros(0,dtype=np.int64)
+        hits=np.zeros(0,dtype=np.int64)
+        for chunk in self.chunks(["battery","sim_time","shots","hits"]):
+            mask=slice(None) if battery is None else chunk["battery"]==battery
+            window=(chunk["sim_time"][mask]//window_seconds).astype(np.intp)
+            nwindows=max(len(shots),int(window.max())+1 if len(window) else 0)
+            shots=np.pad(shots,(0,nwindows-len(shots)))
+            hits=np.pad(hits,(0,nwindows-len(hits)))
+            shots+=np.bincount(window,weights=chunk["shots"][mask],minlength=nwindows).astype(np.int64)
+            hits+=np.bincount(window,weights=chunk["hits"][mask],minlength=nwindows).astype(np.int64)
+        result=np.zeros(len(shots),dtype=window_dtype)
+        result["start"]=np.arange(len(shots))*window_seconds
+        result["shots"]=shots
+        result["hits"]=hits
+        with np.errstate(invalid="ignore",divide="ignore"):
+            result["hit_rate"]=np.where(shots>0,hits/np.maximum(shots,1),np.nan)
+        return result
+    def remove_chunks(self):
+        ' ' 'Removes the chunk files of the archive (the manifest is kept).' ' '
+        for index in range(len(self._chunk_rows)):
+            for name in self._dtype.names:
+                chunk_path(self._path,index,name).unlink(missing_ok=True)
+
+#######################################################################
+
+class TestArchive(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the engagement archive.
+    """
+    def setUp(self):
+        logging.disable(logging.INFO)
+        rng = np.random.default_rng(3)
+        n = 1000
+        self.records = np.zeros(n,dtype=archive_dtype)
+        self.records["battery"] = rng.integers(0,3,n)
+        self.records["sweep"] = np.arange(n)
+        self.records["sim_time"] = np.arange(n)*0.5
+        self.records["verdict"] = rng.integers(0,2,n)
+        self.records["shots"] = self.records["verdict"]*rng.integers(1,3,n)
+        self.records["hits"] = np.minimum(self.records["shots"],rng.integers(0,2,n))
+        self.records["fired"] = self.records["shots"]>0
+        self.records["hit"] = self.records["hits"]>0
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ArchiveWriter(tmpdir,chunk_rows=300,names=["a","b","c"],metadata=dict(seed=3)) as writer:
+                writer.append(self.records[:10])
+                writer.append(self.records[10:])
+                self.assertEqual(writer.nrows,len(self.records))
+            archive = Archive(tmpdir)
+            self.assertEqual(archive.chunk_rows,[300,300,300,100])
+            self.assertEqual(archive.names,["a","b","c"])
+            self.assertEqual(archive.metadata,dict(seed=3))
+            self.assertTrue(np.array_equal(archive.records(),self.records))
+            self.assertTrue(np.array_equal(archive.column("sim_time"),self.records["sim_time"]))
+            chunk = next(archive.chunks(["hits"]))
+            self.assertIsInstance(chunk["hits"],np.memmap)
+            self.assertEqual(list(chunk),["hits"])
+            with ArchiveWriter(tmpdir,chunk_rows=300,append=True) as writer:
+                writer.append(self.records[:5])
+            archive = Archive(tmpdir)
+            self.assertEqual(len(archive),len(self.records)+5)
+            self.assertEqual(archive.names,["a","b","c"])
+            ArchiveWriter(tmpdir,chunk_rows=300)
+            self.assertEqual(len(Archive(tmpdir)),0)
+            self.assertFalse(chunk_path(tmpdir,0,"hits").exists())
+            with self.assertRaises(ValueError):
+                Archive(Path(tmpdir)/"nonexistent")
+    def test_summaries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ArchiveWriter(tmpdir,chunk_rows=128,names=["a","b","c","d"]) as writer:
+                writer.append(self.records)
+            archive = Archive(tmpdir)
+            foe = self.records["verdict"]==events.EventKind.FOE
+            self.assertEqual(list(archive.foe_counts()),[np.count_nonzero(foe & (self.records["battery"]==i)) for i in range(4)])
+            windows = archive.hit_rate(60.)
+            self.assertEqual(len(windows),-(-len(self.records)*0.5//60))
+            for window in windows:
+                mask = (self.records["sim_time"]>=window["start"]) & (self.records["sim_time"]<window["start"]+60.)
+                self.assertEqual(window["shots"],self.records["shots"][mask].sum())
+                self.assertEqual(window["hits"],self.records["hits"][mask].sum())
+            self.assertEqual(windows["hits"].sum(),self.records["hits"].sum())
+            windows = archive.hit_rate(10.,battery=1)
+            mask = self.records["battery"]==1
+            self.assertEqual(windows["shots"].sum(),self.records["shots"][mask].sum())
+            summary = archive.summary(battery=2)
+            mask = self.records["battery"]==2
+            self.assertEqual(summary.sweeps,np.count_nonzero(mask))
+            self.assertEqual(summary.foes,np.count_nonzero(foe & mask))
+            self.assertEqual(summary.hits+summary.misses,self.records["shots"][mask].sum())
+            with self.assertRaises(ValueError):
+                archive.hit_rate(0)
+    def test_sink(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = pads.read_config("hex_low_pk.json")
+            records = []
+            with ArchiveSink(tmpdir,chunk_rows=100,metadata=config) as sink:
+                summary = pads.simulation(config=config,clock_name="virtual",seed=7,sinks=[sink]).run(on_sweep=records.append)
+            archive = Archive(tmpdir)
+            self.assertEqual(archive.summary(),summary)
+            self.assertEqual(archive.metadata,config)
+            self.assertTrue(np.array_equal(archive.column("sweep"),[record.sweep for record in records]))
+            self.assertTrue(np.array_equal(archive.column("hit"),[record.hit for record in records]))
+            self.assertEqual(archive.foe_counts()[0],summary.foes)
+    def test_sink_windowed(self):
+        config = pads.read_config("hex_low_pk.json")
+        config["IFF"]["options"] = dict(config["IFF"].get("options",{}),window=4,stride=2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ArchiveSink(tmpdir) as sink:
+                summary = pads.simulation(config=config,clock_name="virtual",seed=7,sinks=[sink]).run()
+            archive = Archive(tmpdir)
+            self.assertEqual(archive.summary(),summary)
+            self.assertGreater(archive.column("shots").max(),1)
+    def test_timeline(self):
+        from airdefense import multibattery
+        batteries = multibattery.expand_batteries([dict(name="unit",count=2,**pads.read_config("multi_unit.json"))])
+        result = multibattery.run_batteries(batteries,nworkers=0,seed=11)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ArchiveWriter(tmpdir,names=result.names) as writer:
+                writer.append(result.timeline)
+            archive = Archive(tmpdir)
+            self.assertTrue(np.array_equal(archive.column("shots"),result.timeline["shots"]))
+            self.assertGreater(archive.column("shots").max(),1)
+            for ibattery,name in enumerate(result.names):
+                self.assertEqual(archive.summary(ibattery),result.summary(name))
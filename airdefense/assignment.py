@@ -0,0 +1,328 @@
+"""
+This module implements the weapon-target assignment stage of the air defense
+simulation, between the IFF and the firing units: the shots at the FOE
+contacts of a radar sweep (one contact per FOE sweep, or one per run of
+overlapping FOE sectors with a windowed IFF method) are allocated to a group
+of firing units, so as to maximize the expected number of kills, given the
+kill probability (Pk), the remaining magazine and the readiness of every unit.
+
+A config file with a group of firing units has a "FiringUnits" list instead of
+a "FiringUnit" section. Every entry has the "name" and "options" of a firing
+unit element, and optionally a "count" (default 1) of identical units, a
+"magazine" (number of rounds, 0=unlimited), a reload time "reload_seconds"
+(simulated time after a shot before the unit is ready again) and a "salvo"
+(maximum number of shots per sweep, default 1). The optional "assignment"
+section has the options of the FireControl, e.g.:
+
+    {
+        "FiringUnits": [
+            {"name": "PK", "options": {"Pk": 0.8}, "count": 4, "magazine": 16, "reload_seconds": 3.0},
+            {"name": "PK", "options": {"Pk": 0.5}, "count": 12, "salvo": 2}
+        ],
+        "assignment": {"max_shots_per_target": 2, "min_gain": 0.05}
+    }
+
+The assignment is solved greedily on the marginal expected kills: every step
+assigns the shot with the largest increase in the expected number of kills,
+value(target)*survival(target)*Pk(unit,target), and only updates the column
+of the assigned target (and the row of a unit that runs out of capacity) of
+the vectorized gain matrix. With kill probabilities that only depend on the
+unit, as for the firing units in this package, the greedy assignment is
+optimal.
+
+A shot is only assigned if its marginal expected kill value is larger than
+min_gain (default 0). Therefore a unit with a kill probability of zero, e.g. a
+"FAIL" unit, never fires as part of a group, and produces no MISS events,
+whereas a single "FAIL" firing unit (in a "FiringUnit" section) fires at every
+FOE and misses.
+"""
+
+import numpy as np
+import unittest
+from airdefense import FiringUnit
+import logging
+logger=logging.getLogger(__name__)
+
+def greedy_assignment(pk,capacity,value=None,max_shots_per_target:int=1,min_gain:float=0.):
+    """
+    Assigns shots of firing units to targets, greedily on the marginal expected kills.
+
+    Parameters:
+        pk: kill probabilities of a shot of every unit at every target, array with shape (nunits,ntargets).
+        capacity: number of shots that every unit can fire, array with nunits values.
+        value: value of a kill of every target (default: 1 for every target).
+        max_shots_per_target(int): maximum number of shots at one target.
+        min_gain(float): shots with a marginal expected kill value of at most min_gain are not assigned.
+
+    Returns:
+        tuple with two integer arrays: the unit and target index of every assigned shot, in the
+        order of assignment (decreasing marginal gain).
+    """
+    if max_shots_per_target<1:
+        raise ValueError(f"max_shots_per_target should be positive, not {max_shots_per_target}")
+    pk=np.asarray(pk,dtype=np.float64)
+    nunits,ntargets=pk.shape
+    capacity=np.array(capacity,dtype=np.int64)
+    value=np.ones(ntargets) if value is None else np.asarray(value,dtype=np.float64)
+    survival=np.ones(ntargets)
+    nshots=np.zeros(ntargets,dtype=np.int64)
+    gain=pk*value
+    gain[capacity<=0,:]=-np.inf
+    units=[]
+    targets=[]
+    for _ in range(min(int(np.maximum(capacity,0).sum()),ntargets*max_shots_per_target)):
+        unit,target=divmod(int(np.argmax(gain)),ntargets)
+        if not gain[unit,target]>min_gain:
+            break
+        units.append(unit)
+        targets.append(target)
+        survival[target]*=1-pk[unit,target]
+        nshots[target]+=1
+        capacity[unit]-=1
+        if nshots[target]<max_shots_per_target:
+            gain[:,target]=np.where(capacity>0,value[target]*survival[target]*pk[:,target],-np.inf)
+        else:
+            gain[:,target]=-np.inf
+        if capacity[unit]==0:
+            gain[unit,:]=-np.inf
+    return np.array(units,dtype=np.intp),np.array(targets,dtype=np.intp)
+
+def expected_kills(pk,units,targets,value=None):
+    """
+    Computes the expected (value of the) kills of an assignment of shots.
+
+    Parameters:
+        pk: kill probabilities, array with shape (nunits,ntargets).
+        units, targets: unit and target index of every shot, e.g. from greedy_assignment.
+        value: value of a kill of every target (default: 1 for every target).
+    """
+    pk=np.asarray(pk,dtype=np.float64)
+    survival=np.ones(pk.shape[1])
+    np.multiply.at(survival,targets,1-pk[units,targets])
+    value=np.ones(pk.shape[1]) if value is None else np.asarray(value,dtype=np.float64)
+    return float(np.sum(value*(1-survival)))
+
+class FireControl:
+    """
+    Group of firing units with their magazines and readiness, which assigns the
+    shots at the FOE contacts of a sweep to the units (see greedy_assignment).
+    """
+    def __init__(self,units:list,magazines:list=None,reload_seconds:list=None,salvos:list=None,
+                 max_shots_per_target:int=1,min_gain:float=0.):
+        """
+        Initializes a FireControl object.
+
+        Parameters:
+            units(list): firing unit elements, with a Pk property.
+            magazines(list): number of rounds of every unit (0=unlimited, default: unlimited).
+            reload_seconds(list): simulated time after a shot before every unit is ready again (default: 0).
+            salvos(list): maximum number of shots of every unit per sweep (default: 1).
+            max_shots_per_target(int): maximum number of shots at one contact per sweep.
+            min_gain(float): shots with a marginal expected kill of at most min_gain are not assigned.
+        """
+        nunits = len(units)
+        missing = [type(unit).__name__ for unit in units if not hasattr(unit,"Pk")]
+        if missing:
+            raise ValueError(f"firing units without a Pk property cannot be assigned: {missing}")
+        if max_shots_per_target<1:
+            raise ValueError(f"max_shots_per_target should be positive, not {max_shots_per_target}")
+        self._units = list(units)
+        self._pk = np.array([unit.Pk for unit in units],dtype=np.float64)
+        magazines = np.zeros(nunits,dtype=np.int64) if magazines is None else np.array(magazines,dtype=np.int64)
+        self._rounds = np.where(magazines>0,magazines,-1)
+        self._reload = np.zeros(nunits) if reload_seconds is None else np.array(reload_seconds,dtype=np.float64)
+        self._salvos = np.ones(nunits,dtype=np.int64) if salvos is None else np.array(salvos,dtype=np.int64)
+        self._ready_at = np.full(nunits,-np.inf)
+        self._max_shots_per_target = max_shots_per_target
+        self._min_gain = min_gain
+        self._shots = np.zeros(nunits,dtype=np.int64)
+        self._ncontacts = 0
+        self._nengaged = 0
+    @property
+    def units(self):
+        ' ' 'List of firing unit elements.' ' '
+        return self._units
+    @property
+    def Pk(self):
+        ' ' 'Array with the kill probability of every unit.' ' '
+        return self._pk
+    @property
+    def rounds(self):
+        ' ' 'Array with the remaining rounds of every unit (-1=unlimited).' ' '
+        return self._rounds
+    @property
+    def shots(self):
+        ' ' 'Array with the number of assigned shots of every unit.' ' '
+        return self._shots
+    def wrap_units(self,wrapper):
+        ' ' 'Replaces every firing unit by wrapper(unit), e.g. for profiling.' ' '
+        self._units = [wrapper(unit) for unit in self._units]
+    def capacity(self,sim_time:float):
+        ' ' 'Returns an array with the number of shots that every unit can fire at the given simulated time.' ' '
+        salvos=np.where(self._rounds<0,self._salvos,np.minimum(self._salvos,self._rounds))
+        return np.where(self._ready_at<=sim_time,salvos,0)
+    def assign(self,ncontacts:int,sim_time:float,value=None):
+        """
+        Assigns shots at the contacts of a sweep to the units that are ready,
+        and books the shots (rounds and reload times) for those units.
+
+        Parameters:
+            ncontacts(int): number of FOE contacts.
+            sim_time(float): simulated time of the sweep [seconds].
+            value: value of a kill of every contact (default: 1 for every contact).
+
+        Returns:
+            tuple with two integer arrays: the unit and contact index of every shot.
+        """
+        pk=np.broadcast_to(self._pk[:,None],(len(self._units),ncontacts))
+        units,targets=greedy_assignment(pk,self.capacity(sim_time),value,self._max_shots_per_target,self._min_gain)
+        fired=np.bincount(units,minlength=len(self._units))
+        self._shots+=fired
+        self._rounds=np.where(self._rounds<0,self._rounds,self._rounds-fired)
+        self._ready_at=np.where(fired>0,sim_time+self._reload,self._ready_at)
+        self._ncontacts+=ncontacts
+        self._nengaged+=len(np.unique(targets))
+        return units,targets
+    def stats(self):
+        ' ' 'Returns a dict with the numbers of contacts, engaged contacts, shots and units without rounds.' ' '
+        return dict(contacts=self._ncontacts,engaged=self._nengaged,shots=int(self._shots.sum()),
+                    empty=int(np.count_nonzero(self._rounds==0)))
+
+def create_fire_control(entries:list,options:dict=None,seed=None):
+    """
+    Creates a FireControl with the firing units of a "FiringUnits" list.
+
+    Parameters:
+        entries(list): firing unit entries, see the module documentation.
+        options(dict): keyword arguments for the FireControl constructor (the "assignment" section).
+        seed: seed from which the seeds of the units are spawned (int or numpy SeedSequence, None=unpredictable).
+
+    Returns:
+        FireControl
+    """
+    specs=[entry for entry in entries for _ in range(entry.get("count",1))]
+    if not specs:
+        raise ValueError("a FiringUnits list should have at least one firing unit")
+    seeds=[None]*len(specs)
+    if seed is not None:
+        seeds=(seed if isinstance(seed,np.random.SeedSequence) else np.random.SeedSequence(seed)).spawn(len(specs))
+    units=[FiringUnit.get_element(name=spec["name"],options=dict(spec.get("options",dict()),seed=unit_seed))
+           for spec,unit_seed in zip(specs,seeds)]
+    return FireControl(units,[spec.get("magazine",0) for spec in specs],[spec.get("reload_seconds",0.) for spec in specs],
+                       [spec.get("salvo",1) for spec in specs],**(options or dict()))
+
+#######################################################################
+
+class TestAssignment(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the weapon-target assignment.
+    """
+    def setUp(self):
+        logging.disable(logging.INFO)
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+    def test_greedy(self):
+        pk = np.array([[0.9,0.5],[0.6,0.6],[0.3,0.8]])
+        units, targets = greedy_assignment(pk,[1,1,1])
+        self.assertEqual(sorted(zip(units.tolist(),targets.tolist())),[(0,0),(2,1)])
+        units, targets = greedy_assignment(pk,[1,1,1],max_shots_per_target=2)
+        self.assertEqual(len(units),3)
+        self.assertEqual(np.bincount(units).tolist(),[1,1,1])
+        units, targets = greedy_assignment(pk,[2,0,0],max_shots_per_target=2)
+        self.assertEqual(units.tolist(),[0,0])
+        self.assertEqual(targets.tolist(),[0,1])
+        units, targets = greedy_assignment(pk,[1,1,1],value=[0.,1.])
+        self.assertEqual(targets.tolist(),[1])
+        units, targets = greedy_assignment(pk,[3,3,3],max_shots_per_target=3,min_gain=0.05)
+        self.assertTrue(np.all(pk[units,targets]>0))
+        self.assertLess(len(units),6)
+        self.assertEqual(len(greedy_assignment(np.zeros((4,0)),[1]*4)[0]),0)
+        self.assertEqual(len(greedy_assignment(np.zeros((0,4)),[])[0]),0)
+        with self.assertRaises(ValueError):
+            greedy_assignment(pk,[1,1,1],max_shots_per_target=0)
+    def test_optimal(self):
+        # with kill probabilities per unit, greedy is optimal: compare with exhaustive search
+        import itertools
+        rng = np.random.default_rng(1)
+        for _ in range(20):
+            nunits, ntargets = rng.integers(1,4), rng.integers(1,4)
+            pk = np.broadcast_to(rng.random(nunits)[:,None],(nunits,ntargets))
+            units, targets = greedy_assignment(pk,[1]*nunits,max_shots_per_target=2)
+            best = 0.
+            for choice in itertools.product(range(ntargets+1),repeat=nunits):
+                shots = [(unit,target) for unit,target in enumerate(choice) if target<ntargets]
+                if any(count>2 for count in np.bincount([target for _,target in shots],minlength=ntargets)):
+                    continue
+                best = max(best,expected_kills(pk,[unit for unit,_ in shots],[target for _,target in shots]))
+            self.assertAlmostEqual(expected_kills(pk,units,targets),best)
+    def test_scale(self):
+        rng = np.random.default_rng(2)
+        pk = rng.random((40,500))
+        capacity = rng.integers(0,3,40)
+        units, targets = greedy_assignment(pk,capacity)
+        self.assertEqual(len(set(targets.tolist())),len(targets))
+        self.assertEqual(len(targets),min(int(capacity.sum()),500))
+        self.assertTrue(np.all(np.bincount(units,minlength=40)<=capacity))
+        units, targets = greedy_assignment(pk[:,:20],capacity)
+        self.assertEqual(len(targets),20)
+    def test_fire_control(self):
+        units = [FiringUnit.PkFiringUnit(Pk=0.9,seed=1),FiringUnit.PkFiringUnit(Pk=0.5,seed=2),FiringUnit.FailingFiringUnit()]
+        control = FireControl(units,magazines=[2,0,0],reload_seconds=[2.,0.,0.],salvos=[1,2,1])
+        self.assertEqual(control.capacity(0.).tolist(),[1,2,1])
+        units, targets = control.assign(5,0.)
+        self.assertEqual(np.bincount(units,minlength=3).tolist(),[1,2,0])
+        self.assertEqual(control.rounds.tolist(),[1,-1,-1])
+        self.assertEqual(control.capacity(1.).tolist(),[0,2,1])
+        units, targets = control.assign(1,1.)
+        self.assertEqual(units.tolist(),[1])
+        control.assign(1,2.)
+        control.assign(1,4.)
+        self.assertEqual(control.rounds[0],0)
+        self.assertEqual(control.capacity(10.).tolist(),[0,2,1])
+        self.assertEqual(control.stats(),dict(contacts=8,engaged=6,shots=6,empty=1))
+        with self.assertRaises(ValueError):
+            FireControl([object()])
+    def test_create(self):
+        entries = [dict(name="PK",options=dict(Pk=0.7),count=3,magazine=4),dict(name="FAIL",reload_seconds=5.)]
+        control = create_fire_control(entries,dict(max_shots_per_target=2),seed=42)
+        self.assertEqual(len(control.units),4)
+        self.assertEqual(control.Pk.tolist(),[0.7,0.7,0.7,0.])
+        self.assertEqual(control.rounds.tolist(),[4,4,4,-1])
+        again = create_fire_control(entries,seed=42)
+        self.assertEqual([unit.fire() for unit in control.units[:3]],[unit.fire() for unit in again.units[:3]])
+        with self.assertRaises(ValueError):
+            create_fire_control([])
+    def test_simulation(self):
+        from airdefense import pads
+        config = pads.read_config("multi_unit.json")
+        records = []
+        sim = pads.simulation(config=config,clock_name="virtual",seed=3,sinks=[],profile=True)
+        summary = sim.run(on_sweep=records.append)
+        stats = sim.fire_control.stats()
+        self.assertEqual(summary.hits+summary.misses,stats["shots"])
+        self.assertEqual(sim.stats["fire"].count,stats["shots"])
+        self.assertLessEqual(stats["shots"],sum(entry["count"]*entry["magazine"] for entry in config["FiringUnits"]))
+        salvos = sum(entry["count"]*entry.get("salvo",1) for entry in config["FiringUnits"])
+        self.assertTrue(all(len(record.sectors)<=salvos for record in records if record.sectors is not None))
+        self.assertEqual(sum(record.fired for record in records),sum(1 for record in records if record.sectors))
+        self.assertEqual(sum(record.shots for record in records),stats["shots"])
+        self.assertEqual(sum(record.hits for record in records),summary.hits)
+        again = pads.simulation(config=config,clock_name="virtual",seed=3,sinks=[]).run_pipelined()
+        self.assertEqual(again,summary)
+        config = dict(pads.read_config("hex_low_pk.json"),FiringUnits=[dict(name="PK",options=dict(Pk=0.4),magazine=5)])
+        del config["FiringUnit"]
+        summary = pads.simulation(config=config,clock_name="virtual",seed=3,sinks=[]).run()
+        self.assertEqual(summary.hits+summary.misses,min(5,summary.foes))
+        # a unit with Pk=0 does not fire in a group, but a single FAIL unit fires (and misses) at every FOE
+        config["FiringUnits"] = [dict(name="FAIL")]
+        summary = pads.simulation(config=config,clock_name="virtual",seed=3,sinks=[]).run()
+        self.assertGreater(summary.foes,0)
+        self.assertEqual((summary.hits,summary.misses),(0,0))
+        single = dict(config,FiringUnit=dict(name="FAIL"))
+        del single["FiringUnits"]
+        summary = pads.simulation(config=single,clock_name="virtual",seed=3,sinks=[]).run()
+        self.assertEqual((summary.hits,summary.misses),(0,summary.foes))
+        config["FiringUnits"] = [dict(name="PK",options=dict(Pk=0.4),magazine=5)]
+        from airdefense import multibattery
+        result = multibattery.run_batteries(multibattery.expand_batteries([dict(config,count=2)]),nworkers=0,seed=1)
+        self.assertEqual(int(np.count_nonzero(result.timeline["fired"])),10)
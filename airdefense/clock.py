@@ -0,0 +1,185 @@
+"""
+This module provides the clocks that determine the pacing of a simulation.
+
+A clock implementation should have a start method, to be called at the start
+of the simulation, a time method that returns the simulated time (in seconds
+since the start), and a wait method that waits until the start of a given time
+step (the number of steps since the start).
+
+The real time clock paces the simulation to the wall clock. Steps that take
+longer than the time step are not fatal: they are recorded as deadline misses,
+and the simulation continues without sleeping. The virtual clock does not wait
+at all, so that a simulation runs as fast as possible, while the simulated time
+still advances by one time step per step.
+"""
+
+import time
+import unittest
+from airdefense import registry
+import logging
+logger=logging.getLogger(__name__)
+
+class RealTimeClock:
+    """
+    Clock that paces the simulation steps to the wall clock, keeping track of
+    deadline misses (steps that ended after the start of the next step) and
+    jitter (how late the wait method returns after the target time).
+    """
+    short_name="realtime"
+    def __init__(self,time_step_seconds:float=1.0):
+        """
+        Initializes a RealTimeClock object.
+
+        Parameters:
+            time_step_seconds(float): duration of one simulation step [seconds].
+        """
+        self._time_step_seconds = time_step_seconds
+        self.start()
+    @property
+    def time_step_seconds(self):
+        ' ' 'Duration of one simulation step [seconds].' ' '
+        return self._time_step_seconds
+    @property
+    def deadline_misses(self):
+        ' ' 'Number of steps that overran the start time of the next step.' ' '
+        return self._deadline_misses
+    @property
+    def max_lateness(self):
+        ' ' 'Largest overrun of a deadline [seconds].' ' '
+        return self._max_lateness
+    @property
+    def mean_jitter(self):
+        ' ' 'Average delay of the end of a wait with respect to the target time [seconds].' ' '
+        return self._sum_jitter/self._nwaits if self._nwaits>0 else 0.
+    @property
+    def max_jitter(self):
+        ' ' 'Largest delay of the end of a wait with respect to the target time [seconds].' ' '
+        return self._max_jitter
+    def start(self):
+        ' ' 'Sets the start time of the simulation to now and resets the statistics.' ' '
+        self._start = time.monotonic()
+        self._deadline_misses = 0
+        self._max_lateness = 0.
+        self._nwaits = 0
+        self._sum_jitter = 0.
+        self._max_jitter = 0.
+    def time(self):
+        ' ' 'Simulated time, i.e. wall clock time since the start [seconds].' ' '
+        return time.monotonic()-self._start
+    def wait(self,step:int):
+        """
+        Waits until the start of the given simulation step. If that time has
+        already passed, a deadline miss is recorded and there is no waiting.
+
+        Parameters:
+            step(int): number of time steps since the start.
+
+        Returns:
+            slack, i.e. the time left before the deadline [seconds] (negative in case of a deadline miss).
+        """
+        target = self._start+step*self._time_step_seconds
+        slack = target-time.monotonic()
+        if slack<0:
+            self._deadline_misses += 1
+            self._max_lateness = max(self._max_lateness,-slack)
+            logger.debug(f"deadline miss for step {step}: {-slack:.6f} seconds late")
+            return slack
+        time.sleep(slack)
+        jitter = time.monotonic()-target
+        self._nwaits += 1
+        self._sum_jitter += jitter
+        self._max_jitter = max(self._max_jitter,jitter)
+        return slack
+
+class VirtualClock:
+    """
+    Clock for running a simulation as fast as possible. The simulated time is
+    advanced by one time step per simulation step, without any waiting.
+    """
+    short_name="virtual"
+    def __init__(self,time_step_seconds:float=1.0):
+        """
+        Initializes a VirtualClock object.
+
+        Parameters:
+            time_step_seconds(float): duration of one simulation step [seconds].
+        """
+        self._time_step_seconds = time_step_seconds
+        self.start()
+    @property
+    def time_step_seconds(self):
+        ' ' 'Duration of one simulation step [seconds].' ' '
+        return self._time_step_seconds
+    @property
+    def deadline_misses(self):
+        ' ' 'Number of deadline misses, always zero for a virtual clock.' ' '
+        return 0
+    def start(self):
+        ' ' 'Sets the simulated time to zero.' ' '
+        self._step = 0
+    def time(self):
+        ' ' 'Simulated time since the start [seconds].' ' '
+        return self._step*self._time_step_seconds
+    def wait(self,step:int):
+        """
+        Advances the simulated time to the start of the given simulation step.
+
+        Parameters:
+            step(int): number of time steps since the start.
+
+        Returns:
+            slack, which is always zero for a virtual clock.
+        """
+        self._step = step
+        return 0.
+
+def get_names():
+    ' ' 'Returns list of short names of clock implementations (see the registry module).' ' '
+    return registry.get_names("clock")
+
+def get_element(name:str=RealTimeClock.short_name,options:dict={}):
+    """
+    Factory function to create a clock.
+
+    Parameters:
+        name(str): should be the short name of a clock implementation.
+        options(dict): keyword arguments to be forwarded to the clock constructor
+
+    Returns:
+        Clock of the specified kind
+    """
+    return registry.get_implementation("clock",name)(**options)
+
+#######################################################################
+
+class TestRealTimeClock(unittest.TestCase):
+    def test_pacing(self):
+        clock = RealTimeClock(time_step_seconds=0.01)
+        clock.start()
+        for step in range(1,6):
+            self.assertGreaterEqual(clock.wait(step),0.)
+            self.assertGreaterEqual(clock.time(),step*0.01)
+        self.assertEqual(clock.deadline_misses,0)
+        self.assertGreaterEqual(clock.max_jitter,clock.mean_jitter)
+    def test_deadline_miss(self):
+        clock = RealTimeClock(time_step_seconds=0.001)
+        clock.start()
+        time.sleep(0.01)
+        self.assertLess(clock.wait(1),0.)
+        self.assertEqual(clock.deadline_misses,1)
+        self.assertGreater(clock.max_lateness,0.005)
+        clock.start()
+        self.assertEqual(clock.deadline_misses,0)
+
+class TestVirtualClock(unittest.TestCase):
+    def test_no_waiting(self):
+        clock = get_element("virtual",dict(time_step_seconds=1000.))
+        wall_start = time.monotonic()
+        for step in range(1,101):
+            self.assertEqual(clock.wait(step),0.)
+            self.assertEqual(clock.time(),step*1000.)
+        self.assertLess(time.monotonic()-wall_start,1.)
+        self.assertEqual(clock.deadline_misses,0)
+    def test_unknown(self):
+        with self.assertRaises(RuntimeError):
+            get_element("sundial")
@@ -0,0 +1,285 @@
+"""
+This module provides the event records that are produced by the simulation,
+and sinks that consume them. The simulation emits a typed event record (FRIEND,
+FOE, HIT or MISS) for every sweep verdict and firing outcome, without any
+string formatting. What happens with the events is up to the sinks:
+
+* RingBufferSink keeps the most recent events in memory, in a numpy structured array.
+* JsonlSink writes the events as JSON lines to a file.
+* BinarySink writes the events as fixed size binary records to a file (see read_binary).
+* LoggingSink formats the events as log messages, e.g. for the console.
+
+The file sinks do the formatting and writing on a background thread, in
+batches, so that emitting an event only costs appending it to a queue.
+
+A sink implementation should have an emit method that takes an Event, a flush
+method that makes sure that all emitted events have been processed, and a close
+method that flushes and releases any resources.
+"""
+
+import numpy as np
+import json
+import threading
+from collections import deque, namedtuple
+from enum import IntEnum
+import tempfile
+import unittest
+from pathlib import Path
+import logging
+logger=logging.getLogger(__name__)
+
+class EventKind(IntEnum):
+    """
+    The kinds of events. FRIEND and FOE have the same values as the
+    corresponding IFF verdicts.
+    """
+    FRIEND = 0
+    FOE = 1
+    HIT = 2
+    MISS = 3
+
+Event = namedtuple("Event",["kind","battery","sweep","sim_time"])
+Event.__doc__ = "Event record: kind (EventKind value), battery id, sweep number and simulated time [seconds]."
+
+event_dtype = np.dtype([("kind",np.uint8),("battery",np.int32),("sweep",np.int64),("sim_time",np.float64)])
+
+binary_magic = b"ADEVT\x00\x01\x00"
+
+class RingBufferSink:
+    """
+    Keeps the most recent events (up to a fixed capacity) in memory.
+    """
+    def __init__(self,capacity:int=65536):
+        """
+        Initializes a RingBufferSink object.
+
+        Parameters:
+            capacity(int): maximum number of events to keep.
+        """
+        self._data = np.zeros(capacity,dtype=event_dtype)
+        self._nemitted = 0
+    @property
+    def nemitted(self):
+        ' ' 'Total number of events emitted to this sink.' ' '
+        return self._nemitted
+    @property
+    def noverwritten(self):
+        ' ' 'Number of events that were overwritten by newer events.' ' '
+        return max(0,self._nemitted-len(self._data))
+    def emit(self,event):
+        self._data[self._nemitted%len(self._data)] = event
+        self._nemitted += 1
+    def events(self):
+        ' ' 'Returns the kept events, oldest first, as a structured numpy array (event_dtype).' ' '
+        first = self._nemitted%len(self._data)
+        if self._nemitted<=len(self._data):
+            return self._data[:self._nemitted].copy()
+        return np.concatenate([self._data[first:],self._data[:first]])
+    def flush(self):
+        pass
+    def close(self):
+        pass
+
+class LoggingSink:
+    """
+    Formats events as log messages, like "[t=3.000s] FOE", or with the battery
+    id, like "[t=3.000s] battery 0 FOE".
+    """
+    def __init__(self,log=None,level:int=logging.INFO,show_battery:bool=False):
+        """
+        Initializes a LoggingSink object.
+
+        Parameters:
+            log: logger to use (default: the logger of the pads module).
+            level(int): log level of the messages.
+            show_battery(bool): whether to include the battery id in the messages (e.g. for multiple batteries).
+        """
+        self._logger = logging.getLogger("airdefense.pads") if log is None else log
+        self._level = level
+        self._show_battery = show_battery
+    def emit(self,event):
+        if self._logger.isEnabledFor(self._level):
+            battery = f" battery {event.battery}" if self._show_battery else ""
+            self._logger.log(self._level,f"[t={event.sim_time:.3f}s]{battery} {EventKind(event.kind).name}")
+    def flush(self):
+        pass
+    def close(self):
+        pass
+
+class _BackgroundFileSink:
+    """
+    Base class for sinks that write events to a file in batches, on a background thread.
+    Derived classes implement _open and _write_batch.
+    """
+    def __init__(self,path,batch_size:int=4096,flush_interval:float=0.5):
+        self._path = Path(path)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending = deque()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._fp = self._open(self._path)
+        self._thread = threading.Thread(target=self._run,name=f"event writer {self._path.name}",daemon=True)
+        self._thread.start()
+    def emit(self,event):
+        self._pending.append(event)
+        if len(self._pending)>=self._batch_size:
+            self._wakeup.set()
+    def flush(self):
+        ' ' 'Writes all pending events to the file.' ' '
+        with self._write_lock:
+            self._write_pending()
+            self._fp.flush()
+    def close(self):
+        ' ' 'Writes all pending events, stops the background thread and closes the file.' ' '
+        if self._closing:
+            return
+        self._closing = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        self._fp.close()
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        self.close()
+    # implementation details
+    def _run(self):
+        while not self._closing:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            with self._write_lock:
+                self._write_pending()
+    def _write_pending(self):
+        n = len(self._pending)
+        if n>0:
+            self._write_batch([self._pending.popleft() for _ in range(n)])
+
+class JsonlSink(_BackgroundFileSink):
+    """
+    Writes events as JSON lines, e.g. {"kind": "FOE", "battery": 0, "sweep": 3, "sim_time": 3.0}
+    """
+    def __init__(self,path,batch_size:int=4096,flush_interval:float=0.5):
+        """
+        Initializes a JsonlSink object.
+
+        Parameters:
+            path: path of the output file (overwritten if it exists).
+            batch_size(int): number of pending events that triggers a write.
+            flush_interval(float): maximum time between writes [seconds].
+        """
+        super().__init__(path,batch_size,flush_interval)
+    def _open(self,path):
+        return open(path,"w")
+    def _write_batch(self,batch):
+        names = [kind.name for kind in EventKind]
+        self._fp.write("".join(json.dumps(dict(kind=names[kind],battery=battery,sweep=sweep,sim_time=sim_time))+"\n"
+                               for kind,battery,sweep,sim_time in batch))
+
+class BinarySink(_BackgroundFileSink):
+    """
+    Writes events as fixed size binary records (event_dtype), after a short header.
+    """
+    def __init__(self,path,batch_size:int=4096,flush_interval:float=0.5):
+        """
+        Initializes a BinarySink object.
+
+        Parameters:
+            path: path of the output file (overwritten if it exists).
+            batch_size(int): number of pending events that triggers a write.
+            flush_interval(float): maximum time between writes [seconds].
+        """
+        super().__init__(path,batch_size,flush_interval)
+    def _open(self,path):
+        fp = open(path,"wb")
+        fp.write(binary_magic)
+        return fp
+    def _write_batch(self,batch):
+        self._fp.write(np.array(batch,dtype=event_dtype).tobytes())
+
+def read_binary(path):
+    """
+    Reads a binary event log written by a BinarySink.
+
+    Returns:
+        structured numpy array (event_dtype) with the events.
+    """
+    with open(path,"rb") as fp:
+        if fp.read(len(binary_magic))!=binary_magic:
+            raise ValueError(f"{path} is not a binary event log")
+        return np.frombuffer(fp.read(),dtype=event_dtype)
+
+def open_sink(path):
+    ' ' 'Creates a file sink for the given path: binary for a ".bin" suffix, JSON lines otherwise.' ' '
+    return BinarySink(path) if Path(path).suffix==".bin" else JsonlSink(path)
+
+#######################################################################
+
+class TestSinks(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the event sinks.
+    """
+    def setUp(self):
+        self.events = [Event(EventKind.FOE,1,i,float(i)) if i%3 else Event(EventKind.FRIEND,0,i,float(i)) for i in range(10000)]
+    def test_ring_buffer(self):
+        sink = RingBufferSink(capacity=100)
+        for event in self.events[:50]:
+            sink.emit(event)
+        self.assertEqual(len(sink.events()),50)
+        for event in self.events[50:]:
+            sink.emit(event)
+        kept = sink.events()
+        self.assertEqual(len(kept),100)
+        self.assertEqual(sink.noverwritten,len(self.events)-100)
+        self.assertTrue(np.array_equal(kept["sweep"],np.arange(len(self.events)-100,len(self.events))))
+    def test_binary(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "events.bin"
+            with open_sink(path) as sink:
+                for event in self.events:
+                    sink.emit(event)
+            data = read_binary(path)
+            self.assertEqual(len(data),len(self.events))
+            self.assertTrue(np.array_equal(data,np.array(self.events,dtype=event_dtype)))
+            with self.assertRaises(ValueError):
+                read_binary(Path(__file__))
+    def test_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "events.jsonl"
+            sink = open_sink(path)
+            sink.emit(self.events[0])
+            sink.flush()
+            self.assertEqual(len(path.read_text().splitlines()),1)
+            for event in self.events[1:]:
+                sink.emit(event)
+            sink.close()
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+            self.assertEqual(len(records),len(self.events))
+            self.assertEqual(records[1],dict(kind="FOE",battery=1,sweep=1,sim_time=1.0))
+    def test_failed_run(self):
+        # the events that were emitted before a run fails are flushed to the sinks
+        from airdefense import pads
+        def fail(record):
+            if record.sweep==5:
+                raise KeyboardInterrupt
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "events.jsonl"
+            sink = JsonlSink(path,batch_size=1<<20,flush_interval=60.)
+            sim = pads.simulation(clock_name="virtual",seed=1,sinks=[sink])
+            logging.disable(logging.INFO)
+            try:
+                with self.assertRaises(KeyboardInterrupt):
+                    sim.run(on_sweep=fail)
+            finally:
+                logging.disable(logging.NOTSET)
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+            self.assertEqual(records[-1]["sweep"],5)
+            sink.close()
+    def test_logging(self):
+        with self.assertLogs("airdefense.pads",level="INFO") as logs:
+            LoggingSink().emit(Event(EventKind.HIT,0,3,3.0))
+        self.assertTrue(logs.output[0].endswith("[t=3.000s] HIT"))
+        with self.assertLogs("airdefense.pads",level="INFO") as logs:
+            LoggingSink(show_battery=True).emit(Event(EventKind.FOE,0,3,3.0))
+        self.assertTrue(logs.output[0].endswith("[t=3.000s] battery 0 FOE"))
@@ -0,0 +1,165 @@
+"""
+This module implements a Monte Carlo driver for the air defense simulation.
+A scenario (config file) is replayed many times, with the virtual clock, on a
+pool of worker processes. Each replica gets its own independent random number
+stream, spawned from a single seed, so that the complete set of replicas is
+reproducible, independent of the number of worker processes.
+"""
+
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import unittest
+from airdefense import pads, clock
+import logging
+logger=logging.getLogger(__name__)
+
+def wilson_interval(nsuccess:int,ntrials:int,confidence:float=0.95):
+    """
+    Computes the Wilson score confidence interval for a binomial proportion.
+
+    Parameters:
+        nsuccess(int): number of successes
+        ntrials(int): number of trials
+        confidence(float): confidence level, e.g. 0.95
+
+    Returns:
+        tuple with the lower and upper bound (nan, nan if there are no trials).
+    """
+    if ntrials==0:
+        return (float("nan"),float("nan"))
+    z=NormalDist().inv_cdf(0.5+confidence/2)
+    p=nsuccess/ntrials
+    denom=1+z**2/ntrials
+    center=(p+z**2/(2*ntrials))/denom
+    halfwidth=z*np.sqrt(p*(1-p)/ntrials+z**2/(4*ntrials**2))/denom
+    return (max(0.,center-halfwidth),min(1.,center+halfwidth))
+
+class MonteCarloResult:
+    """
+    Results of a Monte Carlo run: the run summary of every replica, and
+    statistics derived from those.
+    """
+    def __init__(self,summaries):
+        """
+        Initializes a MonteCarloResult object.
+
+        Parameters:
+            summaries(list): RunSummary of every replica.
+        """
+        self._summaries = list(summaries)
+        self._hits = np.array([summary.hits for summary in self._summaries],dtype=np.int64)
+        self._shots = np.array([summary.hits+summary.misses for summary in self._summaries],dtype=np.int64)
+    @property
+    def nreplicas(self):
+        ' ' 'Number of replicas.' ' '
+        return len(self._summaries)
+    @property
+    def summaries(self):
+        ' ' 'List with the run summary of every replica.' ' '
+        return self._summaries
+    @property
+    def hits(self):
+        ' ' 'Array with the number of hits of every replica.' ' '
+        return self._hits
+    @property
+    def shots(self):
+        ' ' 'Array with the number of shots of every replica.' ' '
+        return self._shots
+    @property
+    def hit_rate(self):
+        ' ' 'Fraction of all shots (of all replicas) that were hits.' ' '
+        nshots=self._shots.sum()
+        return self._hits.sum()/nshots if nshots>0 else float("nan")
+    def hit_rate_interval(self,confidence:float=0.95):
+        ' ' 'Wilson confidence interval of the hit rate.' ' '
+        return wilson_interval(int(self._hits.sum()),int(self._shots.sum()),confidence)
+    def mean_hits_interval(self,confidence:float=0.95):
+        ' ' 'Mean and normal approximation confidence interval of the number of hits per replica.' ' '
+        mean=self._hits.mean()
+        if self.nreplicas<2:
+            return mean,(float("nan"),float("nan"))
+        z=NormalDist().inv_cdf(0.5+confidence/2)
+        halfwidth=z*self._hits.std(ddof=1)/np.sqrt(self.nreplicas)
+        return mean,(mean-halfwidth,mean+halfwidth)
+    def report(self,confidence:float=0.95):
+        ' ' 'Returns a multi line text report of the hit statistics.' ' '
+        low,high=self.hit_rate_interval(confidence)
+        mean,(mlow,mhigh)=self.mean_hits_interval(confidence)
+        return "\n".join([
+            f"replicas: {self.nreplicas}",
+            f"shots: {self._shots.sum()} (mean {self._shots.mean():.3f} per replica)",
+            f"hit rate: {self.hit_rate:.4f} ({100*confidence:g}% CI {low:.4f} - {high:.4f})",
+            f"hits per replica: {mean:.3f} ({100*confidence:g}% CI {mlow:.3f} - {mhigh:.3f})"])
+
+def run_replica(cnf_filename:str,seed,time_step_seconds:float=pads.simulation.default_step):
+    """
+    Runs one replica of a scenario with the virtual clock.
+
+    Parameters:
+        cnf_filename(str): config file name (in the config folder)
+        seed: seed for the random number generators of the replica (int or numpy SeedSequence)
+        time_step_seconds(float): simulated time step [seconds]
+
+    Returns:
+        RunSummary of the replica.
+    """
+    sim = pads.simulation(cnf_filename,time_step_seconds,clock_name=clock.VirtualClock.short_name,seed=seed,sinks=[])
+    return sim.run()
+
+def monte_carlo(cnf_filename:str=pads.simulation.default_config,nreplicas:int=100,seed=None,nworkers:int=None):
+    """
+    Replays a scenario nreplicas times, with independent random streams spawned from one seed.
+
+    Parameters:
+        cnf_filename(str): config file name (in the config folder)
+        nreplicas(int): number of replicas
+        seed: seed from which the seeds of the replicas are spawned (None=unpredictable)
+        nworkers(int): number of worker processes (None=number of CPUs, 0=run in this process)
+
+    Returns:
+        MonteCarloResult
+    """
+    seeds=np.random.SeedSequence(seed).spawn(nreplicas)
+    logger.info(f"running {nreplicas} replicas of {cnf_filename}")
+    if nworkers==0:
+        summaries=[run_replica(cnf_filename,s) for s in seeds]
+    else:
+        nworkers=nworkers or os.cpu_count() or 1
+        chunksize=max(1,nreplicas//(4*nworkers))
+        with ProcessPoolExecutor(max_workers=nworkers) as pool:
+            summaries=list(pool.map(run_replica,[cnf_filename]*nreplicas,seeds,chunksize=chunksize))
+    return MonteCarloResult(summaries)
+
+#######################################################################
+
+class TestMonteCarlo(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the Monte Carlo driver.
+    """
+    def setUp(self):
+        logging.disable(logging.INFO)
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+    def test_wilson(self):
+        low,high = wilson_interval(80,100)
+        self.assertTrue(low<0.8<high)
+        self.assertTrue(0.<=wilson_interval(0,10)[0]<wilson_interval(0,10)[1])
+        self.assertEqual(wilson_interval(10,10)[1],1.)
+        self.assertTrue(np.isnan(wilson_interval(0,0)[0]))
+    def test_reproducible(self):
+        serial = monte_carlo("default.json",nreplicas=20,seed=42,nworkers=0)
+        parallel = monte_carlo("default.json",nreplicas=20,seed=42,nworkers=2)
+        self.assertEqual(serial.nreplicas,20)
+        self.assertEqual(serial.summaries,parallel.summaries)
+        self.assertTrue(np.array_equal(serial.hits,parallel.hits))
+        self.assertTrue(np.any(serial.hits!=serial.hits[0]),msg="replicas should have different random streams")
+    def test_statistics(self):
+        result = monte_carlo("default.json",nreplicas=200,seed=1,nworkers=0)
+        low,high = result.hit_rate_interval(0.999)
+        self.assertTrue(low<0.8<high)
+        self.assertTrue(np.all(result.shots==result.shots[0]),msg="the default radar data are deterministic")
+        mean,(mlow,mhigh) = result.mean_hits_interval()
+        self.assertTrue(mlow<mean<mhigh)
+        self.assertIn("hit rate",result.report())
@@ -0,0 +1,294 @@
+"""
+This module implements the simulation of a group of patriot air defense
+systems (batteries), each with its own radar, IFF and firing unit.
+
+A multi battery config file has a "batteries" list. Each entry has the same
+"radar", "IFF" and "FiringUnit" sections as a single battery config file, an
+optional "name" and an optional "count" (default 1), which specifies how many
+identical batteries to create from the entry. Instead of a "FiringUnit", an
+entry can have a group of "FiringUnits" (see the assignment module). E.g.:
+
+    {
+        "batteries": [
+            {"name": "north", "count": 10, "radar": {...}, "IFF": {...}, "FiringUnit": {...}},
+            {"name": "south", "radar": {...}, "IFF": {...}, "FiringUnit": {...}}
+        ]
+    }
+
+The batteries are simulated with the virtual clock, on a pool of worker
+processes. The batteries are divided over the workers in shards of a fair
+share each, such that batteries with the same radar configuration end up in
+the same shard as much as possible: within a shard, batteries with the same
+radar configuration share one radar element. A recording that is used in more
+than one shard is decoded only once, in the calling process, and published to
+the workers in shared memory (see sweep.publish_radars). The per
+sweep results of all batteries are merged into a single timeline, sorted by
+simulated time.
+"""
+
+import numpy as np
+import json
+import inspect
+import os
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import unittest
+from airdefense import pads, radar, clock, IFF
+import logging
+logger=logging.getLogger(__name__)
+
+timeline_dtype = np.dtype([("battery",np.int32),("sweep",np.int64),("sim_time",np.float64),
+                           ("verdict",np.uint8),("fired",np.bool_),("hit",np.bool_),("shots",np.uint16),("hits",np.uint16)])
+
+def read_batteries(cnf_filename:str):
+    """
+    Reads a multi battery config file.
+
+    Parameters:
+        cnf_filename(str): file name of the json config file (in the config folder).
+
+    Returns:
+        list of battery configs (dicts with "name", "radar", "IFF" and "FiringUnit" or "FiringUnits").
+    """
+    config = pads.read_config(cnf_filename)
+    if "batteries" not in config:
+        raise RuntimeError(f"config file '{cnf_filename}' has no 'batteries' list")
+    return expand_batteries(config["batteries"])
+
+def expand_batteries(entries:list):
+    """
+    Expands the "count" of the entries of a "batteries" list into individual battery configs,
+    with unique names.
+    """
+    batteries=[]
+    for ientry,entry in enumerate(entries):
+        count=entry.get("count",1)
+        name=entry.get("name",f"battery{ientry}")
+        for icopy in range(count):
+            battery={key:entry[key] for key in ["radar","IFF","FiringUnit","FiringUnits","assignment"] if key in entry}
+            battery["name"]=name if count==1 else f"{name}-{icopy}"
+            batteries.append(battery)
+    names=[battery["name"] for battery in batteries]
+    if len(set(names))!=len(names):
+        raise RuntimeError("battery names should be unique")
+    return batteries
+
+def radar_key(battery:dict):
+    ' ' 'Returns a string that identifies the radar configuration of a battery.' ' '
+    return json.dumps(battery["radar"],sort_keys=True)
+
+def shard_batteries(batteries:list,nshards:int):
+    """
+    Divides battery indices over (at most) nshards shards of at most a fair share
+    (number of batteries divided by nshards, rounded up) each, keeping batteries
+    with the same radar configuration together as much as possible. Groups of
+    batteries with the same radar configuration are only split if they do not
+    fit in the remaining room of a shard.
+
+    Returns:
+        list of non-empty lists of battery indices.
+    """
+    groups={}
+    for ibattery,battery in enumerate(batteries):
+        groups.setdefault(radar_key(battery),[]).append(ibattery)
+    fair_share=max(1,-(-len(batteries)//max(1,nshards)))
+    shards=[[] for _ in range(max(1,nshards))]
+    for group in sorted(groups.values(),key=len,reverse=True):
+        while group:
+            shard=min(shards,key=len)
+            room=fair_share-len(shard)
+            shard.extend(group[:room])
+            group=group[room:]
+    return [sorted(shard) for shard in shards if shard]
+
+def radar_seed(seed_seq,key:str):
+    """
+    Returns the seed for a shared radar element, derived from the seed of the
+    multi battery run and the radar configuration, so that all shards create
+    identical radar elements for the same radar configuration.
+    """
+    return np.random.SeedSequence([seed_seq.entropy,zlib.crc32(key.encode())])
+
+def run_shard(shard:list,time_step_seconds:float=pads.simulation.default_step,block_size:int=pads.simulation.default_block_size,
+              seed_seq=None):
+    """
+    Simulates a shard of batteries, one after the other, with the virtual clock.
+
+    Parameters:
+        shard(list): tuples (battery index, battery config, seed)
+        seed_seq: seed sequence of the multi battery run, used to seed shared random radar elements.
+
+    Returns:
+        structured numpy array (timeline_dtype) with one record per radar sweep per battery, with
+        the numbers of shots and hits of the sweep (which can be larger than one with a windowed
+        IFF or a group of firing units).
+    """
+    radars={}
+    records=[]
+    try:
+        for ibattery,battery,seed in shard:
+            key=radar_key(battery)
+            if key not in radars:
+                name=battery["radar"]["name"]
+                options=battery["radar"].get("options",dict())
+                if seed_seq is not None and "seed" not in options and "seed" in inspect.signature(radar.get_implementation(name)).parameters:
+                    options=dict(options,seed=radar_seed(seed_seq,key))
+                radars[key]=radar.get_element(name=name,options=options)
+            sim=pads.simulation(time_step_seconds=time_step_seconds,block_size=block_size,clock_name=clock.VirtualClock.short_name,
+                                seed=seed,config=battery,radar_element=radars[key],battery=battery["name"],
+                                battery_id=ibattery,sinks=[])
+            sim.run(on_sweep=lambda record: records.append((ibattery,record.sweep,record.sim_time,record.verdict.value,record.fired,record.hit,
+                                                            record.shots,record.hits)))
+    finally:
+        # e.g. detaches shared memory radars
+        for element in radars.values():
+            if hasattr(element,"close"):
+                element.close()
+    return np.array(records,dtype=timeline_dtype)
+
+def merge_timelines(timelines:list):
+    ' ' 'Merges per shard timelines into one timeline, sorted by simulated time and battery index.' ' '
+    if len(timelines)==0:
+        return np.zeros(0,dtype=timeline_dtype)
+    timeline=np.concatenate(timelines)
+    return timeline[np.lexsort((timeline["sweep"],timeline["battery"],timeline["sim_time"]))]
+
+class MultiBatteryResult:
+    """
+    Merged timeline of a multi battery simulation, with summaries per battery.
+    """
+    def __init__(self,names:list,timeline):
+        self._names = list(names)
+        self._timeline = timeline
+    @property
+    def names(self):
+        ' ' 'List of battery names; the battery field of the timeline is an index in this list.' ' '
+        return self._names
+    @property
+    def timeline(self):
+        ' ' 'Structured numpy array (timeline_dtype) with one record per radar sweep per battery, sorted by simulated time.' ' '
+        return self._timeline
+    def summary(self,battery:str):
+        ' ' 'Returns a RunSummary for one battery.' ' '
+        records=self._timeline[self._timeline["battery"]==self._names.index(battery)]
+        foe=records["verdict"]==IFF.IFFVerdict.FOE.value
+        nhits=int(records["hits"].sum(dtype=np.int64))
+        return pads.RunSummary(sweeps=len(records),friends=len(records)-int(np.count_nonzero(foe)),foes=int(np.count_nonzero(foe)),
+                               hits=nhits,misses=int(records["shots"].sum(dtype=np.int64))-nhits)
+    def report(self):
+        ' ' 'Returns a multi line text report with the summary of every battery.' ' '
+        lines=[f"{'battery':20s} {'sweeps':>8s} {'friends':>8s} {'foes':>8s} {'hits':>8s} {'misses':>8s}"]
+        for name in self._names:
+            summary=self.summary(name)
+            lines.append(f"{name:20s} "+" ".join(f"{value:8d}" for value in summary))
+        return "\n".join(lines)
+
+def run_batteries(batteries:list,nworkers:int=None,seed=None,time_step_seconds:float=pads.simulation.default_step,
+                  block_size:int=pads.simulation.default_block_size):
+    """
+    Simulates a group of batteries on a pool of worker processes.
+
+    Parameters:
+        batteries(list): battery configs, e.g. from read_batteries.
+        nworkers(int): number of worker processes (None=number of CPUs, 0=run in this process)
+        seed: seed from which the seeds of the batteries are spawned (None=unpredictable)
+        time_step_seconds(float): simulated time step [seconds]
+        block_size(int): number of radar sweeps that are evaluated together by the IFF
+
+    Returns:
+        MultiBatteryResult
+    """
+    seed_seq=np.random.SeedSequence(seed)
+    seeds=seed_seq.spawn(len(batteries))
+    nshards=1 if nworkers==0 else (nworkers or os.cpu_count() or 1)
+    shard_indices=shard_batteries(batteries,nshards)
+    logger.info(f"simulating {len(batteries)} batteries in {len(shard_indices)} shards")
+    if nworkers==0:
+        shards=[[(ibattery,batteries[ibattery],seeds[ibattery]) for ibattery in shard] for shard in shard_indices]
+        timelines=[run_shard(shard,time_step_seconds,block_size,seed_seq) for shard in shards]
+        return MultiBatteryResult([battery["name"] for battery in batteries],merge_timelines(timelines))
+    from airdefense import sweep
+    nshards_per_key=Counter(key for shard in shard_indices for key in set(radar_key(batteries[i]) for i in shard))
+    published=sweep.publish_radars([battery for battery in batteries if nshards_per_key[radar_key(battery)]>1])
+    try:
+        configs=[dict(battery,radar=published[key][1]) if (key:=radar_key(battery)) in published else battery for battery in batteries]
+        shards=[[(ibattery,configs[ibattery],seeds[ibattery]) for ibattery in shard] for shard in shard_indices]
+        with ProcessPoolExecutor(max_workers=nshards) as pool:
+            n=len(shards)
+            timelines=list(pool.map(run_shard,shards,[time_step_seconds]*n,[block_size]*n,[seed_seq]*n))
+    finally:
+        sweep.release(published)
+    return MultiBatteryResult([battery["name"] for battery in batteries],merge_timelines(timelines))
+
+#######################################################################
+
+class TestMultiBattery(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the multi battery simulation.
+    """
+    def setUp(self):
+        logging.disable(logging.INFO)
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+    def test_config(self):
+        batteries = read_batteries("multi_battery.json")
+        self.assertGreater(len(batteries),10)
+        self.assertEqual(len(set(battery["name"] for battery in batteries)),len(batteries))
+        with self.assertRaises(RuntimeError):
+            read_batteries("default.json")
+        with self.assertRaises(RuntimeError):
+            expand_batteries([dict(name="x",radar={},IFF={},FiringUnit={})]*2)
+    def test_sharding(self):
+        batteries = [dict(name=f"b{i}",radar=dict(name="CSV",options=dict(filename=f"f{i%3}.csv"))) for i in range(30)]
+        for nshards in [1,2,3,4,7,64]:
+            shards = shard_batteries(batteries,nshards)
+            self.assertLessEqual(len(shards),nshards)
+            self.assertEqual(sorted(i for shard in shards for i in shard),list(range(30)))
+            self.assertLessEqual(max(len(shard) for shard in shards),-(-30//nshards))
+        for shard in shard_batteries(batteries,3):
+            self.assertEqual(len(set(radar_key(batteries[i]) for i in shard)),1)
+        # batteries on a single recording are still spread over all shards
+        batteries = [dict(name=f"b{i}",radar=dict(name="CSV",options=dict(filename="north.csv"))) for i in range(100)]
+        self.assertEqual([len(shard) for shard in shard_batteries(batteries,8)],[13]*7+[9])
+    def test_run(self):
+        batteries = read_batteries("multi_battery.json")
+        serial = run_batteries(batteries,nworkers=0,seed=42)
+        parallel = run_batteries(batteries,nworkers=3,seed=42)
+        self.assertTrue(np.array_equal(serial.timeline,parallel.timeline))
+        timeline = serial.timeline
+        self.assertTrue(np.all(np.diff(timeline["sim_time"])>=0))
+        self.assertTrue(np.all(timeline["fired"]==(timeline["verdict"]==IFF.IFFVerdict.FOE.value)))
+        self.assertFalse(np.any(timeline["hit"] & ~timeline["fired"]))
+        self.assertTrue(np.array_equal(timeline["shots"],timeline["fired"]))
+        self.assertTrue(np.array_equal(timeline["hits"],timeline["hit"]))
+        for name in serial.names:
+            summary = serial.summary(name)
+            self.assertEqual(summary.foes,summary.hits+summary.misses)
+        self.assertIn(serial.names[-1],serial.report())
+    def test_shared_radar(self):
+        batteries = expand_batteries([dict(name="hex",count=5,**pads.read_config("hex_low_pk.json"))])
+        timeline = run_shard([(i,battery,i) for i,battery in enumerate(batteries)])
+        single = pads.simulation("hex_low_pk.json",clock_name="virtual",seed=0)
+        records = []
+        single.run(on_sweep=records.append)
+        self.assertEqual(len(timeline),5*len(records))
+        first = timeline[timeline["battery"]==0]
+        self.assertTrue(np.array_equal(first["verdict"],[record.verdict.value for record in records]))
+        self.assertTrue(np.array_equal(first["hit"],[record.hit for record in records]))
+        # the same batteries on the recording published in shared memory
+        from airdefense import sweep
+        published = sweep.publish_radars(batteries)
+        try:
+            (_,shm_config), = published.values()
+            shared = run_shard([(i,dict(battery,radar=shm_config),i) for i,battery in enumerate(batteries)])
+        finally:
+            sweep.release(published)
+        self.assertTrue(np.array_equal(shared,timeline))
+    def test_windowed(self):
+        config = pads.read_config("hex_low_pk.json")
+        config["IFF"] = dict(config["IFF"],options=dict(window=4,stride=2))
+        result = run_batteries(expand_batteries([dict(name="hex",**config)]),nworkers=0,seed=5)
+        single = pads.simulation(config=config,clock_name="virtual",seed=np.random.SeedSequence(5).spawn(1)[0],sinks=[]).run()
+        self.assertEqual(result.summary("hex"),single)
+        self.assertGreater(single.hits+single.misses,np.count_nonzero(result.timeline["fired"]))
@@ -4,52 +4,317 @@ using three configurable elements for the radar, IFF and firing unit.
 """
 
 import json
+import numpy as np
+from collections import namedtuple
 from pathlib import Path
-from airdefense import radar, IFF, FiringUnit
-import time
-from datetime import datetime, timedelta
+from airdefense import registry, events
+from datetime import datetime
 import logging
 logger=logging.getLogger(__name__)
 
+# the IFF and radar modules are imported by _import_element_modules, when the first simulation is created
+IFF = None
+radar = None
+
+def _import_element_modules():
+    global IFF, radar
+    if IFF is None:
+        from airdefense import IFF, radar
+
+RunSummary = namedtuple("RunSummary",["sweeps","friends","foes","hits","misses"])
+RunSummary.__doc__ = "Numbers of radar sweeps, (per sweep) verdicts and firing outcomes (per shot) of a simulation run."
+
+SweepRecord = namedtuple("SweepRecord",["battery","sweep","sim_time","verdict","fired","hit","sectors","shots","hits"],defaults=(None,0,0))
+SweepRecord.__doc__ = ("Outcome of a single radar sweep: battery name, sweep number, simulated time, IFF verdict, whether the firing unit(s) fired "
+                       "and whether it hit (at least once). With a windowed IFF, sectors is a tuple of (sector, hit) pairs for the engaged FOE contacts (see IFF.SectorVerdicts.contacts). "
+                       "shots and hits are the numbers of shots and hits of the sweep, which can be larger than one with a windowed IFF or a group of firing units.")
+
+def read_config(cnf_filename:str):
+    """
+    Reads a simulation config file.
+
+    Parameters:
+        cnf_filename(str): file name of the json config file (in the config folder).
+
+    Returns:
+        dict with the configuration.
+    """
+    config_path = simulation.config_dir / cnf_filename
+    logger.debug(f"going to read config file {str(config_path)}")
+    with config_path.open() as fp:
+        config = json.load(fp)
+    logger.debug(f"Successfully read config file {str(config_path)}")
+    return config
+
 class simulation:
     """
     Simulation of patriot air defense system. The configuration of the
-    radar, IFF and firing unit is taken from a json file.
+    radar, IFF and firing unit is taken from a json file. The pacing of
+    the radar sweeps is determined by a clock: the "realtime" clock paces
+    the sweeps to the wall clock, the "virtual" clock runs the simulation
+    as fast as possible. The random number generators of the firing unit
+    and (if it has one, and its seed is not configured) of the radar can be
+    seeded for reproducible runs.
+
+    Instead of a config file name, the configuration can also be given as
+    a dict (e.g. one battery of a multi battery configuration). A radar
+    element can be shared by several simulations, as long as its lines and
+    blocks methods can be used independently by each of them. If the radar
+    keeps only packed parity bits (see the radar module), the IFF evaluates
+    the packed blocks directly, which requires an IFF method that supports it.
+
+    With a windowed IFF method (see the IFF module), the verdict of a sweep is
+    FOE if any sector is a FOE, and the firing unit fires once per FOE contact:
+    overlapping FOE sectors are one contact, identified by its first sector.
+    With a group of firing units (a "FiringUnits" list in the configuration, see
+    the assignment module), the shots at the FOE contacts of a sweep (the FOE
+    sectors, or the sweep itself) are assigned to the units by a fire control,
+    which takes the kill probability, magazine and readiness of every unit into
+    account.
+
+    The verdicts and firing outcomes are emitted as event records to a list
+    of event sinks (see the events module). By default there is one sink,
+    which logs the events to the console.
+
+    The implementations of the elements are loaded through the registry when
+    a simulation is created, so importing this module does not import them.
+
+    With profiling enabled, the elements are wrapped with timing wrappers
+    (see the profiling module), and the latency histograms per stage are
+    available from the stats property after a run. Without profiling the
+    elements are used as they are.
     """
     config_dir = Path(__file__).parent.parent / "config"
     default_step = 1.0
     default_config = "default.json"
-    def __init__(self,cnf_filename:str=default_config, time_step_seconds=default_step):
-        config_path = simulation.config_dir / cnf_filename
-        self._time_step_seconds = time_step_seconds
-        logger.debug(f"going to read config file {str(config_path)}")
-        with config_path.open() as fp:
-            config = json.load(config_path.open())
-        logger.debug(f"Successfully read config file {str(config_path)}")
-        name=config["radar"]["name"]
-        options=config["radar"].get("options",dict())
-        self._radar = radar.get_element(name=name,options=options)
+    default_block_size = 64
+    default_clock = "realtime"
+    def __init__(self,cnf_filename:str=default_config, time_step_seconds=default_step, block_size:int=default_block_size,
+                 clock_name:str=default_clock, seed=None, config:dict=None, radar_element=None, battery:str="",
+                 battery_id:int=0, sinks:list=None, profile:bool=False):
+        _import_element_modules()
+        self._clock = registry.get_implementation("clock",clock_name)(time_step_seconds=time_step_seconds)
+        self._block_size = block_size
+        self._battery = battery
+        self._battery_id = battery_id
+        self._sinks = [events.LoggingSink(show_battery=bool(battery))] if sinks is None else list(sinks)
+        self._queue_stats = None
+        if config is None:
+            config = read_config(cnf_filename)
+        if seed is not None:
+            # spawn from a copy, so that the same seed sequence can seed several simulations identically
+            if isinstance(seed,np.random.SeedSequence):
+                seed_seq = np.random.SeedSequence(seed.entropy,spawn_key=seed.spawn_key,pool_size=seed.pool_size)
+            else:
+                seed_seq = np.random.SeedSequence(seed)
+            seed, radar_seed = seed_seq.spawn(2)
+        if radar_element is None:
+            name=config["radar"]["name"]
+            options=config["radar"].get("options",dict())
+            implementation = registry.get_implementation("radar",name)
+            if seed is not None and "seed" not in options:
+                import inspect
+                if "seed" in inspect.signature(implementation).parameters:
+                    options=dict(options,seed=radar_seed)
+            radar_element = implementation(**options)
+        self._radar = radar_element
         name=config["IFF"]["name"]
         options=config["IFF"].get("options",dict())
-        self._IFF = IFF.get_element(name=name,options=options)
-        name=config["FiringUnit"]["name"]
-        options=config["FiringUnit"].get("options",dict())
-        self._FiringUnit = FiringUnit.get_element(name=name,options=options)
+        self._IFF = IFF.get_element(name=name,options=options,cache=config["IFF"].get("cache"))
+        self._packed = getattr(self._radar,"packed",False)
+        self._windowed = getattr(self._IFF,"window",0)>0
+        if self._packed and (self._windowed or not hasattr(self._IFF,"evaluate_packed_batch")):
+            raise RuntimeError(f"IFF implementation '{name}' cannot evaluate packed radar data"+(" per sector" if self._windowed else ""))
+        self._FiringUnit = None
+        self._fire_control = None
+        if "FiringUnits" in config:
+            from airdefense import assignment
+            self._fire_control = assignment.create_fire_control(config["FiringUnits"],config.get("assignment"),seed)
+        else:
+            name=config["FiringUnit"]["name"]
+            options=config["FiringUnit"].get("options",dict())
+            if seed is not None:
+                options=dict(options,seed=seed)
+            self._FiringUnit = registry.get_implementation("FiringUnit",name)(**options)
+        self._stats = None
+        if profile:
+            from airdefense import profiling
+            self._stats = profiling.SimulationStats()
+            self._IFF = self._stats.timed_iff(self._IFF)
+            if self._fire_control is None:
+                self._FiringUnit = self._stats.timed_firing_unit(self._FiringUnit)
+            else:
+                self._fire_control.wrap_units(self._stats.timed_firing_unit)
+            self._sinks = [self._stats.timed_sink(sink) for sink in self._sinks]
+            self._clock = self._stats.timed_clock(self._clock)
         logger.info("Air Defense System ready")
-    def run(self):
+    @property
+    def clock(self):
+        ' ' 'The clock that paces the simulation (with statistics about deadline misses).' ' '
+        return self._clock
+    @property
+    def battery(self):
+        ' ' 'Name of the simulated battery (empty for a single battery simulation).' ' '
+        return self._battery
+    @property
+    def fire_control(self):
+        ' ' 'The fire control of a group of firing units (see assignment.FireControl), None for a single firing unit.' ' '
+        return self._fire_control
+    @property
+    def sinks(self):
+        ' ' 'List of event sinks to which the events of the simulation are emitted.' ' '
+        return self._sinks
+    @property
+    def stats(self):
+        ' ' 'Profiling statistics of the last run (see profiling.SimulationStats), None if profiling is disabled.' ' '
+        return self._stats
+    @property
+    def queue_stats(self):
+        ' ' 'Statistics of the queues of the last pipelined run (see pipeline.BoundedQueue.stats), None otherwise.' ' '
+        return self._queue_stats
+    def run(self,on_sweep=None):
+        """
+        Runs the simulation until the radar runs out of sweeps.
+
+        Parameters:
+            on_sweep: optional callable, which is called with a SweepRecord for every radar sweep.
+
+        Returns:
+            RunSummary with the numbers of sweeps, verdicts and hits/misses.
+        """
+        self._start(on_sweep)
+        ncols = self._radar.ncols
+        verdict = IFF.IFFVerdict
+        if self._packed:
+            blocks = self._radar.packed_blocks(self._block_size)
+            evaluate = lambda block: self._IFF.evaluate_packed_batch(block,ncols)
+        else:
+            blocks = radar.blocks(self._radar,self._block_size)
+            evaluate = self._IFF.evaluate_batch
+            if self._windowed:
+                evaluate = self._IFF.evaluate_sectors_batch
+                verdict = lambda codes: self._IFF.sector_verdicts(codes,ncols)
+        if self._stats is not None:
+            blocks = self._stats.timed_blocks(blocks)
+        lineno=0
+        try:
+            for block in blocks:
+                verdicts = evaluate(block)
+                for code in verdicts:
+                    self._handle_verdict(lineno,self._clock.time(),verdict(code))
+                    lineno += 1
+                    self._clock.wait(lineno)
+        finally:
+            self._release()
+        return self._finish(lineno)
+    def run_pipelined(self,on_sweep=None,queue_size:int=16,policy:str="block",max_batch:int=64):
+        """
+        Runs the simulation until the radar runs out of sweeps, with the radar,
+        IFF and firing unit in separate pipeline stages (see the pipeline module).
+
+        Parameters:
+            on_sweep: optional callable, which is called with a SweepRecord for every handled radar sweep.
+            queue_size(int): maximum number of batches in each queue between the stages.
+            policy(str): backpressure policy of the queues ("block", "drop_oldest" or "coalesce").
+            max_batch(int): maximum number of sweeps in a coalesced batch.
+
+        Returns:
+            RunSummary with the numbers of handled sweeps, verdicts and hits/misses.
+            Sweeps that were dropped by a queue are not counted, see queue_stats.
+        """
+        self._start(on_sweep)
+        from airdefense import pipeline
+        try:
+            self._queue_stats = pipeline.run_pipeline(self._radar,self._IFF,self._handle_verdict,self._clock,queue_size,policy,max_batch)
+        finally:
+            self._release()
+        for name,stats in self._queue_stats.items():
+            logger.info(f"{name} queue: max depth {stats['max_depth']}, mean latency {stats['mean_latency']:.6f} s, max latency {stats['max_latency']:.6f} s")
+            if stats["dropped"]>0:
+                logger.warning(f"{name} queue dropped {stats['dropped']} out of {stats['put']} sweeps")
+        return self._finish(self._counts["friends"]+self._counts["foes"])
+    # implementation details
+    def _start(self,on_sweep):
+        self._counts=dict(friends=0,foes=0,hits=0,misses=0)
+        self._on_sweep=on_sweep
+        self._queue_stats=None
         sim_start=datetime.now()
         logger.info(f"starting simulation at {sim_start}")
-        for lineno,line in enumerate(self._radar.lines()):
-            verdict = self._IFF.evaluate(line)
-            if verdict == IFF.IFFVerdict.FRIEND:
-                logger.info("FRIEND")
-            elif verdict == IFF.IFFVerdict.FOE:
-                logger.info("FOE")
-                hit = self._FiringUnit.fire()
-                if hit:
-                    logger.info("HIT")
-                else:
-                    logger.info("MISS")
-            next_time=sim_start+timedelta(seconds=(lineno+1)*self._time_step_seconds)
-            sleep_seconds=(next_time-datetime.now()).total_seconds()
-            time.sleep(sleep_seconds)
+        if self._stats is not None:
+            self._stats.start()
+        self._clock.start()
+    def _handle_verdict(self,sweep,sim_time,verdict):
+        sectors = None
+        engaged = None
+        if isinstance(verdict,IFF.SectorVerdicts):
+            sectors = verdict
+            verdict = sectors.verdict
+            engaged = ()
+        fired = False
+        hit = False
+        shots_before = self._counts["hits"]+self._counts["misses"]
+        hits_before = self._counts["hits"]
+        if verdict == IFF.IFFVerdict.FRIEND:
+            self._emit(events.EventKind.FRIEND,sweep,sim_time)
+            self._counts["friends"] += 1
+        elif verdict == IFF.IFFVerdict.FOE:
+            self._emit(events.EventKind.FOE,sweep,sim_time)
+            self._counts["foes"] += 1
+            if sectors is None and self._fire_control is None:
+                fired = True
+                hit = self._fire(sweep,sim_time)
+            else:
+                contacts = [0] if sectors is None else [int(sector) for sector in sectors.contacts]
+                outcomes = self._engage(contacts,sweep,sim_time)
+                fired = len(outcomes)>0
+                hit = any(contact_hit for _,contact_hit in outcomes)
+                if sectors is not None:
+                    engaged = outcomes
+        if self._on_sweep is not None:
+            self._on_sweep(SweepRecord(self._battery,sweep,sim_time,verdict,fired,hit,engaged,
+                                       shots=self._counts["hits"]+self._counts["misses"]-shots_before,
+                                       hits=self._counts["hits"]-hits_before))
+    def _engage(self,contacts,sweep,sim_time):
+        # returns (contact, hit) pairs for the contacts that were shot at
+        if self._fire_control is None:
+            return tuple((contact,self._fire(sweep,sim_time)) for contact in contacts)
+        units,targets = self._fire_control.assign(len(contacts),sim_time)
+        hits = {}
+        for unit,target in zip(units,targets):
+            hit = self._fire(sweep,sim_time,self._fire_control.units[unit])
+            hits[target] = hits.get(target,False) or hit
+        return tuple((contacts[target],hit) for target,hit in sorted(hits.items()))
+    def _fire(self,sweep,sim_time,unit=None):
+        hit = (self._FiringUnit if unit is None else unit).fire()
+        if hit:
+            self._emit(events.EventKind.HIT,sweep,sim_time)
+            self._counts["hits"] += 1
+        else:
+            self._emit(events.EventKind.MISS,sweep,sim_time)
+            self._counts["misses"] += 1
+        return hit
+    def _emit(self,kind,sweep,sim_time):
+        if not self._sinks:
+            return
+        event = events.Event(kind,self._battery_id,sweep,sim_time)
+        for sink in self._sinks:
+            sink.emit(event)
+    def _release(self):
+        # also when the run fails: the sinks get the events that were emitted, the
+        # IFF element shuts down its threads (the caller closes the sinks)
+        for sink in self._sinks:
+            sink.flush()
+        if hasattr(self._IFF,"close"):
+            self._IFF.close()
+    def _finish(self,nsweeps):
+        if self._stats is not None:
+            self._stats.stop(nsweeps)
+        if self._clock.deadline_misses>0:
+            logger.warning(f"{self._clock.deadline_misses} out of {nsweeps} sweeps missed their deadline, max lateness {self._clock.max_lateness:.6f} seconds")
+        if hasattr(self._IFF,"cache_stats"):
+            stats=self._IFF.cache_stats()
+            logger.info(f"IFF cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, hit rate {stats['hit_rate']:.3f}")
+        if self._fire_control is not None:
+            stats=self._fire_control.stats()
+            logger.info(f"fire control: {stats['shots']} shots at {stats['engaged']} out of {stats['contacts']} FOE contacts, {stats['empty']} units out of rounds")
+        return RunSummary(sweeps=nsweeps,**self._counts)
@@ -0,0 +1,358 @@
+"""
+This module implements a pipelined execution mode for the air defense
+simulation. The radar, IFF and firing unit each run in their own stage (thread),
+connected by bounded queues, so that a slow IFF or firing unit does not stall
+the intake of radar sweeps, as long as the queues have room.
+
+What happens when a queue is full is determined by its backpressure policy:
+
+* "block": the producer waits until there is room (no sweeps are lost, but the
+  radar intake slows down to the rate of the slowest stage).
+* "drop_oldest": the oldest queued item is discarded to make room (the intake
+  keeps the radar rate, the discarded sweeps are counted).
+* "coalesce": the new item is merged into the newest queued item, up to a
+  maximum batch size, after which the producer waits (no sweeps are lost, and
+  the consumer catches up by processing larger batches at once).
+
+The items in the queues are lists (batches) of sweeps, which is what makes
+coalescing possible. The stages only use the lines method of the radar, the
+evaluate (or evaluate_batch, for batches of more than one sweep) method of the
+IFF, or evaluate_sectors_batch for a windowed IFF, and, through the handler
+that is provided by the simulation, the fire method of the firing unit.
+
+The radar lines are queued as they are, without copying. For a radar whose
+lines are views into a ring buffer (with a ring_size property, like the socket
+radar), the ring buffer should be larger than the number of lines that the
+radar queue and the stages can hold, otherwise queued lines would be
+overwritten; run_pipeline checks this.
+"""
+
+import numpy as np
+import threading
+import time
+from collections import deque
+import unittest
+from airdefense import IFF
+import logging
+logger=logging.getLogger(__name__)
+
+policies = ("block","drop_oldest","coalesce")
+
+class QueueClosed(Exception):
+    ' ' 'Raised by BoundedQueue.put after the queue was aborted.' ' '
+    pass
+
+class BoundedQueue:
+    """
+    Bounded queue of batches (lists) with a backpressure policy and statistics
+    about its depth and about the latency of the items (the time between putting
+    an item and getting it).
+    """
+    def __init__(self,maxsize:int=16,policy:str="block",max_batch:int=64,name:str=""):
+        """
+        Initializes a BoundedQueue object.
+
+        Parameters:
+            maxsize(int): maximum number of batches in the queue.
+            policy(str): backpressure policy, one of "block", "drop_oldest" or "coalesce".
+            max_batch(int): maximum number of sweeps in a coalesced batch.
+            name(str): name of the queue, for reporting.
+        """
+        if policy not in policies:
+            raise ValueError(f"unknown backpressure policy '{policy}', should be one of {policies}")
+        if maxsize<1:
+            raise ValueError(f"maximum queue size should be positive, got {maxsize}")
+        self._maxsize = maxsize
+        self._policy = policy
+        self._max_batch = max_batch
+        self._name = name
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._aborted = False
+        self._max_depth = 0
+        self._nput = 0
+        self._nget = 0
+        self._nbatches = 0
+        self._ndropped = 0
+        self._ncoalesced = 0
+        self._sum_latency = 0.
+        self._max_latency = 0.
+    @property
+    def name(self):
+        ' ' 'Name of the queue.' ' '
+        return self._name
+    @property
+    def depth(self):
+        ' ' 'Current number of batches in the queue.' ' '
+        return len(self._items)
+    def put(self,batch:list):
+        """
+        Puts a batch into the queue, applying the backpressure policy if the queue is full.
+        Raises QueueClosed if the queue was aborted.
+        """
+        with self._cond:
+            self._nput += len(batch)
+            while len(self._items)>=self._maxsize and not self._aborted:
+                if self._policy=="drop_oldest":
+                    dropped,_ = self._items.popleft()
+                    self._ndropped += len(dropped)
+                elif self._policy=="coalesce" and len(self._items[-1][0])+len(batch)<=self._max_batch:
+                    self._items[-1][0].extend(batch)
+                    self._ncoalesced += len(batch)
+                    return
+                else:
+                    self._cond.wait()
+            if self._aborted:
+                raise QueueClosed(f"queue '{self._name}' was aborted")
+            self._items.append((list(batch),time.monotonic()))
+            self._max_depth = max(self._max_depth,len(self._items))
+            self._cond.notify_all()
+    def get(self):
+        """
+        Gets the oldest batch from the queue, waiting if the queue is empty.
+
+        Returns:
+            batch (list), or None if the queue is closed and empty (or aborted).
+        """
+        with self._cond:
+            while len(self._items)==0 and not (self._closed or self._aborted):
+                self._cond.wait()
+            if self._aborted or len(self._items)==0:
+                return None
+            batch,put_time = self._items.popleft()
+            latency = time.monotonic()-put_time
+            self._nget += len(batch)
+            self._nbatches += 1
+            self._sum_latency += latency
+            self._max_latency = max(self._max_latency,latency)
+            self._cond.notify_all()
+            return batch
+    def close(self):
+        ' ' 'Signals that no more batches will be put; get returns None after the remaining batches.' ' '
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+    def abort(self):
+        ' ' 'Stops the queue immediately, e.g. after an error in one of the stages.' ' '
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+    def stats(self):
+        """
+        Returns a dict with statistics: number of sweeps put, gotten, dropped and
+        coalesced, the current and maximum depth (in batches), and the mean and
+        maximum latency (in seconds, per batch).
+        """
+        with self._cond:
+            return dict(put=self._nput,got=self._nget,dropped=self._ndropped,coalesced=self._ncoalesced,
+                        depth=len(self._items),max_depth=self._max_depth,
+                        mean_latency=self._sum_latency/max(1,self._nbatches),max_latency=self._max_latency)
+
+def _evaluate(iff_element,lines:list):
+    if getattr(iff_element,"window",0)>0:
+        codes=iff_element.evaluate_sectors_batch(np.stack(lines))
+        return [iff_element.sector_verdicts(row,len(lines[0])) for row in codes]
+    if len(lines)>1 and hasattr(iff_element,"evaluate_batch"):
+        return [IFF.IFFVerdict(code) for code in iff_element.evaluate_batch(np.stack(lines))]
+    return [iff_element.evaluate(line) for line in lines]
+
+def run_pipeline(radar_element,iff_element,handler,clock,queue_size:int=16,policy:str="block",max_batch:int=64):
+    """
+    Runs the radar, IFF and firing stages in a pipeline, until the radar runs out of sweeps.
+    The radar and IFF stages run in their own threads, the firing stage (handler)
+    runs in the calling thread.
+
+    Parameters:
+        radar_element: radar element, its lines are paced by the clock.
+        iff_element: IFF element.
+        handler: callable handler(sweep,sim_time,verdict), which handles the verdict for a sweep, e.g. by firing.
+        clock: clock for the pacing of the radar sweeps (should already be started).
+        queue_size(int): maximum number of batches in each queue.
+        policy(str): backpressure policy of the queues.
+        max_batch(int): maximum number of sweeps in a coalesced batch.
+
+    Returns:
+        dict with the statistics of the "radar" and "IFF" queues (see BoundedQueue.stats).
+    """
+    ring_size = getattr(radar_element,"ring_size",None)
+    if ring_size is not None:
+        # the queued batches, the batch that the IFF stage evaluates, the line that the radar stage puts
+        nheld = (queue_size+1)*(max_batch if policy=="coalesce" else 1)+1
+        if ring_size<nheld:
+            raise ValueError(f"the ring buffer of the radar ({ring_size} lines) is smaller than the number of lines "
+                             f"that the pipeline can hold ({nheld}), use a larger ring_size or a smaller queue_size or max_batch")
+    radar_queue = BoundedQueue(queue_size,policy,max_batch,"radar")
+    iff_queue = BoundedQueue(queue_size,policy,max_batch,"IFF")
+    errors = []
+    def radar_stage():
+        try:
+            for sweep,line in enumerate(radar_element.lines()):
+                radar_queue.put([(sweep,clock.time(),line)])
+                clock.wait(sweep+1)
+        except QueueClosed:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            iff_queue.abort()
+        finally:
+            radar_queue.close()
+    def iff_stage():
+        try:
+            while (batch:=radar_queue.get()) is not None:
+                verdicts = _evaluate(iff_element,[line for _,_,line in batch])
+                iff_queue.put([(sweep,sim_time,verdict) for (sweep,sim_time,_),verdict in zip(batch,verdicts)])
+        except QueueClosed:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            radar_queue.abort()
+        finally:
+            iff_queue.close()
+    threads = [threading.Thread(target=radar_stage,name="radar stage",daemon=True),
+               threading.Thread(target=iff_stage,name="IFF stage",daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        while (batch:=iff_queue.get()) is not None:
+            for sweep,sim_time,verdict in batch:
+                handler(sweep,sim_time,verdict)
+    except BaseException:
+        radar_queue.abort()
+        iff_queue.abort()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return {queue.name:queue.stats() for queue in [radar_queue,iff_queue]}
+
+#######################################################################
+
+class TestBoundedQueue(unittest.TestCase):
+    def test_block(self):
+        queue = BoundedQueue(2,"block")
+        queue.put([1])
+        queue.put([2])
+        consumer = threading.Timer(0.05,lambda: self.assertEqual(queue.get(),[1]))
+        consumer.start()
+        start = time.monotonic()
+        queue.put([3])
+        self.assertGreater(time.monotonic()-start,0.03)
+        consumer.join()
+        queue.close()
+        self.assertEqual([queue.get(),queue.get(),queue.get()],[[2],[3],None])
+        stats = queue.stats()
+        self.assertEqual((stats["put"],stats["got"],stats["dropped"],stats["max_depth"]),(3,3,0,2))
+    def test_drop_oldest(self):
+        queue = BoundedQueue(2,"drop_oldest")
+        for i in range(5):
+            queue.put([i])
+        queue.close()
+        self.assertEqual([queue.get(),queue.get(),queue.get()],[[3],[4],None])
+        self.assertEqual(queue.stats()["dropped"],3)
+    def test_coalesce(self):
+        queue = BoundedQueue(2,"coalesce",max_batch=3)
+        for i in range(4):
+            queue.put([i])
+        self.assertEqual(queue.depth,2)
+        self.assertEqual(queue.stats()["coalesced"],2)
+        consumer = threading.Timer(0.05,lambda: self.assertEqual(queue.get(),[0]))
+        consumer.start()
+        queue.put([4])
+        consumer.join()
+        queue.close()
+        self.assertEqual([queue.get(),queue.get(),queue.get()],[[1,2,3],[4],None])
+    def test_abort(self):
+        queue = BoundedQueue(1,"block")
+        queue.put([0])
+        threading.Timer(0.02,queue.abort).start()
+        with self.assertRaises(QueueClosed):
+            queue.put([1])
+        self.assertIsNone(queue.get())
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            BoundedQueue(2,"panic")
+
+class TestRunPipeline(unittest.TestCase):
+    class VirtualClock:
+        def time(self):
+            return 0.
+        def wait(self,step):
+            return 0.
+    class SlowIff:
+        def evaluate(self,line):
+            time.sleep(0.001)
+            return int(line[0])%2
+    class LineRadar:
+        def lines(self):
+            for i in range(200):
+                yield np.full(3,i)
+    def test_order_and_completeness(self):
+        for policy in ["block","coalesce"]:
+            results = []
+            stats = run_pipeline(self.LineRadar(),self.SlowIff(),lambda *args: results.append(args),self.VirtualClock(),
+                                 queue_size=4,policy=policy,max_batch=16)
+            self.assertEqual([sweep for sweep,_,_ in results],list(range(200)))
+            self.assertEqual([verdict for _,_,verdict in results],[i%2 for i in range(200)])
+            self.assertLessEqual(stats["radar"]["max_depth"],4)
+            self.assertEqual(stats["radar"]["dropped"],0)
+    def test_drop_oldest(self):
+        results = []
+        stats = run_pipeline(self.LineRadar(),self.SlowIff(),lambda *args: results.append(args),self.VirtualClock(),
+                             queue_size=2,policy="drop_oldest")
+        sweeps = [sweep for sweep,_,_ in results]
+        self.assertEqual(sweeps,sorted(sweeps))
+        self.assertEqual(len(sweeps)+stats["radar"]["dropped"]+stats["IFF"]["dropped"],200)
+        self.assertGreater(stats["radar"]["dropped"],0)
+    def test_ring_buffer(self):
+        # queued lines are views into the ring buffer of the radar, which should not be overwritten
+        class RingRadar:
+            def __init__(self,ring_size):
+                self.ring_size = ring_size
+                self._ring = np.zeros((ring_size,3),dtype=np.int64)
+            def lines(self):
+                for i in range(200):
+                    self._ring[i%self.ring_size] = i
+                    yield self._ring[i%self.ring_size]
+        class SlowCopyIff:
+            def evaluate(self,line):
+                time.sleep(0.001)
+                return int(line[0])
+        for policy,max_batch in [("block",16),("coalesce",4)]:
+            nheld = 5*(max_batch if policy=="coalesce" else 1)+1
+            results = []
+            run_pipeline(RingRadar(nheld),SlowCopyIff(),lambda *args: results.append(args),self.VirtualClock(),
+                         queue_size=4,policy=policy,max_batch=max_batch)
+            self.assertEqual([verdict for _,_,verdict in results],list(range(200)))
+            with self.assertRaises(ValueError):
+                run_pipeline(RingRadar(nheld-1),SlowCopyIff(),lambda *args: None,self.VirtualClock(),
+                             queue_size=4,policy=policy,max_batch=max_batch)
+    def test_error(self):
+        class BrokenIff:
+            def evaluate(self,line):
+                raise ValueError("broken")
+        with self.assertRaises(ValueError):
+            run_pipeline(self.LineRadar(),BrokenIff(),lambda *args: None,self.VirtualClock())
+    def test_simulation(self):
+        from airdefense import pads
+        logging.disable(logging.INFO)
+        try:
+            for policy in policies:
+                sequential, pipelined = [], []
+                pads.simulation("hex_low_pk.json",clock_name="virtual",seed=7).run(on_sweep=sequential.append)
+                sim = pads.simulation("hex_low_pk.json",clock_name="virtual",seed=7)
+                summary = sim.run_pipelined(on_sweep=pipelined.append,queue_size=64,policy=policy)
+                self.assertEqual(sequential,pipelined)
+                self.assertEqual(summary.sweeps,len(sequential))
+                self.assertEqual(sim.queue_stats["radar"]["dropped"],0)
+            config = dict(pads.read_config("hex_low_pk.json"),IFF=dict(name="EvenOdd",options=dict(window=4,stride=2)))
+            sequential, pipelined = [], []
+            summary = pads.simulation(config=config,clock_name="virtual",seed=7).run(on_sweep=sequential.append)
+            pads.simulation(config=config,clock_name="virtual",seed=7).run_pipelined(on_sweep=pipelined.append,max_batch=8)
+            self.assertEqual(sequential,pipelined)
+            self.assertEqual(summary.hits+summary.misses,sum(len(record.sectors) for record in sequential))
+            self.assertGreater(summary.hits+summary.misses,summary.foes)
+        finally:
+            logging.disable(logging.NOTSET)
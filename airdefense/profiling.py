@@ -0,0 +1,276 @@
+"""
+This module provides the instrumentation for profiling a simulation run:
+fixed memory latency histograms, and timing wrappers for the IFF, firing unit,
+event sinks, clock and radar blocks of a simulation.
+
+The simulation only wraps its elements when profiling is enabled, so that a
+simulation without profiling runs the original elements, without any
+instrumentation overhead.
+"""
+
+import math
+import time
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+
+class LatencyHistogram:
+    """
+    Histogram of nonnegative integer values (e.g. latencies in nanoseconds) with
+    log-linear buckets, similar to an HDR histogram: values below 2**precision_bits
+    are counted exactly, larger values in buckets with a relative width of at
+    most 2**(1-precision_bits). The memory use is fixed, determined by the
+    precision and the maximum value; larger values are counted in the last bucket.
+    """
+    def __init__(self,precision_bits:int=6,max_bits:int=40):
+        """
+        Initializes a LatencyHistogram object.
+
+        Parameters:
+            precision_bits(int): number of significant bits of the bucket boundaries.
+            max_bits(int): values up to 2**max_bits are resolved (2**40 ns is about 18 minutes).
+        """
+        self._p = precision_bits
+        self._sub = 1<<precision_bits
+        self._half = self._sub>>1
+        self._max_value = (1<<max_bits)-1
+        self._counts = [0]*self._index(self._max_value)+[0]
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = 0
+    @property
+    def count(self):
+        ' ' 'Number of recorded values.' ' '
+        return self._count
+    @property
+    def max(self):
+        ' ' 'Largest recorded value (exact).' ' '
+        return self._max
+    @property
+    def min(self):
+        ' ' 'Smallest recorded value (exact, None if nothing was recorded).' ' '
+        return self._min
+    @property
+    def mean(self):
+        ' ' 'Mean of the recorded values (nan if nothing was recorded).' ' '
+        return self._total/self._count if self._count>0 else math.nan
+    def record(self,value:int,count:int=1):
+        """
+        Records a value (count times). Negative values are recorded as zero.
+        """
+        value=max(0,int(value))
+        self._counts[self._index(min(value,self._max_value))] += count
+        self._count += count
+        self._total += value*count
+        self._max = max(self._max,value)
+        self._min = value if self._min is None else min(self._min,value)
+    def percentile(self,q:float):
+        """
+        Returns the value at percentile q (0..100), with the resolution of the
+        buckets: the result is the upper boundary of the bucket, but at most the
+        recorded maximum.
+        """
+        if self._count==0:
+            return math.nan
+        target=max(1,math.ceil(q/100*self._count))
+        cumulative=0
+        for index,count in enumerate(self._counts):
+            cumulative += count
+            if cumulative>=target:
+                return min(self._upper(index),self._max)
+        return self._max
+    def reset(self):
+        ' ' 'Clears all recorded values.' ' '
+        self._counts = [0]*len(self._counts)
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = 0
+    # implementation details
+    def _index(self,value):
+        if value<self._sub:
+            return value
+        shift=value.bit_length()-self._p
+        return self._sub+(shift-1)*self._half+(value>>shift)-self._half
+    def _upper(self,index):
+        if index<self._sub:
+            return index
+        shift=(index-self._sub)//self._half+1
+        sub=(index-self._sub)%self._half+self._half
+        return ((sub+1)<<shift)-1
+
+class SimulationStats:
+    """
+    Profiling statistics of a simulation run: latency histograms (in nanoseconds)
+    per stage, amortized per radar sweep for the stages that process blocks of
+    sweeps, the slack before the clock deadlines, and the sweep throughput.
+    """
+    stages = ("radar","IFF","fire","events","slack")
+    def __init__(self):
+        self._histograms = {stage:LatencyHistogram() for stage in SimulationStats.stages}
+        self._nsweeps = 0
+        self._wall_seconds = 0.
+        self._start = None
+    def __getitem__(self,stage:str):
+        ' ' 'Returns the histogram of a stage.' ' '
+        return self._histograms[stage]
+    @property
+    def nsweeps(self):
+        ' ' 'Number of radar sweeps in the profiled run.' ' '
+        return self._nsweeps
+    @property
+    def wall_seconds(self):
+        ' ' 'Wall clock duration of the profiled run [seconds].' ' '
+        return self._wall_seconds
+    @property
+    def throughput(self):
+        ' ' 'Number of radar sweeps per wall clock second.' ' '
+        return self._nsweeps/self._wall_seconds if self._wall_seconds>0 else math.nan
+    def start(self):
+        ' ' 'Resets the statistics and starts the wall clock timer of a run.' ' '
+        for histogram in self._histograms.values():
+            histogram.reset()
+        self._nsweeps = 0
+        self._start = time.perf_counter()
+    def stop(self,nsweeps:int):
+        ' ' 'Stops the wall clock timer of a run.' ' '
+        self._nsweeps = nsweeps
+        self._wall_seconds = time.perf_counter()-self._start
+    def report(self):
+        ' ' 'Returns a multi line text report with p50/p99/max per stage [microseconds] and the throughput.' ' '
+        lines=[f"{'stage':8s} {'count':>9s} {'p50[us]':>10s} {'p99[us]':>10s} {'max[us]':>10s}"]
+        for stage,histogram in self._histograms.items():
+            values=[histogram.percentile(50),histogram.percentile(99),histogram.max if histogram.count else math.nan]
+            lines.append(f"{stage:8s} {histogram.count:9d} "+" ".join(f"{value/1000:10.1f}" for value in values))
+        lines.append(f"{self._nsweeps} sweeps in {self._wall_seconds:.3f} s: {self.throughput:.1f} sweeps/s")
+        return "\n".join(lines)
+    def timed_blocks(self,blocks):
+        ' ' 'Wraps a generator of radar blocks, recording the time to produce each block (per sweep).' ' '
+        histogram=self._histograms["radar"]
+        while True:
+            start=time.perf_counter_ns()
+            block=next(blocks,None)
+            elapsed=time.perf_counter_ns()-start
+            if block is None:
+                return
+            histogram.record(elapsed//max(1,len(block)),len(block))
+            yield block
+    def timed_iff(self,iff_element):
+        ' ' 'Wraps an IFF element, recording the evaluation time (per sweep).' ' '
+        return _TimedIff(iff_element,self._histograms["IFF"])
+    def timed_firing_unit(self,firing_unit):
+        ' ' 'Wraps a firing unit, recording the time per shot.' ' '
+        return _TimedFiringUnit(firing_unit,self._histograms["fire"])
+    def timed_sink(self,sink):
+        ' ' 'Wraps an event sink, recording the time per emitted event.' ' '
+        return _TimedSink(sink,self._histograms["events"])
+    def timed_clock(self,clock):
+        ' ' 'Wraps a clock, recording the (nonnegative) slack before each deadline.' ' '
+        return _TimedClock(clock,self._histograms["slack"])
+
+class _Wrapper:
+    def __init__(self,element,histogram):
+        self._element = element
+        self._histogram = histogram
+    def __getattr__(self,name):
+        return getattr(self._element,name)
+
+class _TimedIff(_Wrapper):
+    def evaluate(self,line):
+        start=time.perf_counter_ns()
+        verdict=self._element.evaluate(line)
+        self._histogram.record(time.perf_counter_ns()-start)
+        return verdict
+    def evaluate_batch(self,block):
+        start=time.perf_counter_ns()
+        verdicts=self._element.evaluate_batch(block)
+        self._histogram.record((time.perf_counter_ns()-start)//max(1,len(block)),len(block))
+        return verdicts
+    def evaluate_sectors_batch(self,block):
+        start=time.perf_counter_ns()
+        codes=self._element.evaluate_sectors_batch(block)
+        self._histogram.record((time.perf_counter_ns()-start)//max(1,len(block)),len(block))
+        return codes
+    def evaluate_packed_batch(self,packed,ncols:int):
+        start=time.perf_counter_ns()
+        verdicts=self._element.evaluate_packed_batch(packed,ncols)
+        self._histogram.record((time.perf_counter_ns()-start)//max(1,len(packed)),len(packed))
+        return verdicts
+
+class _TimedFiringUnit(_Wrapper):
+    def fire(self):
+        start=time.perf_counter_ns()
+        hit=self._element.fire()
+        self._histogram.record(time.perf_counter_ns()-start)
+        return hit
+
+class _TimedSink(_Wrapper):
+    def emit(self,event):
+        start=time.perf_counter_ns()
+        self._element.emit(event)
+        self._histogram.record(time.perf_counter_ns()-start)
+
+class _TimedClock(_Wrapper):
+    def wait(self,step:int):
+        slack=self._element.wait(step)
+        self._histogram.record(int(slack*1e9))
+        return slack
+
+#######################################################################
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_exact_small_values(self):
+        histogram = LatencyHistogram(precision_bits=6)
+        for value in range(64):
+            histogram.record(value)
+        self.assertEqual(histogram.count,64)
+        self.assertEqual(histogram.percentile(50),31)
+        self.assertEqual(histogram.percentile(100),63)
+        self.assertEqual(histogram.min,0)
+    def test_relative_error(self):
+        histogram = LatencyHistogram(precision_bits=6)
+        values = [int(1.37**i) for i in range(80)]
+        for value in values:
+            histogram.record(value)
+        for q in [10,50,90,99]:
+            exact = sorted(values)[max(0,math.ceil(q/100*len(values))-1)]
+            self.assertLessEqual(exact,histogram.percentile(q))
+            self.assertLessEqual(histogram.percentile(q),exact*(1+2**-5)+1)
+        self.assertEqual(histogram.max,max(values))
+        self.assertEqual(histogram.percentile(100),max(values))
+    def test_fixed_memory(self):
+        histogram = LatencyHistogram(precision_bits=6,max_bits=40)
+        nbuckets = len(histogram._counts)
+        histogram.record(2**50)
+        histogram.record(-5)
+        histogram.record(1000,count=10)
+        self.assertEqual(len(histogram._counts),nbuckets)
+        self.assertEqual(histogram.count,12)
+        self.assertEqual(histogram.max,2**50)
+        self.assertEqual(histogram.min,0)
+        histogram.reset()
+        self.assertEqual(histogram.count,0)
+        self.assertTrue(math.isnan(histogram.percentile(50)))
+    def test_bucket_boundaries(self):
+        histogram = LatencyHistogram(precision_bits=4,max_bits=20)
+        for value in range(1,2**20):
+            index = histogram._index(value)
+            self.assertLessEqual(value,histogram._upper(index))
+            if index>0:
+                self.assertGreater(value,histogram._upper(index-1))
+
+class TestSimulationStats(unittest.TestCase):
+    def test_simulation(self):
+        from airdefense import pads
+        sim = pads.simulation("hex_low_pk.json",clock_name="virtual",seed=1,sinks=[],profile=True)
+        summary = sim.run()
+        stats = sim.stats
+        self.assertEqual(stats.nsweeps,summary.sweeps)
+        self.assertEqual(stats["radar"].count,summary.sweeps)
+        self.assertEqual(stats["IFF"].count,summary.sweeps)
+        self.assertEqual(stats["fire"].count,summary.foes)
+        self.assertEqual(stats["slack"].count,summary.sweeps)
+        self.assertGreater(stats.throughput,0)
+        self.assertIn("p99",stats.report())
+        self.assertIsNone(pads.simulation(clock_name="virtual",sinks=[]).stats)
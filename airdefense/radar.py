@@ -1,9 +1,12 @@
 """
 This module provides access to implementations of the radar element for our air
-defense systems.  Currently two radar implementations are provided, one of them
-implements the CSV based radar as specified in the assignment, the other is
-purely to test that the system can run with a different radar element
-implementation.
+defense systems.  Currently six radar implementations are provided, one of
+them implements the CSV based radar as specified in the assignment, one plays
+a list of CSV files as one continuous recording, one reads (memory mapped)
+binary numpy files, one reads radar data that another process published in
+shared memory, one receives radar lines from a TCP or UDP socket (e.g. a live
+sensor feed), and the last one is purely to test that the system can run with
+a different radar element implementation.
 
 A radar element class implementation should have a lines method that behaves
 like a generator of arrays of radar data. The radar data array should an fixed
@@ -11,12 +14,31 @@ length integer array. The class should also have properties "ncols" and
 "nrows", which represent the (nonzero) length of the array and the
 (nonnegative) number of lines, respectively.  A value of zero for "ncols"
 signifies an infinite number of lines, i.e. the radar never stops.
+
+Optionally, a radar element class can also have a blocks method, which behaves
+like a generator of 2-dimensional arrays, holding (up to) a given number of
+consecutive radar lines per block. Consumers that want to process blocks of
+radar lines should use the "blocks" function in this module, which falls back
+to stacking the lines for elements that do not provide their own blocks method.
+
+The radar data are stored with the narrowest integer dtype that can hold the
+values (e.g. uint8 for 7 bit values), instead of int64. For IFF methods that
+only look at the parity of the values, the CSV radar can also keep a packed
+representation, with only the lowest bit of every value (see pack_parity). Such
+a radar element has a true "packed" property and a packed_blocks method, and its
+lines and blocks methods yield the parity bits (0 or 1) of the values.
 """
 
 import numpy as np
-import functools
+import glob
+import itertools
+import re
+from concurrent.futures import ThreadPoolExecutor
 import unittest
+import tempfile
 from pathlib import Path
+from airdefense.radarcache import RadarCache
+from airdefense import registry
 import logging
 
 logger=logging.getLogger(__name__)
@@ -25,11 +47,27 @@ class CsvFileRadar:
     """
     This class implements the radar element for the code assignment exercise.
     It reads data from a CSV file. We allow some formatting flexibility.
+
+    By default the entire CSV file is decoded when the object is created. For
+    very large recordings a chunk size (in bytes) can be configured, in which
+    case the file is only scanned (for the number of rows and columns) when the
+    object is created, and decoded chunk by chunk while the lines are consumed.
+
+    Optionally the decoded data are stored in a radar cache (see the radarcache
+    module), so that subsequent runs with the same, unchanged CSV file can map
+    the decoded data into memory instead of decoding the file again.
+
+    The values are decoded into the narrowest unsigned integer dtype for the
+    widest value in the file, unless a dtype is configured. With the packed
+    option only the parity bits of the values are kept in memory, eight per byte.
     """
     short_name = "CSV"
     data_dir = Path(__file__).parent.parent / "data"
     default_csv = "radar_data.csv"
-    def __init__(self,filename:str=default_csv,delim:str=";",base:int=2):
+    packed_chunk_rows = 4096
+    def __init__(self,filename:str=default_csv,delim:str=";",base:int=2,chunk_bytes:int=0,
+                 cache:bool=False,cache_dir:str=None,cache_max_bytes:int=RadarCache.default_max_bytes,
+                 dtype:str=None,packed:bool=False):
         """
         Initializes a CsvFileRadar object.
 
@@ -37,10 +75,27 @@ class CsvFileRadar:
             filename(str): file name of the CSV file to use (in the data directory). The default CSV file contains the data from the code assignment.
             delim(str): delimiter to assume for parsing the CSV file.
             base(int): e.g. 2 for binary, 16 for hex.
+            chunk_bytes(int): approximate number of bytes to read and decode at a time (0=read the whole file at once).
+            cache(bool): whether to use the radar cache for the decoded data.
+            cache_dir(str): directory of the radar cache (None=default cache directory).
+            cache_max_bytes(int): maximum total size of the radar cache directory.
+            dtype(str): integer dtype of the decoded values (None=narrowest dtype for the values in the file).
+            packed(bool): whether to keep only the parity bits of the values, packed (for parity based IFF methods).
         """
         csv_filepath = CsvFileRadar.data_dir / filename
-        logger.debug(f"going to read CSV file {str(csv_filepath)}")
-        self._read_csv_file(csv_filepath,delim,base)
+        self._delim = delim
+        self._base = base
+        self._chunk_bytes = chunk_bytes
+        self._dtype = None if dtype is None else np.dtype(dtype)
+        self._radar_data = None
+        self._packed = None
+        if cache:
+            self._read_cached_csv_file(csv_filepath,RadarCache(cache_dir,cache_max_bytes))
+        else:
+            logger.debug(f"going to read CSV file {str(csv_filepath)}")
+            self._read_csv_file(csv_filepath,delim,base)
+        if packed:
+            self._pack()
     @property
     def nrows(self):
         ' ' 'Number of rows / radarlines available from the CSV file.' ' '
@@ -49,30 +104,555 @@ class CsvFileRadar:
     def ncols(self):
         ' ' 'Number of data values per radar line.' ' '
         return self._ncols
+    @property
+    def dtype(self):
+        ' ' 'Integer dtype of the radar lines (uint8 parity bits for a packed radar).' ' '
+        return np.dtype(np.uint8) if self.packed else self._dtype
+    @property
+    def packed(self):
+        ' ' 'Whether only the packed parity bits of the values are kept (see packed_blocks).' ' '
+        return self._packed is not None
     def lines(self):
         ' ' 'Generator method that will yield the radar lines one at a time.' ' '
-        for lineno,line in enumerate(self._radar_data):
-            logger.info(f"radar sweep No. {lineno}")
-            yield line
+        debug=logger.isEnabledFor(logging.DEBUG)
+        lineno=0
+        for chunk in self._chunks():
+            for line in chunk:
+                if debug:
+                    logger.debug("radar sweep No. %d",lineno)
+                yield line
+                lineno += 1
+    def blocks(self,nsweeps:int):
+        ' ' 'Generator method that will yield the radar lines in blocks of (at most) nsweeps lines.' ' '
+        first=0
+        for block in rebatch(self._chunks(),nsweeps):
+            logger.debug("radar sweeps No. %d to %d",first,first+len(block)-1)
+            yield block
+            first += len(block)
+    def packed_blocks(self,nsweeps:int):
+        """
+        Generator method that will yield blocks of (at most) nsweeps packed radar
+        lines: uint8 arrays with shape (n,ceil(ncols/8)), with the parity bits of
+        the values as produced by pack_parity. Only available for a packed radar.
+        """
+        if not self.packed:
+            raise RuntimeError("packed blocks are only available from a packed CSV radar")
+        if nsweeps<1:
+            raise ValueError(f"number of sweeps per block should be positive, got {nsweeps}")
+        for first in range(0,self._nrows,nsweeps):
+            logger.debug("radar sweeps No. %d to %d",first,min(first+nsweeps,self._nrows)-1)
+            yield self._packed[first:first+nsweeps]
     # implementation details
     def _read_csv_file(self,filepath,delim,base):
         try:
-            conv=functools.partial(int,base=base)
-            self._radar_data=np.loadtxt(filepath,dtype=int,converters=conv,delimiter=delim)
-            logger.debug(f"got radar data with shape {self._radar_data.shape}")
-            self._nrows, self._ncols = self._radar_data.shape
+            if self._chunk_bytes>0:
+                self._radar_data=None
+                self._nrows, self._ncols, maxwidth = scan_csv_file(filepath,delim,self._chunk_bytes)
+                if self._dtype is None:
+                    self._dtype=narrowest_dtype(base,maxwidth)
+            else:
+                self._radar_data=decode_csv(filepath.read_bytes(),delim,base,self._dtype)
+                logger.debug(f"got radar data with shape {self._radar_data.shape} and dtype {self._radar_data.dtype}")
+                self._nrows, self._ncols = self._radar_data.shape
+                self._dtype = self._radar_data.dtype
             self._csv_file_path = filepath
         except Exception as e:
             logger.error(f"Problem reading radar CSV data from {filepath}: {e}")
             raise
+    def _read_cached_csv_file(self,filepath,cache):
+        params=dict(delim=self._delim,base=self._base,value_dtype=None if self._dtype is None else self._dtype.name)
+        try:
+            self._radar_data=cache.load(filepath,**params)
+        except FileNotFoundError as e:
+            logger.error(f"Problem reading radar CSV data from {filepath}: {e}")
+            raise
+        if self._radar_data is None:
+            logger.debug(f"going to read CSV file {str(filepath)} and store it in the radar cache")
+            self._read_csv_file(filepath,self._delim,self._base)
+            shape=(self._nrows,self._ncols)
+            self._radar_data=cache.store(filepath,self._chunks(),shape,self._dtype,**params)
+        self._nrows, self._ncols = self._radar_data.shape
+        self._dtype = self._radar_data.dtype
+        self._csv_file_path = filepath
+    def _pack(self):
+        packed=[pack_parity(chunk) for chunk in self._chunks()]
+        self._packed=np.concatenate(packed) if packed else np.zeros((0,(self._ncols+7)//8),dtype=np.uint8)
+        self._radar_data=None
+        logger.debug(f"packed the parity bits of the radar data into {self._packed.nbytes} bytes")
+    def _chunks(self):
+        if self._packed is not None:
+            for first in range(0,self._nrows,CsvFileRadar.packed_chunk_rows):
+                yield unpack_parity(self._packed[first:first+CsvFileRadar.packed_chunk_rows],self._ncols)
+            return
+        if self._radar_data is not None:
+            yield self._radar_data
+            return
+        for buf in read_csv_chunks(self._csv_file_path,self._chunk_bytes):
+            chunk=decode_csv(buf,self._delim,self._base,self._dtype)
+            if chunk.shape[1]!=self._ncols:
+                raise ValueError(f"inconsistent number of columns in {self._csv_file_path}: expected {self._ncols}, got {chunk.shape[1]}")
+            yield chunk
+
+class PlaylistRadar:
+    """
+    This class implements a radar element that plays a list of CSV files (e.g.
+    a recording that is split into many files) as one continuous stream of
+    radar lines. The files are given as an ordered list, or as a glob pattern,
+    in which case the matching files are played in natural order (i.e. "part2"
+    before "part10").
+
+    All files are scanned when the object is created, to determine the total
+    number of lines and the dtype that can hold the values of every file. While
+    the lines of one file are consumed, the next file is decoded in advance on
+    a background thread (unless prefetch is disabled), so that the stream does
+    not stall at the file boundaries. The decoding of the next file starts
+    when the consumer moves on to the current one, before it has released the
+    previous one (e.g. the last lines of a block), so up to three decoded files
+    can be in memory at a time (two without prefetch). Every call of lines or
+    blocks starts again at the first file.
+    """
+    short_name = "PLAY"
+    data_dir = CsvFileRadar.data_dir
+    scan_chunk_bytes = 1<<24
+    def __init__(self,files,delim:str=";",base:int=2,dtype:str=None,prefetch:bool=True):
+        """
+        Initializes a PlaylistRadar object.
+
+        Parameters:
+            files: glob pattern (str) or list of file names of the CSV files (in the data directory, or absolute paths).
+            delim(str): delimiter to assume for parsing the CSV files.
+            base(int): e.g. 2 for binary, 16 for hex.
+            dtype(str): integer dtype of the decoded values (None=narrowest dtype for the values in all files).
+            prefetch(bool): whether to decode the next file on a background thread.
+        """
+        if isinstance(files,str):
+            pattern = str(PlaylistRadar.data_dir / files)
+            self._files = sorted((Path(name) for name in glob.glob(pattern)),key=_natural_key)
+            if not self._files:
+                raise FileNotFoundError(f"no radar CSV files match {pattern}")
+        else:
+            self._files = [PlaylistRadar.data_dir / name for name in files]
+        self._delim = delim
+        self._base = base
+        self._prefetch = prefetch
+        self._file_rows = []
+        self._ncols = 0
+        maxwidth = 0
+        for filepath in self._files:
+            try:
+                nrows, ncols, width = scan_csv_file(filepath,delim,PlaylistRadar.scan_chunk_bytes)
+            except Exception as e:
+                logger.error(f"Problem reading radar CSV data from {filepath}: {e}")
+                raise
+            if nrows>0 and self._ncols>0 and ncols!=self._ncols:
+                raise ValueError(f"inconsistent number of columns in {filepath}: expected {self._ncols}, got {ncols}")
+            self._ncols = self._ncols or ncols
+            self._file_rows.append(nrows)
+            maxwidth = max(maxwidth,width)
+        self._dtype = narrowest_dtype(base,maxwidth) if dtype is None else np.dtype(dtype)
+        logger.debug(f"playlist of {len(self._files)} files with {self.nrows} radar lines")
+    @property
+    def nrows(self):
+        ' ' 'Total number of rows / radarlines of all files.' ' '
+        return sum(self._file_rows)
+    @property
+    def ncols(self):
+        ' ' 'Number of data values per radar line.' ' '
+        return self._ncols
+    @property
+    def dtype(self):
+        ' ' 'Integer dtype of the radar lines.' ' '
+        return self._dtype
+    @property
+    def files(self):
+        ' ' 'List with the paths of the files, in the order in which they are played.' ' '
+        return self._files
+    @property
+    def file_rows(self):
+        ' ' 'List with the number of rows of every file.' ' '
+        return self._file_rows
+    def lines(self):
+        ' ' 'Generator method that will yield the radar lines one at a time.' ' '
+        for chunk in self._chunks():
+            yield from chunk
+    def blocks(self,nsweeps:int):
+        ' ' 'Generator method that will yield the radar lines in blocks of (at most) nsweeps lines.' ' '
+        return rebatch(self._chunks(),nsweeps)
+    # implementation details
+    def _decode(self,filepath):
+        logger.debug(f"going to read CSV file {str(filepath)}")
+        try:
+            chunk=decode_csv(filepath.read_bytes(),self._delim,self._base,self._dtype)
+        except Exception as e:
+            logger.error(f"Problem reading radar CSV data from {filepath}: {e}")
+            raise
+        if chunk.shape[1]!=self._ncols:
+            raise ValueError(f"inconsistent number of columns in {filepath}: expected {self._ncols}, got {chunk.shape[1]}")
+        return chunk
+    def _chunks(self):
+        files=[filepath for filepath,nrows in zip(self._files,self._file_rows) if nrows>0]
+        if not self._prefetch:
+            for filepath in files:
+                yield self._decode(filepath)
+            return
+        with ThreadPoolExecutor(max_workers=1,thread_name_prefix="PLAY prefetch") as pool:
+            pending=None
+            for filepath in files:
+                future=pool.submit(self._decode,filepath)
+                if pending is not None:
+                    yield pending.result()
+                pending=future
+            if pending is not None:
+                yield pending.result()
+
+class NpyFileRadar:
+    """
+    This class implements a radar element that reads radar data from a binary
+    numpy ('.npy') file, with one radar line per row. By default the file is
+    memory mapped, so that the radar lines are views into the mapped file.
+    Such files can be created with numpy.save or with the radar cache.
+    """
+    short_name = "NPY"
+    data_dir = CsvFileRadar.data_dir
+    def __init__(self,filename:str,mmap:bool=True):
+        """
+        Initializes a NpyFileRadar object.
+
+        Parameters:
+            filename(str): file name of the npy file to use (in the data directory, or an absolute path).
+            mmap(bool): whether to memory map the file (read-only) instead of reading it into memory.
+        """
+        npy_filepath = NpyFileRadar.data_dir / filename
+        logger.debug(f"going to read npy file {str(npy_filepath)}")
+        try:
+            self._radar_data=np.load(npy_filepath,mmap_mode='r' if mmap else None)
+        except Exception as e:
+            logger.error(f"Problem reading radar npy data from {npy_filepath}: {e}")
+            raise
+        if self._radar_data.ndim!=2:
+            raise ValueError(f"radar data in {npy_filepath} should be 2-dimensional, got shape {self._radar_data.shape}")
+        self._nrows, self._ncols = self._radar_data.shape
+    @property
+    def nrows(self):
+        ' ' 'Number of rows / radarlines available from the npy file.' ' '
+        return self._nrows
+    @property
+    def ncols(self):
+        ' ' 'Number of data values per radar line.' ' '
+        return self._ncols
+    def lines(self):
+        ' ' 'Generator method that will yield the radar lines one at a time.' ' '
+        debug=logger.isEnabledFor(logging.DEBUG)
+        for lineno,line in enumerate(self._radar_data):
+            if debug:
+                logger.debug("radar sweep No. %d",lineno)
+            yield line
+    def blocks(self,nsweeps:int):
+        ' ' 'Generator method that will yield the radar lines in blocks of (at most) nsweeps lines.' ' '
+        for first in range(0,self._nrows,nsweeps):
+            logger.debug("radar sweeps No. %d to %d",first,min(first+nsweeps,self._nrows)-1)
+            yield self._radar_data[first:first+nsweeps]
+
+class SharedMemoryRadar:
+    """
+    This class implements a radar element that reads radar data from a named
+    shared memory block (multiprocessing.shared_memory), with one radar line per
+    row, e.g. data that were decoded once by a parent process and published for
+    its worker processes with the publish method. The radar lines are views into
+    the shared memory, which stays attached until close is called.
+
+    The shared memory can also hold the packed parity bits of the radar data
+    (see pack_parity), e.g. published from a packed CSV radar. Then the radar is
+    packed as well: it has a packed_blocks method, and its lines and blocks
+    methods yield the parity bits (0 or 1) of the values.
+    """
+    short_name = "SHM"
+    def __init__(self,name:str,shape:list,dtype:str,packed:bool=False):
+        """
+        Initializes a SharedMemoryRadar object.
+
+        Parameters:
+            name(str): name of the shared memory block.
+            shape(list): number of rows and columns (values per line) of the radar data.
+            dtype(str): dtype of the radar data (uint8 for packed data).
+            packed(bool): whether the block holds the packed parity bits of the radar data.
+        """
+        from multiprocessing import shared_memory
+        if len(shape)!=2:
+            raise ValueError(f"radar data should be 2-dimensional, got shape {shape}")
+        if packed and np.dtype(dtype)!=np.uint8:
+            raise ValueError(f"packed radar data should have dtype uint8, got {dtype}")
+        try:
+            # since python 3.13 the attaching process can opt out of tracking the block
+            self._shm = shared_memory.SharedMemory(name=name,track=False)
+        except TypeError:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._nrows, self._ncols = shape
+        self._packed = packed
+        storage_shape = (self._nrows,(self._ncols+7)//8) if packed else (self._nrows,self._ncols)
+        self._radar_data = np.ndarray(storage_shape,dtype=np.dtype(dtype),buffer=self._shm.buf)
+    @staticmethod
+    def publish(data,ncols:int=None):
+        """
+        Copies 2-dimensional radar data into a new shared memory block. The caller
+        owns the block, and should close and unlink it when it is no longer used.
+
+        Parameters:
+            data(numpy array): radar data, one radar line per row.
+            ncols(int): if not None, data are the packed parity bits (see pack_parity) of radar lines with ncols values.
+
+        Returns:
+            tuple with the SharedMemory object and the options for a SharedMemoryRadar (name, shape, dtype and packed).
+        """
+        from multiprocessing import shared_memory
+        if data.ndim!=2:
+            raise ValueError(f"radar data should be 2-dimensional, got shape {data.shape}")
+        if ncols is not None and (data.dtype!=np.uint8 or data.shape[1]!=(ncols+7)//8):
+            raise ValueError(f"packed data with dtype {data.dtype} and shape {data.shape} do not match {ncols} values per line")
+        shm = shared_memory.SharedMemory(create=True,size=max(1,data.nbytes))
+        np.ndarray(data.shape,dtype=data.dtype,buffer=shm.buf)[...] = data
+        shape = list(data.shape) if ncols is None else [data.shape[0],ncols]
+        return shm, dict(name=shm.name,shape=shape,dtype=data.dtype.str,packed=ncols is not None)
+    @property
+    def nrows(self):
+        ' ' 'Number of rows / radarlines in the shared memory block.' ' '
+        return self._nrows
+    @property
+    def ncols(self):
+        ' ' 'Number of data values per radar line.' ' '
+        return self._ncols
+    @property
+    def packed(self):
+        ' ' 'Whether the shared memory holds the packed parity bits of the radar data (see packed_blocks).' ' '
+        return self._packed
+    def lines(self):
+        ' ' 'Generator method that will yield the radar lines one at a time.' ' '
+        if self._packed:
+            for block in self.blocks(CsvFileRadar.packed_chunk_rows):
+                yield from block
+        else:
+            yield from self._radar_data
+    def blocks(self,nsweeps:int):
+        ' ' 'Generator method that will yield the radar lines in blocks of (at most) nsweeps lines.' ' '
+        for first in range(0,self._nrows,nsweeps):
+            block = self._radar_data[first:first+nsweeps]
+            yield unpack_parity(block,self._ncols) if self._packed else block
+    def packed_blocks(self,nsweeps:int):
+        ' ' 'Generator method that will yield blocks of (at most) nsweeps packed radar lines. Only available for packed data.' ' '
+        if not self._packed:
+            raise RuntimeError("packed blocks are only available from packed shared memory radar data")
+        for first in range(0,self._nrows,nsweeps):
+            yield self._radar_data[first:first+nsweeps]
+    def close(self):
+        ' ' 'Detaches the shared memory block; the radar lines cannot be used anymore afterwards.' ' '
+        self._radar_data = None
+        self._shm.close()
+
+class SocketRadar:
+    """
+    This class implements a radar element that receives radar lines from a TCP
+    or UDP socket, e.g. from a live sensor feed. Every frame holds one radar
+    line: ncols values of a fixed width dtype, optionally preceded by a 4 byte
+    (little endian, unsigned) sequence number. Over TCP the radar connects to the
+    given address and receives frames until the sender closes the connection.
+    Over UDP the radar binds to the given address, every datagram is one frame,
+    and an empty datagram ends the stream. With nrows=0 the number of lines is
+    unbounded, otherwise the radar stops after nrows lines.
+
+    The frames are received (recv_into) directly into a preallocated ring buffer
+    of ring_size frames, and the lines and blocks are views into the ring buffer.
+    They are only valid until the ring buffer wraps around, so consumers should
+    not hold on to more than ring_size lines (copy them if necessary); the
+    pipelined simulation checks that its queues fit in the ring buffer. A socket
+    stream can only be consumed once: every call of lines or blocks continues
+    where the previous one stopped.
+
+    With sequence numbers, gaps in the sequence are counted as dropped frames,
+    and frames that arrive late (out of order) are discarded. UDP datagrams that
+    are too short, and an incomplete frame at the end of a TCP stream, are
+    discarded and counted as short frames, UDP datagrams that are too long as
+    oversized frames. See stats.
+    """
+    short_name = "SOCK"
+    protocols = ("tcp","udp")
+    def __init__(self,port:int,ncols:int,host:str="127.0.0.1",protocol:str="tcp",dtype:str="<u2",sequence:bool=False,
+                 nrows:int=0,ring_size:int=4096,timeout:float=None):
+        """
+        Initializes a SocketRadar object.
+
+        Parameters:
+            port(int): TCP port to connect to, or UDP port to bind to (0=any free port, see address).
+            ncols(int): number of values per radar line.
+            host(str): host to connect to (TCP) or address to bind to (UDP).
+            protocol(str): "tcp" or "udp".
+            dtype(str): dtype of the values in a frame, e.g. "<u2" for little endian 16 bit values.
+            sequence(bool): whether every frame starts with a 4 byte sequence number.
+            nrows(int): number of radar lines to receive (0=unbounded).
+            ring_size(int): number of frames in the ring buffer.
+            timeout(float): maximum time to wait for a frame [seconds], after which the stream ends (None=wait forever).
+        """
+        import socket
+        if protocol not in SocketRadar.protocols:
+            raise ValueError(f"unknown protocol '{protocol}', should be one of {SocketRadar.protocols}")
+        if ncols<1 or ring_size<1:
+            raise ValueError(f"number of columns and ring size should be positive, got {ncols} and {ring_size}")
+        self._ncols = ncols
+        self._nrows = nrows
+        self._protocol = protocol
+        self._sequence = sequence
+        self._ring_size = ring_size
+        fields = [("seq","<u4")] if sequence else []
+        frame = np.dtype(fields+[("values",np.dtype(dtype),(ncols,))])
+        # every slot has a spare byte, so that a UDP datagram that is longer than a
+        # frame is received as one byte more than a frame (instead of truncated)
+        slot_bytes = frame.itemsize+1
+        self._ring = np.zeros(ring_size,dtype=np.dtype(dict(names=frame.names,formats=[frame.fields[name][0] for name in frame.names],
+                                                            offsets=[frame.fields[name][1] for name in frame.names],itemsize=slot_bytes)))
+        self._values = self._ring["values"]
+        self._seqs = self._ring["seq"] if sequence else None
+        receive_bytes = slot_bytes if protocol=="udp" else frame.itemsize
+        ring_bytes = memoryview(self._ring.view(np.uint8))
+        self._slots = [ring_bytes[i*slot_bytes:i*slot_bytes+receive_bytes] for i in range(ring_size)]
+        self._pos = 0
+        self._nframes = 0
+        self._ndropped = 0
+        self._nshort = 0
+        self._noversized = 0
+        self._nlate = 0
+        self._last_seq = None
+        self._ended = False
+        if protocol=="tcp":
+            self._sock = socket.create_connection((host,port))
+        else:
+            self._sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+            self._sock.bind((host,port))
+        self._sock.settimeout(timeout)
+    @property
+    def nrows(self):
+        ' ' 'Number of radar lines to receive (0=unbounded).' ' '
+        return self._nrows
+    @property
+    def ncols(self):
+        ' ' 'Number of data values per radar line.' ' '
+        return self._ncols
+    @property
+    def address(self):
+        ' ' 'Local address (host,port) of the socket, e.g. the port that a UDP sender should send to.' ' '
+        return self._sock.getsockname()
+    @property
+    def ring_size(self):
+        ' ' 'Number of frames in the ring buffer, i.e. the maximum number of radar lines that stay valid.' ' '
+        return self._ring_size
+    def stats(self):
+        """
+        Returns a dict with the number of received frames (radar lines), dropped
+        frames (gaps in the sequence numbers), short frames, oversized frames and
+        late frames.
+        """
+        return dict(frames=self._nframes,dropped=self._ndropped,short=self._nshort,oversized=self._noversized,late=self._nlate)
+    def lines(self):
+        ' ' 'Generator method that will yield the radar lines one at a time, as they are received.' ' '
+        debug=logger.isEnabledFor(logging.DEBUG)
+        while not self._done():
+            if self._pos==self._ring_size:
+                self._pos=0
+            if not self._receive(self._pos):
+                return
+            if debug:
+                logger.debug("radar sweep No. %d",self._nframes)
+            self._nframes += 1
+            self._pos += 1
+            yield self._values[self._pos-1]
+    def blocks(self,nsweeps:int):
+        """
+        Generator method that will yield the radar lines in blocks of (at most)
+        nsweeps lines, or ring_size lines if that is smaller. A block is yielded
+        when it is complete, or when the stream ends.
+        """
+        if nsweeps<1:
+            raise ValueError(f"number of sweeps per block should be positive, got {nsweeps}")
+        nsweeps=min(nsweeps,self._ring_size)
+        while not self._done():
+            if self._pos+nsweeps>self._ring_size:
+                self._pos=0
+            first=self._pos
+            while self._pos-first<nsweeps and not self._done() and self._receive(self._pos):
+                self._nframes += 1
+                self._pos += 1
+            if self._pos>first:
+                logger.debug("radar sweeps No. %d to %d",self._nframes-(self._pos-first),self._nframes-1)
+                yield self._values[first:self._pos]
+    def close(self):
+        ' ' 'Closes the socket.' ' '
+        self._ended = True
+        self._sock.close()
+    # implementation details
+    def _done(self):
+        return self._ended or (self._nrows>0 and self._nframes>=self._nrows)
+    def _receive(self,slot):
+        # receives the next valid frame into a slot of the ring buffer,
+        # returns False at the end of the stream
+        while self._receive_frame(self._slots[slot]):
+            if not self._sequence:
+                return True
+            seq=int(self._seqs[slot])
+            if self._last_seq is not None:
+                gap=(seq-self._last_seq)%2**32
+                if gap==0 or gap>=2**31:
+                    self._nlate += 1
+                    continue
+                self._ndropped += gap-1
+            self._last_seq=seq
+            return True
+        self._ended=True
+        return False
+    def _receive_frame(self,view):
+        import socket
+        try:
+            if self._protocol=="udp":
+                # the view has one byte more than a frame
+                while True:
+                    n=self._sock.recv_into(view)
+                    if n==len(view)-1:
+                        return True
+                    if n==0:
+                        return False
+                    if n<len(view):
+                        self._nshort += 1
+                    else:
+                        self._noversized += 1
+            n=self._sock.recv_into(view,0,socket.MSG_WAITALL)
+            while 0<n<len(view):
+                received=self._sock.recv_into(view[n:])
+                if received==0:
+                    break
+                n += received
+            if 0<n<len(view):
+                self._nshort += 1
+            return n==len(view)
+        except TimeoutError:
+            logger.warning(f"no radar frame received within {self._sock.gettimeout()} seconds, ending the radar stream")
+            return False
 
 class RandomTestRadar:
     """
     This class is intended to be used only for tests.
     It implements the same interface as CsvFileRadar.
+
+    The random values are generated in large blocks of sweeps at once, and the
+    lines are views into these blocks. Block number i is generated with its own
+    child generator, derived from the seed and i, so that the generated data
+    only depend on the seed, also when the next block is generated in advance on
+    a background thread (prefetch). With a seed, every call of lines or blocks
+    starts again at the first block, i.e. the radar yields the same data every
+    time. Without a seed, every call draws fresh entropy. The values are
+    generated with the narrowest integer dtype that holds the range of values,
+    unless a dtype is configured.
     """
     short_name="RND"
-    def __init__(self,nrows:int=0,ncols:int=11,low:int=10,high:int=100):
+    default_block_size=4096
+    def __init__(self,nrows:int=0,ncols:int=11,low:int=10,high:int=100,seed=None,block_size:int=default_block_size,prefetch:bool=False,
+                 dtype:str=None):
         """
         Initializes a RandomTestRadar object.
 
@@ -81,11 +661,22 @@ class RandomTestRadar:
             ncols(int): number of values to be generated per radar line
             low(int): minimum value (inclusive) to be generated
             high(int): maximum value (exclusive) to be generated
+            seed: seed for the random values (int or numpy SeedSequence, None=unpredictable)
+            block_size(int): number of radar lines that are generated at once
+            prefetch(bool): whether to generate the next block on a background thread
+            dtype(str): integer dtype of the generated values (None=narrowest dtype for the range of values)
         """
         self._nrows = nrows
         self._ncols = ncols
         self._low = low
         self._high = high
+        self._seed_seq = seed if seed is None or isinstance(seed,np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._block_size = block_size
+        self._prefetch = prefetch
+        if dtype is None:
+            dtype = next(t for t in [np.uint8,np.int8,np.uint16,np.int16,np.uint32,np.int32,np.uint64,np.int64]
+                         if np.iinfo(t).min<=low and high-1<=np.iinfo(t).max)
+        self._dtype = np.dtype(dtype)
     @property
     def nrows(self):
         ' ' 'Number of rows / radarlines to be generated (0=infinity).' ' '
@@ -94,16 +685,281 @@ class RandomTestRadar:
     def ncols(self):
         ' ' 'Number of values to be generated per radar line.' ' '
         return self._ncols
+    @property
+    def dtype(self):
+        ' ' 'Integer dtype of the generated values.' ' '
+        return self._dtype
     def lines(self):
         ' ' 'Generator method that will yield the radar lines one at a time.' ' '
-        lineno=0
-        while self._nrows==0 or lineno<self._nrows:
-            yield np.random.randint(high=self._high,low=self._low,size=self._ncols)
-            lineno += 1
+        for block in self.generated_blocks():
+            yield from block
+    def blocks(self,nsweeps:int):
+        ' ' 'Generator method that will yield the radar lines in blocks of (at most) nsweeps lines.' ' '
+        return rebatch(self.generated_blocks(),nsweeps)
+    def generated_blocks(self):
+        """
+        Generator method that yields the generated blocks themselves, without
+        regrouping, for batched consumers. All blocks have block_size lines,
+        except possibly the last one.
+        """
+        seed_seq = np.random.SeedSequence() if self._seed_seq is None else self._seed_seq
+        if not self._prefetch:
+            for iblock in self._block_indices():
+                yield self._generate(seed_seq,iblock)
+            return
+        with ThreadPoolExecutor(max_workers=1,thread_name_prefix="RND prefetch") as pool:
+            pending=None
+            for iblock in self._block_indices():
+                future=pool.submit(self._generate,seed_seq,iblock)
+                if pending is not None:
+                    yield pending.result()
+                pending=future
+            if pending is not None:
+                yield pending.result()
+    # implementation details
+    def _block_indices(self):
+        nblocks = -(-self._nrows//self._block_size)
+        return itertools.count() if self._nrows==0 else range(nblocks)
+    def _generate(self,seed_seq,iblock:int):
+        nlines = self._block_size
+        if self._nrows>0:
+            nlines = min(nlines,self._nrows-iblock*self._block_size)
+        child = np.random.SeedSequence(seed_seq.entropy,spawn_key=seed_seq.spawn_key+(iblock,))
+        return np.random.default_rng(child).integers(self._low,self._high,size=(nlines,self._ncols),dtype=self._dtype)
+
+def blocks(element,nsweeps:int):
+    """
+    Generator function that yields the radar lines of a radar element in 2-dimensional blocks.
+
+    Parameters:
+        element: radar element
+        nsweeps(int): maximum number of radar lines per block (the last block may be shorter)
+
+    Returns:
+        Generator of 2-dimensional arrays with shape (n,ncols), n<=nsweeps.
+    """
+    if nsweeps<1:
+        raise ValueError(f"number of sweeps per block should be positive, got {nsweeps}")
+    if hasattr(element,"blocks"):
+        yield from element.blocks(nsweeps)
+        return
+    buf=[]
+    for line in element.lines():
+        buf.append(line)
+        if len(buf)==nsweeps:
+            yield np.stack(buf)
+            buf=[]
+    if buf:
+        yield np.stack(buf)
+
+def rebatch(chunks,nsweeps:int):
+    """
+    Generator function that regroups a sequence of 2-dimensional arrays (with
+    the same number of columns) into blocks of nsweeps rows. Blocks that lie
+    entirely within one input chunk are yielded as views, only blocks that
+    straddle a chunk boundary are copied.
+
+    Parameters:
+        chunks: iterable of 2-dimensional arrays
+        nsweeps(int): number of rows per block (the last block may be shorter)
+    """
+    pending=[]
+    npending=0
+    for chunk in chunks:
+        first=0
+        if npending>0:
+            first=min(nsweeps-npending,len(chunk))
+            pending.append(chunk[:first])
+            npending += first
+            if npending<nsweeps:
+                continue
+            yield np.concatenate(pending)
+            pending=[]
+            npending=0
+        while len(chunk)-first>=nsweeps:
+            yield chunk[first:first+nsweeps]
+            first += nsweeps
+        if first<len(chunk):
+            pending.append(chunk[first:])
+            npending=len(chunk)-first
+    if npending>0:
+        yield np.concatenate(pending)
+
+_SEPARATOR=-1
+_IGNORED=-2
+_INVALID=-3
+_IGNORED_CHARS=b" \t\r"
+
+def _digit_table(delim:str,base:int):
+    if not 2<=base<=16:
+        raise ValueError(f"unsupported base {base}, should be between 2 and 16")
+    table=np.full(256,_INVALID,dtype=np.int8)
+    for value,char in enumerate("0123456789abcdef"[:base]):
+        table[ord(char)]=value
+        table[ord(char.upper())]=value
+    for char in _IGNORED_CHARS:
+        table[char]=_IGNORED
+    table[ord("\n")]=_SEPARATOR
+    table[ord(delim)]=_SEPARATOR
+    return table
+
+def _natural_key(path):
+    # sort key that orders the numbers in file names by value, e.g. "part2" before "part10"
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)",str(path))]
+
+def _is_nonblank_newline(codes,newline):
+    # blank lines are newlines that are preceded by another newline (or by
+    # the start of the buffer) when ignoring white space
+    significant=np.flatnonzero(codes!=_IGNORED)
+    nl=newline[significant]
+    blank=nl.copy()
+    blank[1:] &= nl[:-1]
+    return significant[nl & ~blank], significant[blank]
+
+def narrowest_dtype(base:int,width:int):
+    """
+    Returns the narrowest unsigned integer dtype that can hold every value
+    with (at most) width digits in the given base.
+    """
+    max_value=base**max(1,width)-1
+    for dtype in [np.uint8,np.uint16,np.uint32,np.uint64]:
+        if max_value<=np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"values with {width} digits in base {base} do not fit in 64 bits")
+
+def pack_parity(block):
+    """
+    Packs the parity bits (lowest bits) of a 2-dimensional block of integer
+    values, eight values per byte, in the order of numpy.packbits.
+
+    Returns:
+        uint8 array with shape (n,ceil(ncols/8)); unused bits at the end of a row are zero.
+    """
+    return np.packbits((block&1).astype(np.uint8,copy=False),axis=1)
+
+def unpack_parity(packed,ncols:int):
+    ' ' 'Inverse of pack_parity: returns the parity bits as a uint8 array with shape (n,ncols).' ' '
+    return np.unpackbits(packed,axis=1,count=ncols)
+
+def decode_csv(buf:bytes,delim:str=";",base:int=2,dtype=None):
+    """
+    Decodes CSV text with unsigned integer values in the given base (2..16),
+    using vectorized arithmetic on the raw bytes instead of per value conversion.
+    White space (blanks, tabs and carriage returns) and blank lines are ignored.
+
+    Parameters:
+        buf(bytes): CSV text, consisting of complete lines.
+        delim(str): single character delimiter.
+        base(int): e.g. 2 for binary, 16 for hex.
+        dtype: integer dtype of the result (None=narrowest dtype for the widest value, see narrowest_dtype).
+
+    Returns:
+        2-dimensional integer array with one row per (non-blank) line.
+    """
+    if len(delim)!=1:
+        raise ValueError(f"delimiter should be a single character, got '{delim}'")
+    raw=np.frombuffer(buf,dtype=np.uint8)
+    if len(raw)>0 and raw[-1]!=ord("\n"):
+        raw=np.append(raw,np.uint8(ord("\n")))
+    codes=_digit_table(delim,base)[raw]
+    if np.any(codes==_INVALID):
+        bad=bytes(raw[np.flatnonzero(codes==_INVALID)[:1]])
+        raise ValueError(f"invalid character {bad} for base {base} CSV data")
+    newline=raw==ord("\n")
+    eol,blank=_is_nonblank_newline(codes,newline)
+    is_sep=codes==_SEPARATOR
+    is_sep[blank]=False
+    nrows=len(eol)
+    if nrows==0:
+        return np.zeros((0,0),dtype=np.uint8 if dtype is None else dtype)
+    # field index of each digit = number of separators before it
+    field_id=np.cumsum(is_sep)
+    nfields=int(field_id[-1])
+    if nfields%nrows!=0 or np.any(field_id[eol]!=np.arange(1,nrows+1)*(nfields//nrows)):
+        raise ValueError("lines with different numbers of values")
+    is_digit=codes>=0
+    digits=codes[is_digit].astype(np.int64)
+    field_id=field_id[is_digit]
+    starts=np.flatnonzero(np.diff(field_id,prepend=-1))
+    if len(starts)!=nfields:
+        raise ValueError("empty value(s) in CSV data")
+    ends=np.append(starts[1:],len(digits))
+    widths=ends-starts
+    maxwidth=int(widths.max())
+    if base**maxwidth>np.iinfo(np.int64).max:
+        raise ValueError(f"values with {maxwidth} digits in base {base} do not fit in 64 bits")
+    powers=base**np.arange(maxwidth,dtype=np.int64)
+    exponents=np.repeat(ends,widths)-np.arange(len(digits))-1
+    values=np.add.reduceat(digits*powers[exponents],starts)
+    if dtype is None:
+        dtype=narrowest_dtype(base,maxwidth)
+    elif values.max()>np.iinfo(dtype).max:
+        raise ValueError(f"value {values.max()} does not fit in dtype {np.dtype(dtype).name}")
+    return values.astype(dtype).reshape(nrows,nfields//nrows)
+
+def read_csv_chunks(filepath,chunk_bytes:int):
+    """
+    Generator function that reads a text file in chunks of complete lines.
+
+    Parameters:
+        filepath: path of the file
+        chunk_bytes(int): approximate number of bytes per chunk (a chunk is
+            extended to the end of the current line, if necessary).
+
+    Returns:
+        Generator of bytes objects, each ending with a newline.
+    """
+    with open(filepath,"rb") as fp:
+        rest=b""
+        while True:
+            data=fp.read(chunk_bytes)
+            if not data:
+                break
+            cut=data.rfind(b"\n")+1
+            if cut==0:
+                rest += data
+                continue
+            yield rest+data[:cut]
+            rest=data[cut:]
+        if rest.strip():
+            yield rest+b"\n"
+
+def scan_csv_file(filepath,delim:str,chunk_bytes:int):
+    """
+    Determines the number of (non-blank) lines, the number of values per line
+    and the maximum number of digits per value of a CSV file, without decoding
+    the values, and reading only one chunk at a time.
+
+    Returns:
+        tuple with the number of rows, the number of columns and the maximum width.
+    """
+    nrows=0
+    ncols=0
+    maxwidth=0
+    table=_digit_table(delim,16)
+    for buf in read_csv_chunks(filepath,chunk_bytes):
+        raw=np.frombuffer(buf,dtype=np.uint8)
+        codes=table[raw]
+        eol,blank=_is_nonblank_newline(codes,raw==ord("\n"))
+        if ncols==0 and len(eol)>0:
+            first_line=buf[:eol[0]]
+            ncols=first_line.count(delim.encode())+1
+        nrows += len(eol)
+        # width of a value = number of digits since the previous separator
+        ndigits=np.cumsum(codes>=0)[codes==_SEPARATOR]
+        if len(ndigits)>0:
+            maxwidth=max(maxwidth,int(np.diff(ndigits,prepend=0).max()))
+    return nrows,ncols,maxwidth
 
 def get_names():
-    ' ' 'Returns list of short names of radar system implementations.' ' '
-    return [impl.short_name for impl in [CsvFileRadar,RandomTestRadar]]
+    ' ' 'Returns list of short names of radar system implementations (see the registry module).' ' '
+    return registry.get_names("radar")
+
+def get_implementation(name:str=CsvFileRadar.short_name):
+    """
+    Returns the radar element class with the given short name.
+    """
+    return registry.get_implementation("radar",name)
 
 def get_element(name:str=CsvFileRadar.short_name,options:dict={}):
     """
@@ -116,11 +972,7 @@ def get_element(name:str=CsvFileRadar.short_name,options:dict={}):
     Returns:
         Radar element of the specified class
     """
-    implementations = [CsvFileRadar,RandomTestRadar]
-    for impl in implementations:
-        if name==impl.short_name:
-            return impl(**options)
-    raise RuntimeError(f"Unknown radar element implementation '{name}'")
+    return get_implementation(name)(**options)
 
 
 #######################################################################
@@ -163,6 +1015,247 @@ class TestCsvFileRadar(unittest.TestCase):
                 self.assertEqual(line[ncols-1],lineno%nmod,msg=f"In this unit test, the last value of every line should equal line number modulo {nmod}")
             self.assertEqual(lineno+1,nrows, msg="Wrong number of lines yielded from customized test CSV radar element.")
             Path(test_path).unlink()
+    def test_chunked(self):
+        eager = CsvFileRadar(filename="hexdata.csv",delim="|",base=16)
+        for chunk_bytes in [1,100,1000,100000]:
+            chunked = CsvFileRadar(filename="hexdata.csv",delim="|",base=16,chunk_bytes=chunk_bytes)
+            self.assertIsNone(chunked._radar_data)
+            self.assertEqual(chunked.nrows,eager.nrows)
+            self.assertEqual(chunked.ncols,eager.ncols)
+            self.assertTrue(np.array_equal(np.array(list(chunked.lines())),eager._radar_data))
+            for nsweeps in [1,7,64]:
+                self.assertTrue(np.array_equal(np.concatenate(list(blocks(chunked,nsweeps))),eager._radar_data))
+    def test_decode(self):
+        self.assertTrue(np.array_equal(decode_csv(b"101;0\n\n 11 ;1\r\n",";",2),[[5,0],[3,1]]))
+        self.assertTrue(np.array_equal(decode_csv(b"ff|A|0",delim="|",base=16),[[255,10,0]]))
+        self.assertEqual(decode_csv(b"",";",2).shape,(0,0))
+        for bad in [b"101;2\n", b"1;;0\n", b"1;0\n1\n", b"1,0\n"]:
+            with self.assertRaises(ValueError, msg=f"this is supposed to crash: {bad}"):
+                decode_csv(bad,";",2)
+        rng = np.random.default_rng(42)
+        data = rng.integers(0,1024,size=(100,41))
+        for base,fmt in [(16,"{:x}"),(2,"{:b}"),(10,"{:d}")]:
+            text = "\n".join("|".join(fmt.format(v) for v in row) for row in data).encode()
+            self.assertTrue(np.array_equal(decode_csv(text,"|",base),data))
+    def test_blocks(self):
+        csv_radar = CsvFileRadar()
+        all_lines = np.array(list(csv_radar.lines()))
+        for nsweeps in [1,3,20,64]:
+            block_list = list(blocks(csv_radar,nsweeps))
+            self.assertEqual(len(block_list),(20+nsweeps-1)//nsweeps)
+            self.assertTrue(all(len(block)<=nsweeps for block in block_list))
+            self.assertTrue(np.array_equal(np.concatenate(block_list),all_lines))
+        with self.assertRaises(ValueError):
+            next(blocks(csv_radar,0))
+
+    def test_cache(self):
+        eager = CsvFileRadar(filename="hexdata.csv",delim="|",base=16)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for chunk_bytes in [0,1000]:
+                first = CsvFileRadar(filename="hexdata.csv",delim="|",base=16,chunk_bytes=chunk_bytes,cache=True,cache_dir=cache_dir)
+                self.assertEqual(len(list(Path(cache_dir).glob("*.npy"))),1)
+                second = CsvFileRadar(filename="hexdata.csv",delim="|",base=16,cache=True,cache_dir=cache_dir)
+                for cached in [first,second]:
+                    self.assertIsInstance(cached._radar_data,np.memmap)
+                    self.assertEqual((cached.nrows,cached.ncols),(eager.nrows,eager.ncols))
+                    self.assertTrue(np.array_equal(np.array(list(cached.lines())),eager._radar_data))
+            with self.assertRaises(FileNotFoundError, msg="this is supposed to crash"):
+                logger.error("The following error message about a nonexistent csv file is intentional.")
+                CsvFileRadar(filename="nonexistent.csv",cache=True,cache_dir=cache_dir)
+            wide = CsvFileRadar(filename="hexdata.csv",delim="|",base=16,cache=True,cache_dir=cache_dir,dtype="int64")
+            self.assertEqual(wide.dtype,np.int64)
+            self.assertEqual(len(list(Path(cache_dir).glob("*.npy"))),2)
+    def test_dtype(self):
+        self.assertEqual(narrowest_dtype(2,7),np.uint8)
+        self.assertEqual(narrowest_dtype(16,3),np.uint16)
+        self.assertEqual(narrowest_dtype(10,10),np.uint64)
+        self.assertEqual(decode_csv(b"ffff;0\n",";",16).dtype,np.uint16)
+        self.assertEqual(decode_csv(b"ff;0\n",";",16,np.int32).dtype,np.int32)
+        with self.assertRaises(ValueError, msg="this is supposed to crash: value too large for the dtype"):
+            decode_csv(b"100;0\n",";",16,np.uint8)
+        eager = CsvFileRadar(filename="hexdata.csv",delim="|",base=16)
+        self.assertEqual(CsvFileRadar().dtype,np.uint8)
+        self.assertEqual(eager.dtype,np.uint16)
+        chunked = CsvFileRadar(filename="hexdata.csv",delim="|",base=16,chunk_bytes=100)
+        self.assertTrue(all(line.dtype==np.uint16 for line in chunked.lines()))
+        self.assertEqual(RandomTestRadar(nrows=3).dtype,np.uint8)
+        self.assertEqual(RandomTestRadar(nrows=3,low=-1,high=1000).dtype,np.int16)
+    def test_packed(self):
+        from airdefense import IFF
+        iff = IFF.EvenOddIffMethod()
+        eager = CsvFileRadar(filename="hexdata.csv",delim="|",base=16)
+        for chunk_bytes in [0,100]:
+            packed = CsvFileRadar(filename="hexdata.csv",delim="|",base=16,chunk_bytes=chunk_bytes,packed=True)
+            self.assertTrue(packed.packed)
+            self.assertFalse(eager.packed)
+            self.assertEqual((packed.nrows,packed.ncols),(eager.nrows,eager.ncols))
+            self.assertTrue(np.array_equal(np.array(list(packed.lines())),eager._radar_data%2))
+            packed_verdicts = np.concatenate([iff.evaluate_packed_batch(block,packed.ncols) for block in packed.packed_blocks(7)])
+            self.assertTrue(np.array_equal(packed_verdicts,iff.evaluate_batch(eager._radar_data)))
+        with self.assertRaises(RuntimeError):
+            next(eager.packed_blocks(7))
+
+class TestPlaylistRadar(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the playlist radar class.
+    """
+    def setUp(self):
+        logging.disable(logging.INFO)
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+    def test_playlist(self):
+        rng = np.random.default_rng(5)
+        parts = [rng.integers(0,256,size=(nrows,6)) for nrows in [5,0,130,64]]
+        parts[2][0,0] = 4095
+        with tempfile.TemporaryDirectory() as tmpdir:
+            names = []
+            for ipart,part in enumerate(parts):
+                names.append(str(Path(tmpdir) / f"part{[2,9,10,100][ipart]}.csv"))
+                np.savetxt(names[-1],part,fmt="%x",delimiter="|")
+            reference = np.concatenate(parts)
+            for prefetch in [False,True]:
+                playlist = PlaylistRadar(files=str(Path(tmpdir) / "part*.csv"),delim="|",base=16,prefetch=prefetch)
+                self.assertEqual([str(path) for path in playlist.files],names)
+                self.assertEqual(playlist.file_rows,[5,0,130,64])
+                self.assertEqual((playlist.nrows,playlist.ncols),reference.shape)
+                self.assertEqual(playlist.dtype,np.uint16)
+                self.assertTrue(np.array_equal(np.array(list(playlist.lines())),reference))
+                self.assertTrue(np.array_equal(np.array(list(playlist.lines())),reference),msg="lines should start again at the first file")
+                for nsweeps in [1,7,64]:
+                    block_list = list(blocks(playlist,nsweeps))
+                    self.assertTrue(all(block.shape[1]==6 and len(block)<=nsweeps for block in block_list))
+                    self.assertTrue(np.array_equal(np.concatenate(block_list),reference))
+            playlist = PlaylistRadar(files=[names[3],names[0]],delim="|",base=16)
+            self.assertEqual(playlist.dtype,np.uint8)
+            self.assertTrue(np.array_equal(np.array(list(playlist.lines())),np.concatenate([parts[3],parts[0]])))
+            np.savetxt(Path(tmpdir) / "part1000.csv",parts[0][:,:5],fmt="%x",delimiter="|")
+            with self.assertRaises(ValueError, msg="this is supposed to crash: inconsistent number of columns"):
+                PlaylistRadar(files=str(Path(tmpdir) / "part*.csv"),delim="|",base=16)
+            with self.assertRaises(FileNotFoundError, msg="this is supposed to crash"):
+                PlaylistRadar(files=str(Path(tmpdir) / "nonexistent*.csv"))
+    def test_simulation(self):
+        from airdefense import pads
+        config = pads.read_config("hex_low_pk.json")
+        single = pads.simulation(config=config,clock_name="virtual",seed=3,sinks=[]).run()
+        config["radar"] = dict(name=PlaylistRadar.short_name,options=dict(files=["hexdata.csv"]*3,delim="|",base=16))
+        summary = pads.simulation(config=config,clock_name="virtual",seed=3,sinks=[]).run()
+        self.assertEqual(summary.sweeps,3*single.sweeps)
+        self.assertEqual(summary.foes,3*single.foes)
+
+class TestNpyFileRadar(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the npy file radar class.
+    """
+    def test_roundtrip(self):
+        data = np.arange(60).reshape(12,5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            npy_path = Path(tmpdir) / "radar.npy"
+            np.save(npy_path,data)
+            for mmap in [True,False]:
+                npy_radar = get_element("NPY",dict(filename=str(npy_path),mmap=mmap))
+                self.assertEqual((npy_radar.nrows,npy_radar.ncols),(12,5))
+                self.assertTrue(np.array_equal(np.array(list(npy_radar.lines())),data))
+                self.assertTrue(np.array_equal(np.concatenate(list(blocks(npy_radar,5))),data))
+            del npy_radar
+            np.save(npy_path,np.arange(5))
+            with self.assertRaises(ValueError, msg="this is supposed to crash: 1-dimensional data"):
+                NpyFileRadar(filename=str(npy_path))
+
+class TestSharedMemoryRadar(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the shared memory radar class.
+    """
+    def test_roundtrip(self):
+        data = CsvFileRadar(filename="hexdata.csv",delim="|",base=16)._radar_data
+        shm, options = SharedMemoryRadar.publish(data)
+        try:
+            shm_radar = get_element("SHM",options)
+            self.assertEqual((shm_radar.nrows,shm_radar.ncols),data.shape)
+            self.assertTrue(np.array_equal(np.array(list(shm_radar.lines())),data))
+            self.assertTrue(np.array_equal(np.concatenate(list(blocks(shm_radar,7))),data))
+            self.assertEqual(next(shm_radar.lines()).dtype,data.dtype)
+            shm_radar.close()
+        finally:
+            shm.close()
+            shm.unlink()
+        with self.assertRaises(ValueError):
+            SharedMemoryRadar.publish(np.arange(5))
+    def test_packed(self):
+        csv_radar = CsvFileRadar(filename="hexdata.csv",delim="|",base=16,packed=True)
+        packed = np.concatenate(list(csv_radar.packed_blocks(csv_radar.nrows)))
+        shm, options = SharedMemoryRadar.publish(packed,ncols=csv_radar.ncols)
+        try:
+            shm_radar = get_element("SHM",options)
+            self.assertTrue(shm_radar.packed)
+            self.assertEqual((shm_radar.nrows,shm_radar.ncols),(csv_radar.nrows,csv_radar.ncols))
+            self.assertTrue(np.array_equal(np.concatenate(list(shm_radar.packed_blocks(5))),packed))
+            self.assertTrue(np.array_equal(np.concatenate(list(blocks(shm_radar,7))),np.array(list(csv_radar.lines()))))
+            self.assertTrue(np.array_equal(np.array(list(shm_radar.lines())),np.array(list(csv_radar.lines()))))
+            shm_radar.close()
+        finally:
+            shm.close()
+            shm.unlink()
+        with self.assertRaises(ValueError):
+            SharedMemoryRadar.publish(packed,ncols=csv_radar.ncols+8)
+
+class TestSocketRadar(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the socket radar class, over the loopback interface.
+    """
+    ncols = 7
+    def frame(self,seq,line):
+        return np.uint32(seq).astype("<u4").tobytes()+np.asarray(line,dtype="<u2").tobytes()
+    def test_tcp(self):
+        import socket, threading
+        data = np.arange(20*self.ncols).reshape(20,self.ncols)
+        server = socket.create_server(("127.0.0.1",0))
+        def send():
+            conn,_ = server.accept()
+            with conn:
+                for seq,line in enumerate(data):
+                    if seq!=5:
+                        conn.sendall(self.frame(seq,line))
+                conn.sendall(self.frame(3,data[3]))
+                conn.sendall(self.frame(20,data[0])[:-3])
+        sender = threading.Thread(target=send)
+        sender.start()
+        sock_radar = get_element("SOCK",dict(port=server.getsockname()[1],ncols=self.ncols,sequence=True,ring_size=8))
+        received = [line.copy() for line in sock_radar.lines()]
+        sender.join()
+        server.close()
+        sock_radar.close()
+        self.assertTrue(np.array_equal(np.array(received),np.delete(data,5,axis=0)))
+        self.assertEqual(sock_radar.stats(),dict(frames=19,dropped=1,short=1,oversized=0,late=1))
+        self.assertEqual(list(sock_radar.lines()),[])
+    def test_udp(self):
+        import socket
+        data = np.arange(30*self.ncols).reshape(30,self.ncols)
+        sock_radar = SocketRadar(port=0,ncols=self.ncols,protocol="udp",ring_size=16,timeout=5)
+        with socket.socket(socket.AF_INET,socket.SOCK_DGRAM) as sender:
+            for line in data:
+                sender.sendto(np.asarray(line,dtype="<u2").tobytes(),sock_radar.address)
+            sender.sendto(b"\x00\x01\x02",sock_radar.address)
+            sender.sendto(np.arange(self.ncols+1,dtype="<u2").tobytes(),sock_radar.address)
+            sender.sendto(np.arange(self.ncols,dtype="<u2").tobytes()+b"\x00",sock_radar.address)
+            sender.sendto(b"",sock_radar.address)
+        block_list = list(blocks(sock_radar,12))
+        sock_radar.close()
+        self.assertEqual([len(block) for block in block_list],[12,12,6])
+        self.assertTrue(all(np.shares_memory(block,sock_radar._ring) for block in block_list))
+        self.assertTrue(np.array_equal(block_list[-1],data[24:]))
+        self.assertEqual(sock_radar.stats()["short"],1)
+        self.assertEqual(sock_radar.stats()["oversized"],2)
+        self.assertEqual(sock_radar.ring_size,16)
+    def test_nrows(self):
+        import socket
+        sock_radar = SocketRadar(port=0,ncols=self.ncols,protocol="udp",nrows=3)
+        with socket.socket(socket.AF_INET,socket.SOCK_DGRAM) as sender:
+            for i in range(5):
+                sender.sendto(np.full(self.ncols,i,dtype="<u2").tobytes(),sock_radar.address)
+        self.assertEqual([int(line[0]) for line in sock_radar.lines()],[0,1,2])
+        sock_radar.close()
+        with self.assertRaises(ValueError):
+            SocketRadar(port=0,ncols=self.ncols,protocol="sctp")
 
 class TestRandomTestRadar(unittest.TestCase):
     """
@@ -195,3 +1288,53 @@ class TestRandomTestRadar(unittest.TestCase):
                     self.assertTrue(all(line<high))
                     self.assertTrue(lineno<nrows,msg=f"In this test we expected exactly {nrows} lines of data.")
                 self.assertEqual(lineno+1,nrows, msg="Wrong number of lines yielded from 'random test' radar element.")
+    def test_blocks(self):
+        for nrows,nsweeps in [(5,2),(1000,64),(0,64)]:
+            rnd_radar = RandomTestRadar(nrows=nrows, ncols=21, low=0, high=50)
+            nlines=0
+            for iblock,block in enumerate(blocks(rnd_radar,nsweeps)):
+                self.assertEqual(block.shape[1],21)
+                self.assertTrue(0<len(block)<=nsweeps)
+                self.assertTrue(np.all(block>=0))
+                self.assertTrue(np.all(block<50))
+                nlines += len(block)
+                if nrows==0 and iblock==10:
+                    break
+            if nrows>0:
+                self.assertEqual(nlines,nrows)
+    def test_blocks_fallback(self):
+        class LinesOnlyRadar:
+            nrows=7
+            ncols=3
+            def lines(self):
+                for i in range(7):
+                    yield np.full(3,i)
+        block_list = list(blocks(LinesOnlyRadar(),3))
+        self.assertEqual([len(block) for block in block_list],[3,3,1])
+        self.assertTrue(np.array_equal(np.concatenate(block_list)[:,0],np.arange(7)))
+    def test_seed(self):
+        reference = np.concatenate(list(RandomTestRadar(nrows=1000,ncols=21,seed=42,block_size=64).generated_blocks()))
+        self.assertEqual(reference.shape,(1000,21))
+        for prefetch in [False,True]:
+            rnd_radar = RandomTestRadar(nrows=1000,ncols=21,seed=42,block_size=64,prefetch=prefetch)
+            self.assertTrue(np.array_equal(np.array(list(rnd_radar.lines())),reference))
+            self.assertTrue(np.array_equal(np.array(list(rnd_radar.lines())),reference),msg="lines should start again at the first block")
+            self.assertTrue(np.array_equal(np.concatenate(list(blocks(rnd_radar,100))),reference))
+        other = RandomTestRadar(nrows=1000,ncols=21,seed=43,block_size=64)
+        self.assertFalse(np.array_equal(np.array(list(other.lines())),reference))
+        # without a seed, every pass (and every radar with the same options) gets different data
+        rnd_radar = RandomTestRadar(nrows=1000,ncols=21,block_size=64)
+        first = np.concatenate(list(rnd_radar.blocks(100)))
+        self.assertFalse(np.array_equal(np.concatenate(list(rnd_radar.blocks(100))),first))
+        self.assertFalse(np.array_equal(np.array(list(rnd_radar.lines())),first))
+        self.assertFalse(np.array_equal(np.concatenate(list(RandomTestRadar(nrows=1000,ncols=21,block_size=64).blocks(100))),first))
+    def test_generated_blocks(self):
+        rnd_radar = RandomTestRadar(nrows=0,ncols=5,seed=1,block_size=100,prefetch=True)
+        for iblock,block in enumerate(rnd_radar.generated_blocks()):
+            self.assertEqual(block.shape,(100,5))
+            if iblock==20:
+                break
+        rnd_radar = RandomTestRadar(nrows=250,ncols=5,seed=1,block_size=100)
+        self.assertEqual([len(block) for block in rnd_radar.generated_blocks()],[100,100,50])
+        line = next(rnd_radar.lines())
+        self.assertIsNotNone(line.base,msg="radar lines should be views into a generated block")
@@ -0,0 +1,187 @@
+"""
+This module provides a cache for decoded radar data. Decoding a large radar
+recording from CSV text takes much longer than mapping the decoded values into
+memory from a binary file. The cache stores decoded radar data as '.npy' files,
+which can be opened with memory mapping, so that radar lines are views into the
+mapped file instead of copies.
+
+A cache entry is identified by the (resolved) path, modification time and size
+of the source file, together with the decoding parameters. A cache entry is
+therefore automatically invalidated when the source file changes. The total
+size of the cache directory is bounded: when a new entry is stored, the least
+recently used entries are removed until the total size is within the limit.
+"""
+
+import numpy as np
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import logging
+logger=logging.getLogger(__name__)
+
+class RadarCache:
+    """
+    Size bounded directory of memory mappable radar data files.
+    """
+    default_dir = Path(__file__).parent.parent / "cache"
+    default_max_bytes = 2**32
+    version = 1
+    def __init__(self,cache_dir:str=None,max_bytes:int=default_max_bytes):
+        """
+        Initializes a RadarCache object.
+
+        Parameters:
+            cache_dir(str): directory for the cache files (created if necessary).
+            max_bytes(int): maximum total size of the cache files.
+        """
+        self._dir = RadarCache.default_dir if cache_dir is None else Path(cache_dir)
+        self._max_bytes = max_bytes
+    @property
+    def cache_dir(self):
+        ' ' 'Directory in which the cache files are stored.' ' '
+        return self._dir
+    def key(self,filepath,**params):
+        """
+        Computes the cache key for a source file and decoding parameters.
+
+        Parameters:
+            filepath: path of the source file
+            params: decoding parameters (should be json serializable)
+
+        Returns:
+            hex digest string
+        """
+        filepath=Path(filepath).resolve()
+        stat=filepath.stat()
+        ident=dict(path=str(filepath),mtime_ns=stat.st_mtime_ns,size=stat.st_size,version=RadarCache.version,**params)
+        return hashlib.sha1(json.dumps(ident,sort_keys=True).encode()).hexdigest()
+    def path(self,filepath,**params):
+        ' ' 'Returns the path of the cache file for a source file and decoding parameters.' ' '
+        return self._dir / f"{Path(filepath).stem}-{self.key(filepath,**params)[:20]}.npy"
+    def load(self,filepath,**params):
+        """
+        Opens the cached data for a source file and decoding parameters, if available.
+
+        Returns:
+            read-only memory mapped array, or None in case of a cache miss.
+        """
+        cache_path=self.path(filepath,**params)
+        if not cache_path.exists():
+            logger.debug(f"radar cache miss for {filepath}")
+            return None
+        logger.debug(f"radar cache hit for {filepath}: {cache_path}")
+        os.utime(cache_path)
+        return np.load(cache_path,mmap_mode='r')
+    def store(self,filepath,chunks,shape,dtype=np.int64,**params):
+        """
+        Writes decoded data for a source file and decoding parameters to the cache.
+        The data are written chunk by chunk into a temporary file, which is only
+        renamed into place after it is complete.
+
+        Parameters:
+            filepath: path of the source file
+            chunks: iterable of 2-dimensional arrays with the decoded rows
+            shape(tuple): shape of the complete data array
+            dtype: dtype of the stored data
+            params: decoding parameters (should be json serializable)
+
+        Returns:
+            read-only memory mapped array with the stored data.
+        """
+        cache_path=self.path(filepath,**params)
+        self._dir.mkdir(parents=True,exist_ok=True)
+        fd,tmp_name=tempfile.mkstemp(dir=self._dir,suffix=".tmp")
+        os.close(fd)
+        try:
+            data=np.lib.format.open_memmap(tmp_name,mode='w+',dtype=dtype,shape=tuple(shape))
+            first=0
+            for chunk in chunks:
+                data[first:first+len(chunk)]=chunk
+                first += len(chunk)
+            if first!=shape[0]:
+                raise ValueError(f"expected {shape[0]} rows for {filepath}, got {first}")
+            data.flush()
+            del data
+            os.replace(tmp_name,cache_path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        logger.debug(f"stored radar data from {filepath} in cache file {cache_path}")
+        self.evict(keep=cache_path)
+        return np.load(cache_path,mmap_mode='r')
+    def evict(self,keep=None):
+        """
+        Removes least recently used cache files until the total size of the
+        cache files is at most the configured maximum.
+
+        Parameters:
+            keep: path of a cache file that should not be removed.
+
+        Returns:
+            list of paths of the removed cache files.
+        """
+        if not self._dir.exists():
+            return []
+        entries=sorted((p.stat().st_mtime_ns,p.stat().st_size,p) for p in self._dir.glob("*.npy"))
+        total=sum(size for _,size,_ in entries)
+        removed=[]
+        for _,size,cache_path in entries:
+            if total<=self._max_bytes:
+                break
+            if keep is not None and cache_path==Path(keep):
+                continue
+            logger.debug(f"evicting radar cache file {cache_path}")
+            cache_path.unlink(missing_ok=True)
+            total -= size
+            removed.append(cache_path)
+        return removed
+
+#######################################################################
+
+class TestRadarCache(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the radar cache.
+    """
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._tmp = Path(self._tmpdir.name)
+        self._src = self._tmp / "source.csv"
+        self._src.write_text("1;0\n0;1\n")
+    def tearDown(self):
+        self._tmpdir.cleanup()
+    def test_roundtrip(self):
+        cache = RadarCache(self._tmp / "cache")
+        self.assertIsNone(cache.load(self._src,delim=";",base=2))
+        data = np.arange(20).reshape(10,2)
+        stored = cache.store(self._src,[data[:3],data[3:]],data.shape,delim=";",base=2)
+        self.assertTrue(np.array_equal(stored,data))
+        loaded = cache.load(self._src,delim=";",base=2)
+        self.assertIsInstance(loaded,np.memmap)
+        self.assertFalse(loaded.flags.writeable)
+        self.assertTrue(np.array_equal(loaded,data))
+        self.assertIsNone(cache.load(self._src,delim="|",base=2))
+        self.assertIsNone(cache.load(self._src,delim=";",base=16))
+    def test_invalidation(self):
+        cache = RadarCache(self._tmp / "cache")
+        data = np.zeros((2,2),dtype=int)
+        cache.store(self._src,[data],data.shape,delim=";",base=2)
+        self.assertIsNotNone(cache.load(self._src,delim=";",base=2))
+        self._src.write_text("1;0\n0;1\n1;1\n")
+        self.assertIsNone(cache.load(self._src,delim=";",base=2))
+    def test_incomplete(self):
+        cache = RadarCache(self._tmp / "cache")
+        data = np.zeros((2,2),dtype=int)
+        with self.assertRaises(ValueError, msg="this is supposed to crash: missing rows"):
+            cache.store(self._src,[data],(3,2),delim=";",base=2)
+        self.assertEqual(list(cache.cache_dir.iterdir()),[])
+    def test_eviction(self):
+        data = np.zeros((1000,10),dtype=np.int64)
+        cache = RadarCache(self._tmp / "cache",max_bytes=2*data.nbytes+1000)
+        for base in [2,8,10]:
+            cache.store(self._src,[data],data.shape,delim=";",base=base)
+        self.assertEqual(len(list(cache.cache_dir.glob("*.npy"))),2)
+        self.assertIsNone(cache.load(self._src,delim=";",base=2))
+        self.assertIsNotNone(cache.load(self._src,delim=";",base=10))
@@ -0,0 +1,162 @@
+"""
+This module provides the registry of element implementations: it maps the
+short names of the radar, IFF, firing unit and clock implementations to
+"module:Class" targets, which are only imported when the implementation is
+first used. This way a program only pays for importing the implementations
+that it actually uses.
+
+Implementations from other packages are discovered through entry points, in
+the groups "airdefense.radar", "airdefense.IFF", "airdefense.FiringUnit" and
+"airdefense.clock", e.g. in the pyproject.toml of such a package:
+
+    [project.entry-points."airdefense.radar"]
+    LIDAR = "mypackage.radars:LidarRadar"
+
+The entry points are only scanned when a name is not one of the built-in
+names, or when all names are listed. Built-in names take precedence.
+Implementations can also be registered at run time, with register.
+"""
+
+import importlib
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+
+entry_point_prefix = "airdefense."
+
+class Registry:
+    """
+    Lazy registry of the implementations of one kind of element.
+    """
+    def __init__(self,kind:str,label:str,targets:dict):
+        """
+        Initializes a Registry object.
+
+        Parameters:
+            kind(str): kind of element, also the suffix of the entry point group.
+            label(str): description of the kind of element, for error messages.
+            targets(dict): short names and "module:Class" targets of the built-in implementations.
+        """
+        self._kind = kind
+        self._label = label
+        self._targets = dict(targets)
+        self._loaded = {}
+        self._discovered = False
+    @property
+    def group(self):
+        ' ' 'Name of the entry point group for this kind of element.' ' '
+        return entry_point_prefix+self._kind
+    def register(self,name:str,target):
+        """
+        Registers an implementation under a short name, replacing an existing one.
+
+        Parameters:
+            name(str): short name of the implementation.
+            target: "module:Class" string, or the class itself.
+        """
+        self._targets[name] = target
+        self._loaded.pop(name,None)
+    def names(self):
+        ' ' 'Returns the list of short names of the built-in, registered and discovered implementations.' ' '
+        self._discover()
+        return list(self._targets)
+    def get(self,name:str):
+        ' ' 'Returns the implementation (class) with the given short name, importing it if necessary.' ' '
+        impl = self._loaded.get(name)
+        if impl is None:
+            if name not in self._targets:
+                self._discover()
+            if name not in self._targets:
+                raise RuntimeError(f"Unknown {self._label} implementation '{name}'")
+            impl = self._loaded[name] = _resolve(self._targets[name])
+        return impl
+    # implementation details
+    def _discover(self):
+        if self._discovered:
+            return
+        self._discovered = True
+        from importlib import metadata
+        for entry_point in metadata.entry_points(group=self.group):
+            if entry_point.name in self._targets:
+                logger.debug(f"ignoring entry point {entry_point.value} for the existing {self._label} implementation '{entry_point.name}'")
+                continue
+            self._targets[entry_point.name] = entry_point.value
+
+def _resolve(target):
+    if not isinstance(target,str):
+        return target
+    module_name,_,qualname = target.partition(":")
+    obj = importlib.import_module(module_name)
+    for attr in qualname.split("."):
+        obj = getattr(obj,attr)
+    return obj
+
+_registries = {
+    "radar": Registry("radar","radar element",{
+        "CSV": "airdefense.radar:CsvFileRadar",
+        "PLAY": "airdefense.radar:PlaylistRadar",
+        "NPY": "airdefense.radar:NpyFileRadar",
+        "SHM": "airdefense.radar:SharedMemoryRadar",
+        "SOCK": "airdefense.radar:SocketRadar",
+        "RND": "airdefense.radar:RandomTestRadar"}),
+    "IFF": Registry("IFF","IFF",{
+        "EvenOdd": "airdefense.IFF:EvenOddIffMethod",
+        "FortyTwo": "airdefense.IFF:FortyTwoIffMethod"}),
+    "FiringUnit": Registry("FiringUnit","Firing Unit",{
+        "PK": "airdefense.FiringUnit:PkFiringUnit",
+        "FAIL": "airdefense.FiringUnit:FailingFiringUnit"}),
+    "clock": Registry("clock","clock",{
+        "realtime": "airdefense.clock:RealTimeClock",
+        "virtual": "airdefense.clock:VirtualClock"}),
+}
+
+def get_registry(kind:str):
+    ' ' 'Returns the Registry for a kind of element: "radar", "IFF", "FiringUnit" or "clock".' ' '
+    try:
+        return _registries[kind]
+    except KeyError:
+        raise ValueError(f"unknown kind of element '{kind}', should be one of {list(_registries)}") from None
+
+def get_names(kind:str):
+    ' ' 'Returns the list of short names of the implementations of a kind of element.' ' '
+    return get_registry(kind).names()
+
+def get_implementation(kind:str,name:str):
+    ' ' 'Returns the implementation (class) of a kind of element with the given short name.' ' '
+    return get_registry(kind).get(name)
+
+def register(kind:str,name:str,target):
+    ' ' 'Registers an implementation of a kind of element, see Registry.register.' ' '
+    get_registry(kind).register(name,target)
+
+#######################################################################
+
+class TestRegistry(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the registry.
+    """
+    def test_builtin(self):
+        for kind in _registries:
+            for name in get_names(kind):
+                impl = get_implementation(kind,name)
+                self.assertEqual(impl.short_name,name)
+        with self.assertRaises(RuntimeError):
+            get_implementation("IFF","nonexistent")
+        with self.assertRaises(ValueError):
+            get_names("radio")
+    def test_lazy(self):
+        registry = Registry("test","test",{"A":"airdefense.nonexistent_module:A","B":"collections:OrderedDict"})
+        self.assertIs(registry.get("B"),importlib.import_module("collections").OrderedDict)
+        with self.assertRaises(ModuleNotFoundError):
+            registry.get("A")
+        registry.register("A",dict)
+        self.assertIs(registry.get("A"),dict)
+        self.assertEqual(registry.group,"airdefense.test")
+        self.assertEqual(sorted(registry.names()),["A","B"])
+    def test_pads_startup(self):
+        # the simulation module should load the element implementations only when a simulation is created
+        import subprocess, sys
+        modules = ["airdefense.radar","airdefense.IFF","airdefense.FiringUnit","airdefense.clock","airdefense.pipeline"]
+        code = f"import sys, airdefense.pads; print([m for m in {modules!r} if m in sys.modules])"
+        result = subprocess.run([sys.executable,"-c",code],capture_output=True,text=True,check=True)
+        self.assertEqual(result.stdout.strip(),"[]")
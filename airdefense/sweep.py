@@ -0,0 +1,267 @@
+"""
+This module implements a parameter sweep runner for the air defense
+simulation: one scenario is evaluated for every combination of values in a
+grid of config parameters, e.g. different Pk values, IFF methods and radar
+recordings. A sweep config file has a "base" config (the file name of a single
+battery config file, or the config itself), a "grid" that maps dotted config
+keys to lists of values, and an optional number of "replicas" per grid point:
+
+    {
+        "base": "default.json",
+        "grid": {
+            "FiringUnit.options.Pk": [0.4, 0.8],
+            "IFF.name": ["EvenOdd", "FortyTwo"]
+        },
+        "replicas": 10
+    }
+
+The grid points are simulated with the virtual clock, on a pool of worker
+processes. Every radar source in the grid is decoded only once, in the
+calling process, and published to the workers in shared memory (see
+radar.SharedMemoryRadar). A packed radar is published as packed parity bits,
+so the grid points on it need an IFF method that can evaluate packed data, as
+in a single simulation. Radar elements that take a seed (i.e. generate their
+data) are created by the workers themselves. The replicas of all grid points
+use the same seeds (common random numbers), so that the differences between
+grid points are not obscured by differences between random streams.
+"""
+
+import numpy as np
+import copy
+import csv
+import inspect
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import tempfile
+import unittest
+from airdefense import pads, radar, clock, multibattery, montecarlo
+import logging
+logger=logging.getLogger(__name__)
+
+def point_config(base:dict,keys:list,values:list):
+    """
+    Returns a copy of a config, with the values set for the dotted keys
+    (e.g. "FiringUnit.options.Pk"). Missing intermediate sections are created.
+    """
+    config=copy.deepcopy(base)
+    for key,value in zip(keys,values):
+        *path,last=key.split(".")
+        section=config
+        for name in path:
+            section=section.setdefault(name,{})
+        section[last]=copy.deepcopy(value)
+    return config
+
+def publish_radars(configs:list):
+    """
+    Decodes every distinct radar configuration of a list of configs that yields
+    a finite amount of data and does not take a seed, and publishes its data in
+    shared memory.
+
+    Returns:
+        dict with the radar key (see multibattery.radar_key) and a tuple with the
+        SharedMemory object and the radar config of a SharedMemoryRadar for every
+        published radar. The caller should close and unlink the shared memory.
+    """
+    published={}
+    try:
+        for config in configs:
+            key=multibattery.radar_key(config)
+            if key in published:
+                continue
+            name=config["radar"]["name"]
+            if "seed" in inspect.signature(radar.get_implementation(name)).parameters:
+                continue
+            element=radar.get_element(name=name,options=config["radar"].get("options",dict()))
+            if element.nrows==0:
+                continue
+            packed=getattr(element,"packed",False)
+            block_list=list(element.packed_blocks(element.nrows) if packed else radar.blocks(element,element.nrows))
+            data=block_list[0] if len(block_list)==1 else np.concatenate(block_list)
+            shm,options=radar.SharedMemoryRadar.publish(data,element.ncols if packed else None)
+            published[key]=(shm,dict(name=radar.SharedMemoryRadar.short_name,options=options))
+            logger.info(f"published {data.nbytes} bytes of radar data for {key} in shared memory")
+    except BaseException:
+        release(published)
+        raise
+    return published
+
+def release(published:dict):
+    ' ' 'Closes and unlinks the shared memory of radars published with publish_radars.' ' '
+    for shm,_ in published.values():
+        shm.close()
+        shm.unlink()
+
+def run_point(config:dict,seeds:list,time_step_seconds:float=pads.simulation.default_step):
+    """
+    Simulates one grid point with the virtual clock, once for every seed.
+
+    Returns:
+        RunSummary with the totals of all replicas.
+    """
+    radar_element=None
+    if config["radar"]["name"]==radar.SharedMemoryRadar.short_name:
+        radar_element=radar.SharedMemoryRadar(**config["radar"]["options"])
+    try:
+        summaries=[pads.simulation(config=config,time_step_seconds=time_step_seconds,clock_name=clock.VirtualClock.short_name,
+                                   seed=seed,radar_element=radar_element,sinks=[]).run() for seed in seeds]
+    finally:
+        if radar_element is not None:
+            radar_element.close()
+    return pads.RunSummary(*(sum(values) for values in zip(*summaries)))
+
+class SweepResult:
+    """
+    Results of a parameter sweep: the grid values and the totals of the
+    replicas of every grid point, as a table.
+    """
+    def __init__(self,keys:list,points:list,summaries:list,nreplicas:int=1):
+        """
+        Initializes a SweepResult object.
+
+        Parameters:
+            keys(list): dotted config keys of the grid.
+            points(list): grid values of every grid point.
+            summaries(list): RunSummary with the totals of the replicas of every grid point.
+            nreplicas(int): number of replicas per grid point.
+        """
+        self._keys = list(keys)
+        self._points = list(points)
+        self._summaries = list(summaries)
+        self._nreplicas = nreplicas
+    @property
+    def keys(self):
+        ' ' 'Dotted config keys of the grid.' ' '
+        return self._keys
+    @property
+    def points(self):
+        ' ' 'List with the grid values of every grid point.' ' '
+        return self._points
+    @property
+    def summaries(self):
+        ' ' 'List with a RunSummary with the totals of the replicas of every grid point.' ' '
+        return self._summaries
+    def columns(self):
+        ' ' 'Returns the column names of the results table.' ' '
+        return self._keys+list(pads.RunSummary._fields)+["hit_rate","hit_rate_low","hit_rate_high"]
+    def rows(self):
+        ' ' 'Returns the rows of the results table, one per grid point.' ' '
+        rows=[]
+        for values,summary in zip(self._points,self._summaries):
+            nshots=summary.hits+summary.misses
+            low,high=montecarlo.wilson_interval(summary.hits,nshots)
+            rows.append([value if isinstance(value,(int,float,str)) else json.dumps(value) for value in values]+
+                        list(summary)+[summary.hits/nshots if nshots>0 else float("nan"),low,high])
+        return rows
+    def write_csv(self,path):
+        ' ' 'Writes the results table to a CSV file.' ' '
+        with open(path,"w",newline="") as fp:
+            writer=csv.writer(fp)
+            writer.writerow(self.columns())
+            writer.writerows(self.rows())
+    def report(self):
+        ' ' 'Returns a multi line text report with the results table.' ' '
+        rows=[[f"{value:.4f}" if isinstance(value,float) else str(value) for value in row] for row in self.rows()]
+        columns=self.columns()
+        widths=[max([len(column)]+[len(row[i]) for row in rows]) for i,column in enumerate(columns)]
+        lines=[f"{len(self._points)} grid points, {self._nreplicas} replica(s) per point",
+               " ".join(f"{column:>{width}s}" for column,width in zip(columns,widths))]
+        lines.extend(" ".join(f"{value:>{width}s}" for value,width in zip(row,widths)) for row in rows)
+        return "\n".join(lines)
+
+def run_sweep(base,grid:dict,nreplicas:int=1,seed=None,nworkers:int=None,time_step_seconds:float=pads.simulation.default_step):
+    """
+    Simulates every grid point of a parameter sweep.
+
+    Parameters:
+        base: base config, as a dict or as the file name of a config file (in the config folder).
+        grid(dict): dotted config keys with a list of values for each.
+        nreplicas(int): number of replicas per grid point.
+        seed: seed from which the seeds of the replicas are spawned (None=unpredictable)
+        nworkers(int): number of worker processes (None=number of CPUs, 0=run in this process)
+        time_step_seconds(float): simulated time step [seconds]
+
+    Returns:
+        SweepResult
+    """
+    if isinstance(base,str):
+        base=pads.read_config(base)
+    keys=list(grid)
+    points=list(itertools.product(*(grid[key] for key in keys)))
+    configs=[point_config(base,keys,values) for values in points]
+    seeds=np.random.SeedSequence(seed).spawn(nreplicas)
+    published=publish_radars(configs)
+    try:
+        configs=[dict(config,radar=published[key][1]) if (key:=multibattery.radar_key(config)) in published else config
+                 for config in configs]
+        logger.info(f"simulating {len(configs)} grid points with {nreplicas} replica(s) each")
+        if nworkers==0:
+            summaries=[run_point(config,seeds,time_step_seconds) for config in configs]
+        else:
+            nworkers=nworkers or os.cpu_count() or 1
+            n=len(configs)
+            with ProcessPoolExecutor(max_workers=nworkers) as pool:
+                summaries=list(pool.map(run_point,configs,[seeds]*n,[time_step_seconds]*n))
+    finally:
+        release(published)
+    return SweepResult(keys,points,summaries,nreplicas)
+
+#######################################################################
+
+class TestSweep(unittest.TestCase):
+    """
+    Some basic, non exhaustive unit tests for the parameter sweep runner.
+    """
+    def setUp(self):
+        logging.disable(logging.INFO)
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+    def test_point_config(self):
+        base = pads.read_config("default.json")
+        config = point_config(base,["FiringUnit.options.Pk","IFF.name","radar.options.chunk_bytes"],[0.1,"FortyTwo",100])
+        self.assertEqual(config["FiringUnit"]["options"]["Pk"],0.1)
+        self.assertEqual(config["IFF"]["name"],"FortyTwo")
+        self.assertEqual(config["radar"]["options"],dict(filename="radar_data.csv",chunk_bytes=100))
+        self.assertEqual(base,pads.read_config("default.json"))
+    def test_run(self):
+        grid = {"FiringUnit.options.Pk":[0.1,0.9],"IFF.name":["EvenOdd","FortyTwo"]}
+        serial = run_sweep("hex_low_pk.json",grid,nreplicas=3,seed=5,nworkers=0)
+        parallel = run_sweep("hex_low_pk.json",grid,nreplicas=3,seed=5,nworkers=2)
+        self.assertEqual(serial.summaries,parallel.summaries)
+        self.assertEqual(len(serial.rows()),4)
+        seeds = np.random.SeedSequence(5).spawn(3)
+        config = point_config(pads.read_config("hex_low_pk.json"),list(grid),[0.9,"EvenOdd"])
+        hits = sum(pads.simulation(config=config,clock_name="virtual",seed=seed,sinks=[]).run().hits for seed in seeds)
+        self.assertEqual(serial.summaries[2].hits,hits)
+        self.assertLess(serial.summaries[0].hits,serial.summaries[2].hits)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "sweep.csv"
+            serial.write_csv(path)
+            with open(path) as fp:
+                rows = list(csv.DictReader(fp))
+            self.assertEqual(len(rows),4)
+            self.assertEqual(rows[3]["IFF.name"],"FortyTwo")
+            self.assertEqual(int(rows[3]["sweeps"]),serial.summaries[3].sweeps)
+        self.assertIn("hit_rate",serial.report())
+    def test_packed_radar(self):
+        config = pads.read_config("hex_low_pk.json")
+        packed = dict(config,radar=dict(config["radar"],options=dict(config["radar"]["options"],packed=True)))
+        grid = {"FiringUnit.options.Pk":[0.3,0.8]}
+        result = run_sweep(packed,grid,nreplicas=2,seed=3,nworkers=0)
+        self.assertEqual(result.summaries,run_sweep(config,grid,nreplicas=2,seed=3,nworkers=0).summaries)
+        with self.assertRaises(RuntimeError):
+            run_sweep(packed,{"IFF.name":["FortyTwo"]},nworkers=0)
+        published = publish_radars([packed])
+        try:
+            (_,radar_config), = published.values()
+            self.assertTrue(radar_config["options"]["packed"])
+        finally:
+            release(published)
+    def test_random_radar(self):
+        config = pads.read_config("rnd_42_fail.json")
+        self.assertEqual(publish_radars([config]),{})
+        result = run_sweep(config,{"radar.options.ncols":[5,50]},nreplicas=2,seed=1,nworkers=0)
+        self.assertEqual([summary.sweeps for summary in result.summaries],[2*config["radar"]["options"]["nrows"]]*2)
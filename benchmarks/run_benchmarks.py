@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import logging
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0,str(repo_dir))
+from airdefense import radar, IFF, FiringUnit, pads
+
+baseline_path = Path(__file__).parent / "baseline.json"
+import_budget_ms = 250.
+min_seconds = 0.2
+
+def best_rate(func,nitems:int,repeat:int):
+    """
+    Runs func repeat times and returns the best throughput, in items per second.
+    Every repetition calls func as often as needed to take at least min_seconds,
+    so that short benchmarks are not dominated by timer resolution and
+    scheduling noise.
+    """
+    best=0.
+    for _ in range(repeat):
+        ncalls=0
+        start=time.perf_counter()
+        while True:
+            func()
+            ncalls+=1
+            elapsed=time.perf_counter()-start
+            if elapsed>=min_seconds:
+                break
+        best=max(best,ncalls*nitems/elapsed)
+    return best
+
+def measure(results:dict,name:str,func,nitems:int,repeat:int,name_filter:str):
+    ' ' 'Stores the best throughput of func as results[name], if name contains name_filter.' ' '
+    if name_filter in name:
+        results[name]=best_rate(func,nitems,repeat)
+
+def bench_csv_load(repeat:int,name_filter:str=""):
+    ' ' 'CsvFileRadar load time versus file size and base, as radar lines per second.' ' '
+    results={}
+    rng=np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for nrows in [1000,10000]:
+            data=rng.integers(0,1024,size=(nrows,360))
+            for base,fmt in [(2,"%s"),(16,"%x")]:
+                name=f"csv_load/rows={nrows}/base={base}"
+                if name_filter not in name:
+                    # do not write files that are not loaded
+                    continue
+                path=Path(tmpdir)/f"bench_{nrows}_{base}.csv"
+                if base==2:
+                    np.savetxt(path,np.vectorize(lambda v: format(v,"b"))(data),fmt=fmt,delimiter=";")
+                else:
+                    np.savetxt(path,data,fmt=fmt,delimiter=";")
+                load=lambda: radar.CsvFileRadar(filename=str(path),delim=";",base=base)
+                measure(results,name,load,nrows,repeat,name_filter)
+    return results
+
+def bench_iff(repeat:int,name_filter:str=""):
+    ' ' 'Per line, batched, windowed, packed (where supported) and very wide (column parallel) IFF throughput for every implementation, as radar lines per second.' ' '
+    results={}
+    rng=np.random.default_rng(42)
+    for name in IFF.get_names():
+        iff=IFF.get_element(name)
+        for ncols in [11,360,4096]:
+            block=rng.integers(0,100,size=(max(100,400000//ncols),ncols))
+            nlines=min(len(block),2000)
+            measure(results,f"iff_line/{name}/ncols={ncols}",lambda: [iff.evaluate(line) for line in block[:nlines]],nlines,repeat,name_filter)
+            measure(results,f"iff_batch/{name}/ncols={ncols}",lambda: iff.evaluate_batch(block),len(block),repeat,name_filter)
+            windowed=IFF.get_element(name,dict(window=min(ncols,64),stride=min(ncols,16)))
+            measure(results,f"iff_sectors/{name}/ncols={ncols}",lambda: windowed.evaluate_sectors_batch(block),len(block),repeat,name_filter)
+            if hasattr(iff,"evaluate_packed_batch"):
+                packed=radar.pack_parity(block)
+                measure(results,f"iff_packed/{name}/ncols={ncols}",lambda: iff.evaluate_packed_batch(packed,ncols),len(block),repeat,name_filter)
+        wide=rng.integers(0,100,size=(8,1000000)).astype(np.uint16)
+        for nthreads in [1,4]:
+            parallel=IFF.get_element(name,dict(nthreads=nthreads))
+            measure(results,f"iff_wide/{name}/nthreads={nthreads}",lambda: [parallel.evaluate(line) for line in wide],len(wide),repeat,name_filter)
+    return results
+
+def bench_firing(repeat:int,name_filter:str=""):
+    ' ' 'PkFiringUnit fire and fire_batch rates, as shots per second.' ' '
+    fu=FiringUnit.PkFiringUnit(Pk=0.8,seed=42)
+    nshots=100000
+    results={}
+    measure(results,"firing/fire",lambda: [fu.fire() for _ in range(nshots)],nshots,repeat,name_filter)
+    measure(results,"firing/fire_batch",lambda: fu.fire_batch(100*nshots),100*nshots,repeat,name_filter)
+    return results
+
+def bench_assignment(repeat:int,name_filter:str=""):
+    ' ' 'Greedy weapon-target assignment of hundreds of contacts to dozens of units, as contacts per second.' ' '
+    from airdefense import assignment
+    results={}
+    rng=np.random.default_rng(42)
+    for nunits,ncontacts in [(12,100),(48,500)]:
+        pk=rng.random((nunits,ncontacts))
+        capacity=rng.integers(1,3,nunits)
+        # a single assignment takes a fraction of a millisecond: best_rate repeats it for min_seconds
+        measure(results,f"assignment/units={nunits}/contacts={ncontacts}",
+                lambda: assignment.greedy_assignment(pk,capacity,max_shots_per_target=2),ncontacts,repeat,name_filter)
+    return results
+
+def bench_end_to_end(repeat:int,name_filter:str=""):
+    ' ' 'End to end simulation with a random radar, without pacing, as sweeps per second.' ' '
+    results={}
+    for ncols in [11,360]:
+        nrows=20000
+        config={"radar":{"name":"RND","options":{"nrows":nrows,"ncols":ncols,"low":0,"high":1024}},
+                "IFF":{"name":"EvenOdd"},"FiringUnit":{"name":"PK","options":{"Pk":0.8}}}
+        def run():
+            pads.simulation(config=config,clock_name="virtual",seed=42,sinks=[]).run()
+        measure(results,f"end_to_end/RND/ncols={ncols}",run,nrows,repeat,name_filter)
+    return results
+
+def import_time_us(module:str):
+    """
+    Returns the cumulative import time of a module in a fresh interpreter
+    [microseconds], as reported by python -X importtime.
+    """
+    result=subprocess.run([sys.executable,"-X","importtime","-c",f"import {module}"],cwd=repo_dir,capture_output=True,text=True,check=True)
+    for line in reversed(result.stderr.splitlines()):
+        fields=line.split("|")
+        if len(fields)==3 and fields[2].strip()==module:
+            return int(fields[1])
+    raise RuntimeError(f"no import time reported for module {module}")
+
+def bench_startup(repeat:int,name_filter:str=""):
+    ' ' 'Import time of the command line script in a fresh interpreter, as imports per second.' ' '
+    name="startup/import_pads_simulation"
+    if name_filter not in name:
+        return {}
+    return {name:1e6/min(import_time_us("pads_simulation") for _ in range(repeat))}
+
+benchmarks = [bench_csv_load,bench_iff,bench_firing,bench_assignment,bench_end_to_end,bench_startup]
+
+def get_args():
+
+    description="""
+    This script runs the performance benchmarks of the air defense simulation and
+    compares the results (throughputs, higher is better) with the stored baseline.
+    The exit code is nonzero if any result is worse than the baseline by more than
+    the threshold. Baselines are machine dependent: after a hardware change (or an
+    intentional performance change), update them with the --update option.
+    """
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-k','--filter',default="",help="Only run benchmarks whose result name (e.g. 'iff_batch/EvenOdd') contains this string.")
+    parser.add_argument('-r','--repeat',type=int,default=3,help="Number of repetitions per benchmark (the best one counts).")
+    parser.add_argument('-t','--threshold',type=float,default=0.4,help="Maximum allowed relative slowdown with respect to the baseline (the per line IFF benchmarks, which are interpreter bound, vary by up to about 35%% between runs on a busy machine).")
+    parser.add_argument('-b','--baseline',default=str(baseline_path),help="Baseline json file.")
+    parser.add_argument('--import_budget',type=float,default=import_budget_ms,help="Maximum allowed import time of the command line script [milliseconds].")
+    parser.add_argument('-u','--update',default=False,action='store_true',help="Store the results as the new baseline.")
+    args=parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = get_args()
+    logging.basicConfig(level=logging.WARNING)
+    baseline = json.loads(Path(args.baseline).read_text()) if Path(args.baseline).exists() else {}
+    results = {}
+    for bench in benchmarks:
+        results.update(bench(args.repeat,args.filter))
+    if not results:
+        print(f"no benchmark results match '{args.filter}'")
+        sys.exit(2)
+    nregressions = 0
+    print(f"{'benchmark':40s} {'items/s':>14s} {'baseline':>14s} {'ratio':>7s}")
+    for name,rate in results.items():
+        reference = baseline.get(name)
+        ratio = rate/reference if reference else float("nan")
+        regression = reference is not None and ratio<1-args.threshold
+        nregressions += regression
+        print(f"{name:40s} {rate:14.1f} {reference or float('nan'):14.1f} {ratio:7.2f}{'  REGRESSION' if regression else ''}")
+    startup = results.get("startup/import_pads_simulation")
+    if startup is not None:
+        import_ms = 1000/startup
+        over_budget = import_ms>args.import_budget
+        nregressions += over_budget
+        print(f"import time of pads_simulation: {import_ms:.1f} ms (budget {args.import_budget:g} ms){'  OVER BUDGET' if over_budget else ''}")
+    if args.update:
+        baseline.update(results)
+        Path(args.baseline).write_text(json.dumps(baseline,indent=4,sort_keys=True)+"\n")
+        print(f"updated baseline {args.baseline}")
+    elif nregressions>0:
+        print(f"{nregressions} benchmark(s) regressed by more than {100*args.threshold:g}%")
+        sys.exit(1)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import argparse
-from airdefense import radar, IFF, FiringUnit, pads
+# only the modules that are needed for the command line are imported here, the
+# others are imported when they are used, to keep the startup time short
+from airdefense import pads
 import logging
 #logger=logging.getLogger(__name__)
 
@@ -23,8 +25,25 @@ def get_args():
 
     parser.add_argument('-c','--config',default="default.json",help="Config filename for the simulation (it should be found in the config folder; specify only the filename *without* directory path).")
     parser.add_argument('-S','--time_step_seconds',type=float,default=1.0,help="Scanning time step [seconds].")
+    parser.add_argument('-B','--block_size',type=int,default=64,help="Number of radar sweeps that are evaluated together by the IFF.")
+    parser.add_argument('--clock',default=pads.simulation.default_clock,help="Pacing of the radar sweeps: 'realtime' paces them to the wall clock, 'virtual' runs the simulation as fast as possible (or the short name of a clock implementation from another package).")
+    parser.add_argument('--pipeline',default=None,help="Run the radar, IFF and firing unit as pipeline stages, with this backpressure policy for the queues between them ('block', 'drop_oldest' or 'coalesce').")
+    parser.add_argument('--queue_size',type=int,default=16,help="Maximum number of queued batches between pipeline stages.")
+    parser.add_argument('--seed',type=int,default=None,help="Seed for the random number generators (default: unpredictable).")
+    parser.add_argument('-N','--replicas',type=int,default=0,help="Run a Monte Carlo estimate with this many replicas of the scenario (with the virtual clock) instead of a single simulation. For parameter sweep config files: the number of replicas per grid point.")
+    parser.add_argument('-j','--workers',type=int,default=None,help="Number of worker processes for Monte Carlo replicas, multi battery simulations or parameter sweeps (default: number of CPUs).")
+    parser.add_argument('--events',default=None,help="Write the simulation events to this file: compact binary records if the file name ends with '.bin', JSON lines otherwise.")
+    parser.add_argument('--no_console',default=False,action='store_true',help="Do not log the simulation events to the console.")
+    parser.add_argument('--archive',default=None,help="Write the outcome of every radar sweep to a columnar archive in this directory (see airdefense/archive.py); an existing archive in the directory is overwritten. For single battery and multi battery simulations.")
+    parser.add_argument('--timeline',default=None,help="For multi battery config files: write the merged timeline of all batteries to this CSV file.")
+    parser.add_argument('--table',default=None,help="For parameter sweep config files: write the results table (one row per grid point) to this CSV file.")
+    parser.add_argument('--profile',default=False,action='store_true',help="Measure the latency of every stage of the simulation and print percentiles per stage at the end.")
     parser.add_argument('-v','--verbose',default=False,action='store_true',help="More output.")
     args=parser.parse_args()
+    if args.pipeline is not None:
+        from airdefense import pipeline
+        if args.pipeline not in pipeline.policies:
+            parser.error(f"argument --pipeline: invalid choice: '{args.pipeline}' (choose from {', '.join(pipeline.policies)})")
     return args
 
 if __name__ == '__main__':
@@ -33,5 +52,57 @@ if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s,%(msecs)03d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
                         datefmt='%Y-%m-%d:%H:%M:%S',
                         level=log_level)
-    simulation = pads.simulation(args.config, args.time_step_seconds)
-    simulation.run()
+    config = pads.read_config(args.config)
+    if "batteries" in config:
+        from airdefense import IFF, multibattery
+        if not args.verbose:
+            logging.getLogger("airdefense").setLevel(logging.WARNING)
+        batteries = multibattery.expand_batteries(config["batteries"])
+        result = multibattery.run_batteries(batteries, args.workers, args.seed, args.time_step_seconds, args.block_size)
+        print(result.report())
+        if args.archive:
+            from airdefense import archive
+            with archive.ArchiveWriter(args.archive, names=result.names, metadata=config) as writer:
+                writer.append(result.timeline)
+        if args.timeline:
+            timeline = result.timeline
+            with open(args.timeline,"w") as fp:
+                fp.write("battery,sweep,sim_time,verdict,fired,hit,shots,hits\n")
+                for record in timeline:
+                    fp.write(f"{result.names[record['battery']]},{record['sweep']},{record['sim_time']},"
+                             f"{IFF.IFFVerdict(record['verdict']).name},{int(record['fired'])},{int(record['hit'])},"
+                             f"{record['shots']},{record['hits']}\n")
+    elif "grid" in config:
+        from airdefense import sweep
+        if not args.verbose:
+            logging.getLogger("airdefense").setLevel(logging.WARNING)
+        nreplicas = args.replicas if args.replicas>0 else config.get("replicas",1)
+        result = sweep.run_sweep(config["base"], config["grid"], nreplicas, args.seed, args.workers, args.time_step_seconds)
+        print(result.report())
+        if args.table:
+            result.write_csv(args.table)
+    elif args.replicas>0:
+        from airdefense import montecarlo
+        if not args.verbose:
+            logging.getLogger("airdefense").setLevel(logging.WARNING)
+        result = montecarlo.monte_carlo(args.config, args.replicas, args.seed, args.workers)
+        print(result.report())
+    else:
+        from airdefense import events
+        sinks = [] if args.no_console else [events.LoggingSink()]
+        if args.events:
+            sinks.append(events.open_sink(args.events))
+        if args.archive:
+            from airdefense import archive
+            sinks.append(archive.ArchiveSink(args.archive, metadata=config))
+        simulation = pads.simulation(args.config, args.time_step_seconds, args.block_size, args.clock, args.seed, sinks=sinks, profile=args.profile)
+        try:
+            if args.pipeline:
+                simulation.run_pipelined(queue_size=args.queue_size, policy=args.pipeline, max_batch=args.block_size)
+            else:
+                simulation.run()
+        finally:
+            for sink in sinks:
+                sink.close()
+        if args.profile:
+            print(simulation.stats.report())